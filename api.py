@@ -0,0 +1,300 @@
+"""
+Headless HTTP / WebSocket chat API, alongside the Streamlit UI.
+
+Same Firestore data and the same ChatEngine as app.py, but without a
+Streamlit rerun per request. Request handlers read and write through the
+async data layer (firebase_db_async.py); the engine keeps the sync one in
+its worker threads. Run with:
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Auth is HTTP Basic with the app's username/password.
+
+    GET  /health
+    GET  /stats                        -> scheduler queue wait and token usage
+    GET  /bots                         -> bot list (with IDs)
+    GET  /history/{bot}?offset=&limit= -> one page of history (oldest first)
+    GET  /export/{bot}?format=&gzip=   -> whole history as txt / json / jsonl, streamed
+    POST /chat/{bot}   {"message"}     -> reply streamed as Server-Sent Events
+    WS   /ws/chat/{bot}                -> send {"message"}, receive deltas
+                                          (closed with 4401 / 4404 for bad auth / an unknown bot)
+
+`{bot}` is the bot ID from /bots. Chat messages may also carry retrieval
+filters for bots with a message store: "recent_days", "since", "until"
+(epoch seconds).
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import firebase_db
+import firebase_db_async
+from chat_engine import ChatEngine, Retriever, now_ts
+from chat_export import FORMATS, export_filename, export_mime, iter_export
+from gemini_client import client_from_settings
+from index_server import RemoteRetriever
+from model_router import ModelRouter
+from scheduler import GenerationScheduler, TokenMeter
+
+AUTH_TTL_S = 300
+MAX_PAGE = 200
+FILTER_FIELDS = ("recent_days", "since", "until")
+
+engine = ChatEngine(
+    llm=client_from_settings(os.getenv),
+    store=firebase_db,
+    retriever=RemoteRetriever(os.environ["INDEX_SOCKET"], fallback=Retriever) if os.getenv("INDEX_SOCKET") else Retriever(),
+    router=ModelRouter(os.getenv("MODEL_ROUTES") or None),
+    scheduler=GenerationScheduler(
+        concurrency=int(os.getenv("GEN_CONCURRENCY", 4)),
+        meter=TokenMeter(firebase_db, default_budget=int(os.getenv("TOKEN_BUDGET_DAILY", 0))),
+    ),
+)
+
+_auth_cache = {}    # (username, password sha256) -> expiry (monotonic)
+_chat_locks = {}    # (user, bot) -> [asyncio.Lock, requests holding or waiting for it]
+
+
+# ---------------------------
+# Auth
+# ---------------------------
+def _credentials(headers):
+    header = headers.get("authorization", "")
+    if not header.lower().startswith("basic "):
+        return None, None
+    try:
+        username, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None, None
+    return username, password
+
+
+async def authenticate(headers):
+    """
+    Returns the username, or None. Successful logins are cached for
+    AUTH_TTL_S so bcrypt and the Firestore read aren't paid per request.
+    """
+    username, password = _credentials(headers)
+    if not username or not password:
+        return None
+    key = (username, hashlib.sha256(password.encode()).hexdigest())
+    now = time.monotonic()
+    expires = _auth_cache.get(key)
+    if expires and expires > now:
+        return username
+    if await firebase_db_async.login_user(username, password):
+        # a login per user per AUTH_TTL_S: cheap enough to sweep out expired entries here
+        for old in [k for k, t in _auth_cache.items() if t <= now]:
+            del _auth_cache[old]
+        _auth_cache[key] = now + AUTH_TTL_S
+        return username
+    return None
+
+
+def unauthorized():
+    return JSONResponse({"error": "unauthorized"}, status_code=401,
+                        headers={"WWW-Authenticate": 'Basic realm="chatbuilder"'})
+
+
+def retrieval_filters(data: dict):
+    """
+    The retrieval filters of a chat message, or None. Raises ValueError if
+    one is not a finite number or recent_days is negative.
+    """
+    filters = {}
+    for name in FILTER_FIELDS:
+        if data.get(name) is not None:
+            try:
+                filters[name] = int(data[name])
+            except (TypeError, ValueError, OverflowError):
+                # json.loads accepts Infinity and NaN
+                raise ValueError(f"{name} must be an integer") from None
+    if filters.get("recent_days", 0) < 0:
+        raise ValueError("recent_days must not be negative")
+    return filters or None
+
+
+@asynccontextmanager
+async def chat_lock(user: str, bot: str):
+    """
+    One in-flight reply per (user, bot) per worker, so history appends
+    don't interleave. The lock is dropped once nobody holds or waits for it.
+    """
+    key = (user, bot.lower())
+    entry = _chat_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _chat_locks[key]
+
+
+# ---------------------------
+# HTTP endpoints
+# ---------------------------
+async def health(request):
+    return JSONResponse({"ok": True})
+
+
+async def stats(request):
+    user = await authenticate(request.headers)
+    if not user:
+        return unauthorized()
+    scheduler_stats = engine.scheduler.stats()
+    scheduler_stats.get("tokens", {}).pop("top_users_today", None)   # other users' names stay private
+    used = await asyncio.to_thread(engine.scheduler.meter.used, user)
+    return JSONResponse({"scheduler": scheduler_stats, "tokens_today": used,
+                         "budget": engine.scheduler.meter.budget(user)})
+
+
+async def list_bots(request):
+    user = await authenticate(request.headers)
+    if not user:
+        return unauthorized()
+    bots = await firebase_db_async.get_user_bots(user)
+    return JSONResponse({"bots": bots})
+
+
+async def history(request):
+    user = await authenticate(request.headers)
+    if not user:
+        return unauthorized()
+    bot = request.path_params["bot"]
+    try:
+        offset = max(0, int(request.query_params.get("offset", 0)))
+        limit = min(MAX_PAGE, max(1, int(request.query_params.get("limit", 50))))
+    except ValueError:
+        return JSONResponse({"error": "offset and limit must be integers"}, status_code=400)
+    page, total = await firebase_db_async.load_chat_history_page(user, bot, offset, limit)
+    next_offset = offset + len(page) if offset + len(page) < total else None
+    return JSONResponse({"items": page, "total": total, "next_offset": next_offset})
+
+
+async def export(request):
+    user = await authenticate(request.headers)
+    if not user:
+        return unauthorized()
+    bot = request.path_params["bot"]
+    fmt = request.query_params.get("format", "jsonl")
+    if fmt not in FORMATS:
+        return JSONResponse({"error": f"format must be one of {', '.join(FORMATS)}"}, status_code=400)
+    compress = request.query_params.get("gzip", "").lower() in ("1", "true", "yes")
+    bot_data = await firebase_db_async.get_bot(user, bot)
+    if bot_data is None:
+        return JSONResponse({"error": "unknown bot"}, status_code=404)
+    # sync generator: Starlette iterates it in the threadpool, one history page at a time
+    chunks = iter_export(firebase_db.iter_chat_history(user, bot, stream_pages=False),
+                         fmt, bot_data["name"], compress)
+    filename = export_filename(bot_data["name"], fmt, compress)
+    return StreamingResponse(chunks, media_type=export_mime(fmt, compress),
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+async def _start_turn(user: str, bot: str, message: str) -> list:
+    history = await firebase_db_async.load_chat_history_cloud(user, bot)
+    history.append({"user": message, "bot": "", "ts": now_ts()})
+    await firebase_db_async.save_chat_history_cloud(user, bot, history)
+    return history
+
+
+async def chat(request):
+    user = await authenticate(request.headers)
+    if not user:
+        return unauthorized()
+    bot = request.path_params["bot"]
+    try:
+        data = await request.json()
+        message = str(data.get("message", "")).strip()
+    except (ValueError, TypeError, AttributeError):
+        return JSONResponse({"error": "body must be a JSON object with a message"}, status_code=400)
+    try:
+        filters = retrieval_filters(data)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if not message:
+        return JSONResponse({"error": "message is required"}, status_code=400)
+    bot_data = await firebase_db_async.get_bot(user, bot)
+    if bot_data is None:
+        return JSONResponse({"error": "unknown bot"}, status_code=404)
+
+    async def events():
+        async with chat_lock(user, bot):
+            turn_history = await _start_turn(user, bot, message)
+            async for chunk in engine.astream(user, bot, turn_history, bot_data, filters):
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+            done = {"reply": turn_history[-1]["bot"], "ts": turn_history[-1]["ts"]}
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ---------------------------
+# WebSocket endpoint
+# ---------------------------
+async def ws_chat(websocket: WebSocket):
+    user = await authenticate(websocket.headers)
+    if not user:
+        await websocket.close(code=4401)
+        return
+    bot = websocket.path_params["bot"]
+    if await firebase_db_async.get_bot(user, bot) is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await websocket.send_json({"error": "messages must be JSON objects"})
+                continue
+            message = str(data.get("message", "")).strip()
+            if not message:
+                await websocket.send_json({"error": "message is required"})
+                continue
+            try:
+                filters = retrieval_filters(data)
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            # read per message: the bot may have been edited or deleted meanwhile
+            bot_data = await firebase_db_async.get_bot(user, bot)
+            if bot_data is None:
+                await websocket.send_json({"error": "unknown bot"})
+                await websocket.close(code=4404)
+                return
+            async with chat_lock(user, bot):
+                turn_history = await _start_turn(user, bot, message)
+                async for chunk in engine.astream(user, bot, turn_history, bot_data, filters):
+                    await websocket.send_json({"delta": chunk})
+                await websocket.send_json({"done": True, "reply": turn_history[-1]["bot"],
+                                           "ts": turn_history[-1]["ts"]})
+    except WebSocketDisconnect:
+        return
+
+
+app = Starlette(routes=[
+    Route("/health", health),
+    Route("/stats", stats),
+    Route("/bots", list_bots),
+    Route("/history/{bot}", history),
+    Route("/export/{bot}", export),
+    Route("/chat/{bot}", chat, methods=["POST"]),
+    WebSocketRoute("/ws/chat/{bot}", ws_chat),
+])
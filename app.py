@@ -1,34 +1,157 @@
 # app.py — complete copy-paste replacement
+import io
 import os
 import json
 import base64
-from datetime import datetime
+import tempfile
+from contextlib import nullcontext
 
 import streamlit as st
-from sentence_transformers import SentenceTransformer
-import faiss
-
-# Use the same import shape you used earlier:
-import google.genai as genai
-
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import firebase_db
+from chat_engine import ChatEngine, Retriever, now_ts
+from bot_bundle import export_bot, import_bot
+from bulk_import import import_zip
+from chat_memory import MemoryCache
+from chat_export import FORMATS, export_filename, export_mime, iter_export
+from index_server import RemoteRetriever
+from gemini_client import GeminiError, client_from_settings
+from message_store import MessageStore
+from model_router import ModelRouter
+from prewarm import Prewarmer, by_recent_use, forget_bot, schedule_login, schedule_user, warm_index
+from rerun_profiler import RerunLog
+from scheduler import GenerationScheduler, TokenMeter
+from style_profile import build_profile, describe_profile
 
 # firebase_db functions you already have in project:
 from firebase_db import (
     get_user_bots, add_bot, delete_bot, update_bot, update_bot_persona,
-    register_user, login_user, get_bot_file,
-    save_chat_history_cloud, load_chat_history_cloud
+    update_bot_style_profile, touch_bot, register_user, login_user, get_bot,
+    save_chat_history_cloud, load_chat_history_cloud, iter_chat_history
 )
 
 # ---------------------------
 # Page config + Gemini client
 # ---------------------------
 st.set_page_config(page_title="Chat Builder", page_icon="🤖", layout="wide")
-API_KEY = os.getenv("GEMINI_API_KEY") or (st.secrets.get("GEMINI_API_KEY") if st.secrets else None)
-if not API_KEY:
-    # app should still load if missing key — show warning later where generation happens
-    genai_client = None
-else:
-    genai_client = genai.Client(api_key=API_KEY)
+
+
+def setting(name: str, default=None):
+    """
+    Read a config value from the environment first, then Streamlit secrets.
+    """
+    value = os.getenv(name)
+    if value is None and st.secrets:
+        value = st.secrets.get(name)
+    return default if value is None else value
+
+
+@st.cache_resource(show_spinner=False)
+def get_rerun_log():
+    """
+    Per-process log of profiled reruns (rerun_profiler.py).
+    """
+    return RerunLog()
+
+
+# admin flag: time every section of every rerun (and fragment rerun)
+PROFILE_RERUNS = str(setting("PROFILE_RERUNS", "")).lower() in ("1", "true", "yes")
+rerun_log = get_rerun_log() if PROFILE_RERUNS else None
+rerun_profile = rerun_log.begin(st.session_state) if rerun_log else None
+
+
+def section(name: str):
+    return rerun_profile.section(name) if rerun_profile else nullcontext()
+
+
+@st.cache_resource(show_spinner=False)
+def get_gemini(api_key: str):
+    """
+    One resilient client per process, so the rate limiter, circuit
+    breakers and counters are shared by every session.
+    """
+    return client_from_settings(setting)
+
+
+@st.cache_resource(show_spinner=False)
+def get_router(routes_json: str):
+    """
+    Per-process model router (routing table from MODEL_ROUTES).
+    """
+    return ModelRouter(routes_json or None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_retriever():
+    """
+    Embedding model + a memory-bounded LRU of bot FAISS indexes
+    (INDEX_MEMORY_MB), optionally spilling to INDEX_SPILL_DIR — or a client
+    of the node's index sidecar when INDEX_SOCKET is set.
+    """
+    def local():
+        return Retriever(
+            budget_bytes=int(float(setting("INDEX_MEMORY_MB", 512)) * 2**20),
+            spill_dir=setting("INDEX_SPILL_DIR") or None,
+            encode_workers=int(setting("ENCODE_WORKERS", 0)),
+        )
+
+    socket_path = setting("INDEX_SOCKET")
+    if socket_path:
+        # one warm copy per node, served by index_server.py
+        return RemoteRetriever(socket_path, fallback=local)
+    return local()
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """
+    Per-process fair queue in front of Gemini (GEN_CONCURRENCY calls at
+    once), with per-user daily token budgets (TOKEN_BUDGET_DAILY, 0 = none).
+    """
+    meter = TokenMeter(firebase_db, default_budget=int(setting("TOKEN_BUDGET_DAILY", 0)))
+    return GenerationScheduler(concurrency=int(setting("GEN_CONCURRENCY", 4)), meter=meter)
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_memories():
+    """
+    Per-process cache of conversation memories (chat_memory.py), so they
+    outlive the engine, which is rebuilt on every rerun.
+    """
+    return MemoryCache()
+
+
+@st.cache_resource(show_spinner=False)
+def get_prewarmer():
+    """
+    Per-process background loader for bots, histories and indexes (prewarm.py).
+    """
+    return Prewarmer(workers=int(setting("PREWARM_WORKERS", 2)))
+
+
+with section("clients"):
+    router = get_router(setting("MODEL_ROUTES", ""))
+
+    API_KEY = setting("GEMINI_API_KEY")
+    if not API_KEY:
+        # app should still load if missing key — show warning later where generation happens
+        gemini = None
+    else:
+        gemini = get_gemini(API_KEY)
+
+    engine = ChatEngine(llm=gemini, store=firebase_db, retriever=get_retriever(), router=router,
+                        memories=get_chat_memories(), scheduler=get_scheduler())
+    prewarmer = get_prewarmer()
+
+
+def start_prewarm(username: str) -> None:
+    """
+    Start loading the user's bots in the background, once per session.
+    """
+    if st.session_state.get("prewarmed_for") != username:
+        st.session_state["prewarmed_for"] = username
+        schedule_login(prewarmer, engine, firebase_db, username)
 
 os.makedirs("chats", exist_ok=True)
 
@@ -36,7 +159,8 @@ os.makedirs("chats", exist_ok=True)
 # ---------------------------
 # CSS: WhatsApp-like + remove streamlit header/footer
 # ---------------------------
-st.markdown(
+with section("css"):
+    st.markdown(
     """
 <style>
 /* hide menu/header/footer (keeps sidebar toggle) */
@@ -151,12 +275,12 @@ button.send-btn { background:#25D366; color:#000; border:none; padding:10px 14px
 
 </style>
 """,
-    unsafe_allow_html=True,
-)
+        unsafe_allow_html=True,
+    )
 
 
 # ---------------------------
-# Helpers: text extraction, persona, FAISS
+# Helpers: text extraction, persona
 # ---------------------------
 def extract_bot_lines(raw_text, bot_name):
     """
@@ -193,7 +317,7 @@ def generate_persona(text_examples: str) -> str:
     Keep temperature low for deterministic output.
     Tolerant if no genai client is configured.
     """
-    if not text_examples or not genai_client:
+    if not text_examples or not gemini:
         return ""
     prompt = f"""Take these example messages from a single person and write a 1-2 sentence persona description capturing their tone, slang, and typical phrases.
 
@@ -203,36 +327,248 @@ Examples:
 Return only the short persona description.
 """
     try:
-        resp = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            options={"temperature": 0.2, "max_output_tokens": 120}
+        text = gemini.generate_text(
+            prompt,
+            config={"temperature": 0.2, "max_output_tokens": 120},
         )
-        # support dict-like and object-like responses
-        if isinstance(resp, dict):
-            text = resp.get("message", {}).get("content", "") or ""
-        else:
-            text = getattr(resp, "text", None) or str(resp)
-        return text.strip().splitlines()[0][:240]
-    except Exception:
+        return text.splitlines()[0][:240] if text else ""
+    except GeminiError:
         return ""
 
 
-@st.cache_resource(show_spinner=False)
-def build_faiss_for_bot(bot_text: str):
+# ---------------------------
+# Chat panel (fragment)
+# ---------------------------
+# Sending a message reruns only this panel: the CSS, sidebar, tabs, bot
+# list and bot loading above it are not re-executed. Changing the bot or
+# anything outside the panel still reruns the whole script.
+def rerun_chat_panel():
     """
-    Returns (embed_model, faiss_index, bot_lines list)
-    Cached per content string.
+    Rerun just the chat panel when it is the one rerunning. On a full run
+    (the first render after login or a tab switch, or any AppTest run)
+    Streamlit refuses a fragment-scoped rerun, so rerun the app instead.
     """
-    bot_lines = [line.strip() for line in bot_text.splitlines() if line.strip()]
-    if not bot_lines:
-        # minimal fallback: single placeholder
-        bot_lines = ["hello"]
-    embed_model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = embed_model.encode(bot_lines, convert_to_numpy=True)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
-    return embed_model, index, bot_lines
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        st.rerun(scope="fragment")
+    st.rerun()
+
+
+@st.fragment
+def chat_panel(user, selected_bot, bot_data, chat_key, chat_filters):
+    with rerun_log.fragment(st.session_state, "chat panel") if rerun_log else nullcontext():
+        _chat_panel(user, selected_bot, bot_data, chat_key, chat_filters)
+
+
+def _chat_panel(user, selected_bot, bot_data, chat_key, chat_filters):
+    # CHAT CARD
+    from streamlit.components.v1 import html as components_html
+
+    messages = st.session_state[chat_key]
+
+    # Convert to a simpler format for JS
+    clean_history = []
+    for m in messages:
+        if "user" in m:
+            clean_history.append({"role": "user", "content": m["user"]})
+        if "bot" in m:
+            clean_history.append({"role": "bot", "content": m["bot"]})
+
+    history_json = json.dumps(clean_history)
+
+    iframe_html = f"""
+    <!doctype html>
+    <html>
+    <head>
+    <meta charset="utf-8">
+    <style>
+    body {{
+      margin: 0;
+      background: transparent;
+      font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto;
+    }}
+
+    .chat-box {{
+        height: 100vh;
+        overflow-y: scroll;
+        padding: 12px;
+        box-sizing: border-box;
+        scrollbar-width: none;         /* Firefox */
+    }}
+
+    .chat-box::-webkit-scrollbar {{
+        display: none;                 /* Chrome */
+    }}
+
+    .msg {{
+        display: inline-block;
+        max-width: 80%;
+        padding: 10px 14px;
+        margin-bottom: 8px;
+        font-size: 15px;
+        border-radius: 16px;
+        white-space: pre-wrap;
+        word-wrap: break-word;
+    }}
+
+
+    .user {{
+        background: linear-gradient(90deg,#25D366,#128C7E);
+        color: white;
+        margin-left: auto;
+        border-radius: 16px 16px 4px 16px;
+    }}
+
+    .bot {{
+        background: white;
+        color: #111;
+        margin-right: auto;
+        border-radius: 16px 16px 16px 4px;
+    }}
+
+    @media (max-width: 600px) {{
+        .msg {{
+        display: inline-block;
+        max-width: 80%;
+        padding: 10px 14px;
+        margin-bottom: 8px;
+        border-radius: 16px;
+        font-size: 15px;
+        white-space: pre-wrap;
+        word-wrap: break-word;
+    }}
+
+    }}
+
+    </style>
+    </head>
+    <body>
+
+    <div id="chat" class="chat-box"></div>
+
+    <script>
+    const history = {history_json};
+
+    function renderChat() {{
+        const box = document.getElementById("chat");
+        box.innerHTML = "";
+
+        history.forEach(turn => {{
+            const row = document.createElement("div");
+            row.style.display = "flex";
+            row.style.marginBottom = "6px";
+
+            if (turn.role === "user") row.style.justifyContent = "flex-end";
+            else row.style.justifyContent = "flex-start";
+
+            const bubble = document.createElement("div");
+            bubble.className = "msg " + turn.role;
+            bubble.textContent = turn.content;
+
+            row.appendChild(bubble);
+            box.appendChild(row);
+        }});
+
+
+        box.scrollTop = box.scrollHeight;
+        setTimeout(() => box.scrollTop = box.scrollHeight, 50);
+    }}
+
+    renderChat();
+
+    const observer = new MutationObserver(() => {{
+        const box = document.getElementById("chat");
+        box.scrollTop = box.scrollHeight;
+    }});
+    observer.observe(document.getElementById("chat"), {{ childList: true }});
+
+    </script>
+
+
+    </body>
+    </html>
+    """
+
+    components_html(iframe_html, height=500, scrolling=False)
+
+    # --- ensure we clear the text_input BEFORE widget is created (safe) ---
+    if st.session_state.get("pending_clear", False):
+        # clear the stored value (widget not yet instantiated)
+        st.session_state["chat_input_box"] = ""
+        st.session_state["pending_clear"] = False
+
+    # INPUT BAR
+    # --- INPUT BAR (fixed layout: no gap, button inline) ---
+    st.markdown("""
+    <style>
+    .input-wrapper {
+        display: flex;
+        align-items: center;
+        gap: 10px;
+        margin-top: 0px !important;   /* remove extra gap */
+        padding-top: 6px;             /* small clean spacing */
+    }
+
+    .input-wrapper input {
+        flex: 1;
+        height: 42px;
+        border-radius: 12px;
+        padding: 10px 14px;
+        border: 1px solid #202124;
+        background: #0f1114;
+        color: white;
+        outline: none;
+    }
+
+    .send-btn-fixed {
+        background: #25D366;
+        border: none;
+        padding: 12px 16px;
+        border-radius: 12px;
+        cursor: pointer;
+        font-weight: bold;
+        font-size: 16px;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+    # Place input + send button on same row exactly
+    inp_col, btn_col = st.columns([10, 1])
+
+    with inp_col:
+        user_msg = st.text_input(
+            "Message",
+            key="chat_input_box",
+            label_visibility="collapsed",
+            placeholder="Type…"
+        )
+
+        st.markdown("""
+<script>
+setTimeout(function() {
+    const box = window.parent.document.querySelector('input[id="chat_input_box"]');
+    if (box) { box.focus(); }
+}, 300);
+</script>
+""", unsafe_allow_html=True)
+
+    with btn_col:
+        send = st.button("➤", key="send_chat_btn", use_container_width=True)
+
+
+    if send and user_msg.strip():
+        st.session_state[chat_key].append({"user": user_msg, "bot": "", "ts": now_ts()})
+        save_chat_history_cloud(user, selected_bot, st.session_state[chat_key])
+
+        # one retrieval + one LLM call; fills the pending entry and persists it
+        engine.reply(user, selected_bot, st.session_state[chat_key], bot_data=bot_data,
+                     filters=chat_filters)
+
+        # mark that input must be cleared on next rerun (safe)
+        st.session_state["pending_clear"] = True
+
+        # rerun so iframe re-renders with updated history and cleared input
+        rerun_chat_panel()
 
 
 # ---------------------------
@@ -253,7 +589,7 @@ if "show_inline_login" not in st.session_state:
 # can login or register, and a section displaying the user's login status. The code handles user
 # authentication, such as logging in, registering, and logging out. It also provides a tip for
 # managing bots and uploading files.
-with st.sidebar:
+with section("sidebar"), st.sidebar:
     st.markdown("<div style='display:flex;align-items:center;gap:10px;'><div style='width:44px;height:44px;border-radius:10px;background:#6c63ff;color:#fff;display:flex;align-items:center;justify-content:center;font-weight:700'>CD</div><div><b style='font-size:16px;color:#fff'>Chat Builder</b><div class='small-muted'>Personal chatbots from exports</div></div></div>", unsafe_allow_html=True)
     st.markdown("---")
     st.subheader("🔐 Account")
@@ -275,6 +611,7 @@ with st.sidebar:
                     if ok:
                         st.session_state.logged_in = True
                         st.session_state.username = username_input
+                        start_prewarm(username_input)
                         st.success(f"Welcome, {username_input}!")
                         st.rerun()
                     else:
@@ -294,7 +631,12 @@ with st.sidebar:
         if st.button("Logout"):
             st.session_state.logged_in = False
             st.session_state.username = ""
+            st.session_state.pop("prewarmed_for", None)
             st.rerun()
+    if gemini and str(setting("SHOW_API_STATS", "")).lower() in ("1", "true", "yes"):
+        with st.expander("🩺 Gemini status"):
+            st.json({"client": gemini.stats(), "router": router.stats(), "indexes": engine.retriever.stats(),
+                     "prewarm": prewarmer.stats(), "scheduler": engine.scheduler.stats()})
     st.markdown("---")
     st.markdown("<div class='small-muted'>Pro tip: manage bots and upload files inside the Manage tab (no sidebar actions required).</div>", unsafe_allow_html=True)
 
@@ -330,6 +672,7 @@ if not st.session_state.logged_in:
                 if login_user(h_user, h_pass):
                     st.session_state.logged_in = True
                     st.session_state.username = h_user
+                    start_prewarm(h_user)
                     st.success("Logged in.")
                     st.rerun()
                 else:
@@ -348,9 +691,14 @@ else:
     # Authenticated view: hide Home, show main app
     tabs = st.tabs(["💬 Chat", "🧰 Manage Bots", "🍭 Buy Lollipop"])
 # ----- Chat tab -----
-    with tabs[0]:
+    with section("chat tab"), tabs[0]:
         user = st.session_state.username
-        user_bots = get_user_bots(user)
+        # most recently used first, so the default selection is the one prewarmed first
+        with section("bot list"):
+            user_bots = prewarmer.take((user, "bots")) or by_recent_use(get_user_bots(user) or [])
+        if st.session_state.get("prewarmed_for") != user:
+            st.session_state["prewarmed_for"] = user
+            schedule_user(prewarmer, engine, firebase_db, user, user_bots)
 
         if not user_bots:
             st.info("No bots yet. Create one in Manage Bots tab.")
@@ -370,337 +718,63 @@ else:
 
             # Left side main chat
             with col_main:
-                selected_bot = st.selectbox("Select bot", [b["name"] for b in user_bots], key="chat_selected_bot")
+                bot_names = {b["id"]: b["name"] for b in user_bots}
+                selected_bot = st.selectbox(
+                    "Select bot", list(bot_names), format_func=bot_names.get, key="chat_selected_bot"
+                )
+                selected_name = bot_names[selected_bot]
 
-                # Load bot file
-                res = get_bot_file(user, selected_bot)
-                if isinstance(res, (list, tuple)):
-                    bot_text = res[0]
-                    persona = res[1] if len(res) > 1 else ""
-                else:
-                    bot_text = res
-                    persona = ""
+                if st.session_state.get("touched_bot") != selected_bot:
+                    st.session_state["touched_bot"] = selected_bot
+                    touch_bot(user, selected_bot)
+
+                # Load bot file (handed over by the prewarmer on the first visit)
+                with section("bot load"):
+                    bot_data = prewarmer.take((user, "bot", selected_bot)) or get_bot(user, selected_bot) or {}
+                bot_text = bot_data.get("file_text", "")
+                persona = bot_data.get("persona", "")
 
                 if not bot_text.strip():
                     st.warning("Bot has no data.")
                     st.stop()
 
-                embed_model, index, bot_lines = build_faiss_for_bot(bot_text)
+                # bots uploaded before style profiles existed: compute once and store
+                if not bot_data.get("style_profile"):
+                    bot_data["style_profile"] = build_profile(bot_text.splitlines())
+                    update_bot_style_profile(user, selected_bot, bot_data["style_profile"])
+
+                # build the index in the background (no-op if prewarm already did);
+                # a send before it finishes waits on the same build
+                prewarmer.submit((user, "index", selected_bot), -1, warm_index,
+                                 engine, firebase_db, user, selected_bot, bot_data)
 
                 chat_key = f"chat_{selected_bot}_{user}"
                 if chat_key not in st.session_state:
-                    st.session_state[chat_key] = load_chat_history_cloud(user, selected_bot) or []
+                    st.session_state[chat_key] = (
+                        prewarmer.take((user, "history", selected_bot)) or load_chat_history_cloud(user, selected_bot) or []
+                    )
+                st.session_state["active_chat"] = (user, selected_bot, chat_key)
+
+                # bots with a message store can match only recent style
+                chat_filters = None
+                if bot_data.get("store_sha"):
+                    windows = {"All messages": None, "Last year": 365, "Last 90 days": 90, "Last 30 days": 30}
+                    window = st.selectbox("Match style from", list(windows), key=f"style_window_{selected_bot}")
+                    if windows[window]:
+                        chat_filters = {"recent_days": windows[window]}
+                st.session_state["active_filters"] = chat_filters
 
                 # Header
                 st.markdown(
-                    f"<div class='chat-header'><div class='title'>{selected_bot}</div>"
+                    f"<div class='chat-header'><div class='title'>{selected_name}</div>"
                     f"<div class='subtitle'>Persona: {persona or '—'}</div></div>",
                     unsafe_allow_html=True
                 )
 
-                # CHAT CARD
-                from streamlit.components.v1 import html as components_html
-
-                messages = st.session_state[chat_key]
-
-                # Convert to a simpler format for JS
-                clean_history = []
-                for m in messages:
-                    if "user" in m:
-                        clean_history.append({"role": "user", "content": m["user"]})
-                    if "bot" in m:
-                        clean_history.append({"role": "bot", "content": m["bot"]})
-
-                history_json = json.dumps(clean_history)
-
-                iframe_html = f"""
-                <!doctype html>
-                <html>
-                <head>
-                <meta charset="utf-8">
-                <style>
-                body {{
-                  margin: 0;
-                  background: transparent;
-                  font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto;
-                }}
-
-                .chat-box {{
-                    height: 100vh;
-                    overflow-y: scroll;
-                    padding: 12px;
-                    box-sizing: border-box;
-                    scrollbar-width: none;         /* Firefox */
-                }}
-
-                .chat-box::-webkit-scrollbar {{
-                    display: none;                 /* Chrome */
-                }}
-
-                .msg {{
-                    display: inline-block;
-                    max-width: 80%;
-                    padding: 10px 14px;
-                    margin-bottom: 8px;
-                    font-size: 15px;
-                    border-radius: 16px;
-                    white-space: pre-wrap;
-                    word-wrap: break-word;
-                }}
-
-
-                .user {{
-                    background: linear-gradient(90deg,#25D366,#128C7E);
-                    color: white;
-                    margin-left: auto;
-                    border-radius: 16px 16px 4px 16px;
-                }}
-
-                .bot {{
-                    background: white;
-                    color: #111;
-                    margin-right: auto;
-                    border-radius: 16px 16px 16px 4px;
-                }}
-
-                @media (max-width: 600px) {{
-                    .msg {{
-                    display: inline-block;
-                    max-width: 80%;
-                    padding: 10px 14px;
-                    margin-bottom: 8px;
-                    border-radius: 16px;
-                    font-size: 15px;
-                    white-space: pre-wrap;
-                    word-wrap: break-word;
-                }}
-
-                }}
-
-                </style>
-                </head>
-                <body>
-
-                <div id="chat" class="chat-box"></div>
-
-                <script>
-                const history = {history_json};
-
-                function renderChat() {{
-                    const box = document.getElementById("chat");
-                    box.innerHTML = "";
-
-                    history.forEach(turn => {{
-                        const row = document.createElement("div");
-                        row.style.display = "flex";
-                        row.style.marginBottom = "6px";
-
-                        if (turn.role === "user") row.style.justifyContent = "flex-end";
-                        else row.style.justifyContent = "flex-start";
-
-                        const bubble = document.createElement("div");
-                        bubble.className = "msg " + turn.role;
-                        bubble.textContent = turn.content;
-
-                        row.appendChild(bubble);
-                        box.appendChild(row);
-                    }});
-
-
-                    box.scrollTop = box.scrollHeight;
-                    setTimeout(() => box.scrollTop = box.scrollHeight, 50);
-                }}
-
-                renderChat();
-
-                const observer = new MutationObserver(() => {{
-                    const box = document.getElementById("chat");
-                    box.scrollTop = box.scrollHeight;
-                }});
-                observer.observe(document.getElementById("chat"), {{ childList: true }});
-
-                </script>
-
-
-                </body>
-                </html>
-                """
-
-                components_html(iframe_html, height=500, scrolling=False)
-
-                # --- ensure we clear the text_input BEFORE widget is created (safe) ---
-                if st.session_state.get("pending_clear", False):
-                    # clear the stored value (widget not yet instantiated)
-                    st.session_state["chat_input_box"] = ""
-                    st.session_state["pending_clear"] = False
-
-                # INPUT BAR
-                # --- INPUT BAR (fixed layout: no gap, button inline) ---
-                st.markdown("""
-                <style>
-                .input-wrapper {
-                    display: flex;
-                    align-items: center;
-                    gap: 10px;
-                    margin-top: 0px !important;   /* remove extra gap */
-                    padding-top: 6px;             /* small clean spacing */
-                }
-
-                .input-wrapper input {
-                    flex: 1;
-                    height: 42px;
-                    border-radius: 12px;
-                    padding: 10px 14px;
-                    border: 1px solid #202124;
-                    background: #0f1114;
-                    color: white;
-                    outline: none;
-                }
-
-                .send-btn-fixed {
-                    background: #25D366;
-                    border: none;
-                    padding: 12px 16px;
-                    border-radius: 12px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    font-size: 16px;
-                }
-                </style>
-                """, unsafe_allow_html=True)
-
-                # Place input + send button on same row exactly
-                inp_col, btn_col = st.columns([10, 1])
-
-                with inp_col:
-                    user_msg = st.text_input(
-                        "Message",
-                        key="chat_input_box",
-                        label_visibility="collapsed",
-                        placeholder="Type…"
-                    )
-
-                    st.markdown("""
-        <script>
-            setTimeout(function() {
-                const box = window.parent.document.querySelector('input[id="chat_input_box"]');
-                if (box) { box.focus(); }
-            }, 300);
-        </script>
-    """, unsafe_allow_html=True)
-
-                with btn_col:
-                    send = st.button("➤", key="send_chat_btn", use_container_width=True)
-
-
-                if send and user_msg.strip():
-                    ts = datetime.now().strftime("%I:%M %p")
-                    st.session_state[chat_key].append({"user": user_msg, "bot": "", "ts": ts})
-                    save_chat_history_cloud(user, selected_bot, st.session_state[chat_key])
-
-                    # Retrieval
-                    vec = embed_model.encode([user_msg])
-                    _, idxs = index.search(vec, k=20)
-                    retrieved = "\n".join([bot_lines[i] for i in idxs[0] if i < len(bot_lines)])[:2000]
-                    
-                    # === Build recent history (all messages in this chat) ===
-                    history_lines = []
-                    for entry in st.session_state.get(chat_key, []):
-                        if "user" in entry:
-                            history_lines.append(f"User: {entry['user']}")
-                        if "bot" in entry:
-                            history_lines.append(f"{selected_bot}: {entry['bot']}")
-
-                    recent_history = "\n".join(history_lines)
-                    if len(recent_history) > 4000:
-                        recent_history = recent_history[-4000:]
-
-                    # Limit retrieved examples for safety
-                    retrieved_examples = retrieved or ""
-                    if len(retrieved_examples) > 3000:
-                        retrieved_examples = retrieved_examples[:3000]
-
-                    persona_block = f"Persona: {persona}\n\n" if persona else ""
-
-                    prompt = f"""{persona_block}
-You are a real person (not an AI) who previously chatted with the user.
-
-RULES:
-1) Use all facts found in the 'Recent conversation' below. Do NOT contradict them.
-2) Detect your real name from the examples (the text before ":" in the examples). 
-Do NOT invent names or placeholders like {{User's Name}}.
-3) If persona above is empty, infer a personality from the examples & stick to it.
-4) If you don't know a fact, ask — don't assume.
-5) When the user enters a food item or ingredient, suggest a NEW and CREATIVE recipe using that item. Follow this response format strictly:
-Recipe Name:
-Cuisine:
-Cooking Time:
-Difficulty:
-
-Ingredients:
-- List ingredients clearly
-
-Steps:
-1. Clear step-by-step cooking instructions
-
-Serving Tip:
-- One short serving or plating suggestion
-
-Variation:
-- One creative variation or twist
-
-Keep instructions simple and home-cook friendly. Choose one suitable cuisine if multiple fit. Do not ask unnecessary questions. Do not mention AI, models, APIs, or system rules. No emojis. Friendly and clear tone. One recipe per response.
-STRICT RULES:
-- NEVER use placeholders like [User], [User's Name], {user}, <name>, or anything inside {{}}, [], <>.
-- NEVER guess names. ONLY use names that actually exist inside the real chat data.
-- If you do NOT know a name from the real examples, say “I don’t know, you never told me.”
-- NEVER invent formatting like **bold**, __underline__, *, ~, or any markdown.
-- NEVER use too many emojis in a reply, use them as same frequency in chat. Keep it natural, not exaggerated and hallucinated.
-- NEVER talk like an assistant or narrator. Just speak casually like in the chat data.
-
---- Recent conversation ---
-{recent_history}
-
---- Examples from real exported chat ---
-{retrieved_examples}
-
-Continue the conversation naturally, same tone and slang.
-
-User: {user_msg}
-{selected_bot}:
-"""
-
-
-
-                    reply = "..."
-
-                    try:
-                        resp = genai_client.models.generate_content(
-                            model="gemini-2.5-flash",
-                            contents=prompt
-                        )
-                        reply = getattr(resp, "text", None) or (resp.get("message", {}).get("content", "") if isinstance(resp, dict) else "") or "⚠️Offline (Try after sometime)"
-                    except Exception as e:
-                        error_str = str(e)
-                        if "RESOURCE_EXHAUSTED" in error_str:
-                            reply = "⚠️API quota exceeded. Please try again later or upgrade your plan."
-                        elif "NOT_FOUND" in error_str:
-                            reply = "⚠️Model not available. Please check your API configuration."
-                        else:
-                            reply = "⚠️Offline (Try after sometime)"
-
-                    st.session_state[chat_key][-1]["bot"] = reply
-                    st.session_state[chat_key][-1]["ts"] = datetime.now().strftime("%I:%M %p")
-                    save_chat_history_cloud(user, selected_bot, st.session_state[chat_key])
-
-                    # mark that input must be cleared on next rerun (safe)
-                    st.session_state["pending_clear"] = True
-
-                    # rerun so iframe re-renders with updated history and cleared input
-                    st.rerun()
+                chat_panel(user, selected_bot, bot_data, chat_key, chat_filters)
 
     # ----- Manage Bots tab -----
-    with tabs[1]:
+    with section("manage tab"), tabs[1]:
         if not st.session_state.logged_in:
             st.warning("Please log in to manage your bots.")
             st.stop()
@@ -709,6 +783,7 @@ User: {user_msg}
         st.markdown("<div class='card'><h4>Upload chat export (.txt) — max 2 bots</h4>", unsafe_allow_html=True)
         up_file = st.file_uploader("Choose .txt file", type=["txt"], key="manage_upload")
         up_name = st.text_input("Bot name (example: John)", key="manage_name")
+        up_refine = st.checkbox("Also ask Gemini for a persona sentence (slower upload)", key="manage_refine")
         if st.button("Upload bot", key="manage_upload_btn"):
             try:
                 user_bots = get_user_bots(user) or []
@@ -721,19 +796,92 @@ User: {user_msg}
                 st.error("Please provide both file and name.")
             else:
                 raw = up_file.read().decode("utf-8", "ignore")
-                bot_lines = extract_bot_lines(raw, up_name)
+                # timestamps, both speakers and row IDs in NumPy columns, for filtered retrieval
+                store = MessageStore.from_export(raw, up_name)
+                bot_lines = store.bot_text() if store else extract_bot_lines(raw, up_name)
                 if not bot_lines.strip():
                     # fallback to storing longer lines
                     bot_lines = "\n".join([l for l in raw.splitlines() if len(l.split()) > 1])
-                persona = generate_persona("\n".join(bot_lines.splitlines()[:40]))
+                # local style profile over the whole corpus — no LLM round trip
+                profile = build_profile(bot_lines.splitlines())
+                persona = describe_profile(profile, short=True)
+                if up_refine:
+                    persona = generate_persona("\n".join(bot_lines.splitlines()[:40])) or persona
                 try:
-                    add_bot(user, up_name.capitalize(), bot_lines, persona=persona)
+                    add_bot(user, up_name.capitalize(), bot_lines, persona=persona, style_profile=profile,
+                            message_store=store.to_bytes() if store else None)
                     st.success(f"Added {up_name} — persona: {persona or '—'}")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Upload error: {e}")
     
         st.markdown("</div>", unsafe_allow_html=True)
+
+        # Bulk import: several WhatsApp / Instagram exports of one person, merged into one bot
+        st.markdown("<div class='card'><h4>Bulk import (.zip of .txt / Instagram .json exports)</h4>", unsafe_allow_html=True)
+        zip_file = st.file_uploader("Choose .zip file", type=["zip"], key="bulk_upload")
+        zip_name = st.text_input("Bot name (as in the exports)", key="bulk_name")
+        zip_aliases = st.text_input("Other names of the same person (comma-separated)", key="bulk_aliases")
+        if st.button("Import zip", key="bulk_upload_btn"):
+            if len(get_user_bots(user) or []) >= 2:
+                st.error("You already have 2 bots. Delete one first.")
+            elif (not zip_file) or (not zip_name.strip()):
+                st.error("Please provide both file and name.")
+            else:
+                progress = st.progress(0.0, text="Starting workers…")
+                file_log = st.empty()
+                done_lines = []
+
+                def on_file(done, total, f):
+                    status = f"{f['messages']} messages, {f['lines']} lines, {f['seconds']}s" \
+                        if f["ok"] else f"⚠️ {f['error']}"
+                    done_lines.append(f"- `{f['name']}`: {status}")
+                    progress.progress(done / total, text=f"{done}/{total} files")
+                    file_log.markdown("\n".join(done_lines))
+
+                try:
+                    aliases = [a for a in zip_aliases.split(",") if a.strip()]
+                    result = import_zip(zip_file.getvalue(), zip_name.strip(), aliases,
+                                        workers=int(setting("IMPORT_WORKERS", 0)) or None, on_file=on_file)
+                    if not result.bot_text:
+                        st.error(f"No messages from {zip_name} found in the zip.")
+                    else:
+                        profile = build_profile(result.bot_text.splitlines())
+                        persona = describe_profile(profile, short=True)
+                        bot_id = add_bot(user, zip_name.strip().capitalize(), result.bot_text, persona=persona,
+                                         style_profile=profile, message_store=result.store.to_bytes())
+                        # the workers already embedded every line: index without re-encoding
+                        engine.retriever.adopt(result.bot_text, bot_id, result.vectors)
+                        st.success(f"Added {zip_name} from {result.report['files']} files — persona: {persona}")
+                        st.json(result.report)
+                except Exception as e:
+                    st.error(f"Import error: {e}")
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        # Bot bundle (bot_bundle.py): corpus, embeddings and index in one file, nothing re-encoded
+        st.markdown("<div class='card'><h4>Import a bot bundle (.cbb)</h4>", unsafe_allow_html=True)
+        bundle_file = st.file_uploader("Choose .cbb file", type=["cbb"], key="bundle_upload")
+        if st.button("Import bundle", key="bundle_upload_btn"):
+            if len(get_user_bots(user) or []) >= 2:
+                st.error("You already have 2 bots. Delete one first.")
+            elif not bundle_file:
+                st.error("Please choose a bundle file.")
+            else:
+                # bundles are memory-mapped (and read by the index sidecar), so they need a real file
+                tmp = tempfile.NamedTemporaryFile(suffix=".cbb", delete=False)
+                try:
+                    tmp.write(bundle_file.getvalue())
+                    tmp.close()
+                    import_bot(tmp.name, firebase_db, engine.retriever, user)
+                    st.success("Bundle imported.")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Bundle error: {e}")
+                finally:
+                    os.unlink(tmp.name)
+
+        st.markdown("</div>", unsafe_allow_html=True)
     
         # Manage existing bots UI
         st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
@@ -748,11 +896,12 @@ User: {user_msg}
             st.markdown(f"**{b['name']}** : {b.get('persona','—')}")
             rn, dlt, clr = st.columns([1,1,1])
             with rn:
-                new_name = st.text_input(f"Rename {b['name']}", key=f"rename_{b['name']}")
-                if st.button("Rename", key=f"rename_btn_{b['name']}"):
+                new_name = st.text_input(f"Rename {b['name']}", key=f"rename_{b['id']}")
+                if st.button("Rename", key=f"rename_btn_{b['id']}"):
                     if new_name.strip():
                         try:
-                            update_bot(user, b['name'], new_name.strip())
+                            update_bot(user, b['id'], new_name.strip())
+                            forget_bot(prewarmer, user, b['id'])
                             st.success("Renamed.")
                             st.rerun()
                         except Exception as e:
@@ -760,24 +909,65 @@ User: {user_msg}
                     else:
                         st.error("Enter a new name.")
             with dlt:
-                if st.button("Delete", key=f"del_{b['name']}"):
+                if st.button("Delete", key=f"del_{b['id']}"):
                     try:
-                        delete_bot(user, b['name'])
+                        delete_bot(user, b['id'])
+                        engine.retriever.evict(b['id'])
+                        forget_bot(prewarmer, user, b['id'])
                         st.warning("Deleted.")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Delete error: {e}")
             with clr:
-                if st.button("Clear history", key=f"clr_{b['name']}"):
+                if st.button("Clear history", key=f"clr_{b['id']}"):
                     try:
-                        save_chat_history_cloud(user, b['name'], [])
+                        save_chat_history_cloud(user, b['id'], [])
+                        forget_bot(prewarmer, user, b['id'])
+                        st.session_state.pop(f"chat_{b['id']}_{user}", None)
                         st.success("History cleared.")
                     except Exception as e:
                         st.error(f"Clear error: {e}")
+
+            # Export: history is read page by page and streamed through the encoder, but
+            # st.download_button needs the whole file, so it is held in memory here
+            # (GET /export/{bot} streams it instead)
+            ex_fmt, ex_gz, ex_btn = st.columns([1, 1, 1])
+            with ex_fmt:
+                fmt = st.selectbox("Export format", list(FORMATS), key=f"export_fmt_{b['id']}")
+            with ex_gz:
+                compress = st.checkbox("gzip", key=f"export_gz_{b['id']}")
+            with ex_btn:
+                if st.button("Prepare export", key=f"export_btn_{b['id']}"):
+                    try:
+                        buf = io.BytesIO()
+                        entries = iter_chat_history(user, b['id'], stream_pages=False)
+                        for chunk in iter_export(entries, fmt, b['name'], compress):
+                            buf.write(chunk)
+                        st.download_button(
+                            "Download", data=buf, key=f"export_dl_{b['id']}",
+                            file_name=export_filename(b['name'], fmt, compress),
+                            mime=export_mime(fmt, compress),
+                        )
+                    except Exception as e:
+                        st.error(f"Export error: {e}")
+
+            if st.button("Prepare bot bundle", key=f"bundle_btn_{b['id']}"):
+                path = os.path.join(tempfile.mkdtemp(), f"{export_filename(b['name'], 'txt')[:-4]}.cbb")
+                try:
+                    export_bot(path, firebase_db, engine.retriever, user, b['id'])
+                    with open(path, "rb") as f:
+                        st.download_button("Download bundle", data=f.read(), key=f"bundle_dl_{b['id']}",
+                                           file_name=os.path.basename(path), mime="application/octet-stream")
+                except Exception as e:
+                    st.error(f"Bundle error: {e}")
+                finally:
+                    if os.path.exists(path):
+                        os.unlink(path)
+                    os.rmdir(os.path.dirname(path))
     
     
     # ----- Buy Lollipop tab -----
-    with tabs[2]:
+    with section("buy tab"), tabs[2]:
         st.markdown("<div class='card'><h4>Buy developer a lollipop 🍭</h4>", unsafe_allow_html=True)
     
         upi_id = "gkm2302-1@oksbi"
@@ -798,195 +988,42 @@ User: {user_msg}
 # ---------------------------
 # Final: keep consistent behavior
 # ---------------------------
-# If user pressed Send inside Chat tab, we appended "...thinking" and re-ran.
-# Now, handle streaming generation (separate block that runs after rerun).
-# We detect any chat entries that have bot == "...thinking" and generate for them.
+# The send handler generates its reply inline. A pending entry (bot == "")
+# can still be left behind if a rerun was interrupted mid-generation, so
+# finish it here for the chat currently open — no scan over session keys.
 def process_pending_generation():
     # Only meaningful when logged in and chat selected
-    if not st.session_state.logged_in:
+    if not st.session_state.logged_in or "active_chat" not in st.session_state:
         return
-    user = st.session_state.username
-    selected_key = None
-    # find any chat keys for this user that have a pending entry
-    for k in list(st.session_state.keys()):
-        if k.startswith("chat_") and k.endswith(f"_{user}"):
-            msgs = st.session_state[k]
-            if msgs and isinstance(msgs[-1], dict) and msgs[-1].get("bot") == "":
-                selected_key = k
-                break
-    if not selected_key:
+    user, bot_id, chat_key = st.session_state["active_chat"]
+    if user != st.session_state.username:
         return
-
-    # extract selected bot name
-    # format: chat_{bot}_{user}
-    try:
-        parts = selected_key.split("_")
-        # join middle parts as bot name might contain underscores
-        bot_name = "_".join(parts[1:-1])
-    except Exception:
+    msgs = st.session_state.get(chat_key)
+    if not msgs or not isinstance(msgs[-1], dict) or msgs[-1].get("bot") != "":
         return
 
-    msgs = st.session_state[selected_key]
-    pending = msgs[-1]
-    user_input = pending.get("user", "")
-    if not user_input:
+    if not msgs[-1].get("user", ""):
         # cleanup
         msgs[-1]["bot"] = "⚠️ No user input found."
-        save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-        return
-
-    # prepare context using the bot file (if exists)
-    try:
-        res = get_bot_file(user, bot_name)
-        if isinstance(res, (list, tuple)):
-            bot_text = res[0]
-            persona = res[1] if len(res) > 1 else ""
-        else:
-            bot_text = res or ""
-            persona = ""
-    except Exception:
-        bot_text = ""
-        persona = ""
-
-    if not bot_text:
-        pending["bot"] = "⚠️ No bot source text available."
-        save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-        return
-
-    # build FAISS (fast cached)
-    embed_model, index, bot_lines = build_faiss_for_bot(bot_text)
-    # retrieval for extra context
-    try:
-        qvec = embed_model.encode([user_input])
-        D, I = index.search(qvec, k=20)
-    except Exception:
-        I = [[]]
-    lines = []
-    if I is not None:
-        for idx in I[0]:
-            if idx < len(bot_lines):
-                candidate = bot_lines[idx].strip()
-                if len(candidate.split()) > 2:
-                    lines.append(candidate)
-    context = "\n".join(lines[:12])
-    if len(context) > 3000:
-        context = context[:3000]
-
-    persona_block = f"Persona: {persona}\n\n" if persona else ""
-    # === Build recent history ===
-    history_lines = []
-    for entry in msgs:
-        if "user" in entry:
-            history_lines.append(f"User: {entry['user']}")
-        if "bot" in entry:
-            history_lines.append(f"{bot_name}: {entry['bot']}")
-    
-    recent_history = "\n".join(history_lines)
-    if len(recent_history) > 4000:
-        recent_history = recent_history[-4000:]
-    
-    retrieved_examples = context or ""
-    if len(retrieved_examples) > 3000:
-        retrieved_examples = retrieved_examples[:3000]
-    
-    persona_block = f"Persona: {persona}\n\n" if persona else ""
-    
-    prompt = f"""{persona_block}
-You are a real human being who has chatted with this user before.
-
-RULES:
-1) The 'Recent conversation' below is absolute truth — do NOT contradict any facts.
-2) Determine your own real name from the examples (the text before ":"). 
-   The UI label '{bot_name}' is NOT your real name unless examples say so.
-3) If persona is empty, infer your personality from the examples and stick to it.
-4) NEVER produce placeholders like {{User's Name}}. Use only info you know.
-5) Your tone, slang, maturity, emotions must match the examples — not generic AI tone.
-STRICT RULES:
-- NEVER use placeholders like [User], [User's Name], {user}, <name>, or anything inside {{}}, [], <>.
-- NEVER guess names. ONLY use names that actually exist inside the real chat data.
-- If you do NOT know a name from the real examples, say “I don’t know, you never told me.”
-- NEVER invent formatting like **bold**, __underline__, *, ~, or any markdown.
-- NEVER use too many emojis in a reply, use them as same frequency in chat. Keep it natural, not exaggerated and hallucinated.
-- NEVER talk like an assistant or narrator. Just speak casually like in the chat data.
-
---- Recent conversation ---
-{recent_history}
-
---- Real chat examples from export ---
-{retrieved_examples}
-
-Continue naturally.
-
-User: {user_input}
-{bot_name}:
-"""
-
-
-    # generate (stream if possible)
-    if not genai_client:
-        pending["bot"] = "⚠️ Gemini API key not set. Add GEMINI_API_KEY to environment or Streamlit secrets."
-        save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
+        save_chat_history_cloud(user, bot_id, msgs)
         return
 
-    # choose model conservatively
-    model_name = "gemini-2.5-flash"  # general model; change if you prefer flash versions
-    try:
-        # use streaming if available in your genai client
-        resp_iter = genai_client.models.generate_content_stream(model=model_name, contents=prompt)
-    except Exception:
-        # fallback to single-shot
-        try:
-            resp = genai_client.models.generate_content(model=model_name, contents=prompt)
-            # extract text
-            if isinstance(resp, dict):
-                text = resp.get("message", {}).get("content", "") or ""
-            else:
-                text = getattr(resp, "text", None) or str(resp)
-            pending["bot"] = text.strip()
-            pending["ts"] = datetime.now().strftime("%I:%M %p")
-            save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-            return
-        except Exception as e:
-            error_str = str(e)
-            if "RESOURCE_EXHAUSTED" in error_str:
-                pending["bot"] = "⚠️API quota exceeded. Please try again later or upgrade your plan."
-            elif "NOT_FOUND" in error_str:
-                pending["bot"] = "⚠️Model not available. Please check your API configuration."
-            else:
-                pending["bot"] = "⚠️Offline (Try after sometime)"
-            pending["ts"] = datetime.now().strftime("%I:%M %p")
-            save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-            return
-
-    # stream handling
-    accumulated = ""
-    try:
-        for chunk in resp_iter:
-            # chunk may be dict-like or obj-like
-            text = ""
-            if isinstance(chunk, dict):
-                text = chunk.get("message", {}).get("content", "") or chunk.get("text", "") or ""
-            else:
-                text = getattr(chunk, "text", "") or ""
-            if not text:
-                continue
-            accumulated += text
-            # update pending bot text in session
-            st.session_state[selected_key][-1]["bot"] = accumulated
-            st.session_state[selected_key][-1]["ts"] = datetime.now().strftime("%I:%M %p")
-            # persist partial (optionally)
-            save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-        # final
-        st.session_state[selected_key][-1]["bot"] = accumulated.strip()
-        st.session_state[selected_key][-1]["ts"] = datetime.now().strftime("%I:%M %p")
-        save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-    except Exception as e:
-        st.session_state[selected_key][-1]["bot"] = f"⚠️Offline (Text after sometime)"
-        st.session_state[selected_key][-1]["ts"] = datetime.now().strftime("%I:%M %p")
-        save_chat_history_cloud(user, bot_name, st.session_state[selected_key])
-        return
+    engine.reply(user, bot_id, msgs, filters=st.session_state.get("active_filters"))
+    st.rerun()
 
 
 # run generation post-render (non-blocking style — runs during this request)
-process_pending_generation()
+with section("pending generation"):
+    process_pending_generation()
+
+if rerun_log:
+    # after finishing, so the report itself isn't counted; it shows the runs before this one too
+    rerun_log.finish(st.session_state)
+    with st.sidebar.expander("⏱ Rerun profile"):
+        runs = rerun_log.recent(10)
+        st.json(rerun_log.summary())
+        st.dataframe([{"kind": r["kind"], "status": r["status"], "total_ms": r["total_ms"]} for r in runs])
+        if runs:
+            st.caption(f"Functions ({runs[-1]['profiler']}), last run: {runs[-1]['kind']}")
+            st.code(runs[-1]["functions"] or "(profiler busy with another session)")
 # end of file
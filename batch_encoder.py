@@ -0,0 +1,174 @@
+"""
+Length-bucketed, multi-process sentence encoder for building big indexes.
+
+`model.encode(lines)` runs on one process with fixed-size batches (a
+batch of long lines costs as much memory as a batch of short ones) and
+holds every vector until the end. This encoder instead:
+
+  1. walks the corpus in chunks of `chunk_lines` (original order);
+  2. inside a chunk, sorts lines by approximate token length and cuts
+     batches under a token budget (short lines: big batches, long lines:
+     small ones), so padding stays low;
+  3. spreads the batches over worker processes, each pinned to
+     `threads` intra-op threads so workers don't oversubscribe cores;
+  4. scatters results back into the chunk's original order and hands
+     the finished chunk to the caller (e.g. `index.add`) before starting
+     the next one, so peak memory is one chunk of vectors.
+
+With `workers=0` the same batching runs in-process on a given model.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+
+CHUNK_LINES = 16384
+BATCH_TOKENS = 8192
+MAX_BATCH = 512
+MAX_SEQ_TOKENS = 256
+
+_worker_model = None
+
+
+def approx_tokens(line: str) -> int:
+    # word-piece count is ~chars/4 for chat text, plus [CLS]/[SEP]
+    return min(MAX_SEQ_TOKENS, len(line) // 4 + 2)
+
+
+def length_batches(lines: list, batch_tokens: int = BATCH_TOKENS, max_batch: int = MAX_BATCH) -> list:
+    """
+    Positions of `lines`, grouped into batches of similar length whose
+    padded size (count x longest) stays under `batch_tokens`.
+    """
+    order = sorted(range(len(lines)), key=lambda i: approx_tokens(lines[i]))
+    batches, current, longest = [], [], 0
+    for i in order:
+        n = approx_tokens(lines[i])
+        if current and (len(current) >= max_batch or max(longest, n) * (len(current) + 1) > batch_tokens):
+            batches.append(current)
+            current, longest = [], 0
+        current.append(i)
+        longest = max(longest, n)
+    if current:
+        batches.append(current)
+    return batches
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+def init_worker(model_name: str, threads: int) -> None:
+    """
+    Pool initializer: pin intra-op threads before torch spins up its pool.
+    The model itself is loaded on first use.
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    global _worker_model
+    _worker_model = model_name
+
+
+def worker_encode(texts: list):
+    global _worker_model
+    if isinstance(_worker_model, str):
+        from sentence_transformers import SentenceTransformer
+        _worker_model = SentenceTransformer(_worker_model)
+    # texts arrive length-sorted; one batch so the model doesn't re-split it
+    return _worker_model.encode(texts, batch_size=max(1, len(texts)), convert_to_numpy=True).astype("float32")
+
+
+def _encode_batch(positions: list, texts: list):
+    return positions, worker_encode(texts)
+
+
+# ---------------------------
+# Parent side
+# ---------------------------
+class BatchEncoder:
+    def __init__(self, model_name: str, workers: int = None, threads: int = None, chunk_lines: int = CHUNK_LINES,
+                 batch_tokens: int = BATCH_TOKENS, model=None):
+        cores = os.cpu_count() or 1
+        self.model_name = model_name
+        self.workers = cores if workers is None else workers
+        self.threads = threads or max(1, cores // max(1, self.workers))
+        self.chunk_lines = chunk_lines
+        self.batch_tokens = batch_tokens
+        self.model = model              # used when workers == 0
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None and self.workers:
+            # spawn, not fork: the parent may be a threaded server with torch loaded
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(self.model_name, self.threads),
+            )
+        return self._pool
+
+    def warm_up(self) -> None:
+        """
+        Start the workers and load their models (a few tiny tasks each).
+        """
+        if self.workers:
+            list(self.pool.map(worker_encode, [["warm up"]] * (self.workers * 2)))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _encode_local(self, texts: list):
+        return self.model.encode(texts, batch_size=max(1, len(texts)), convert_to_numpy=True).astype("float32")
+
+    def iter_chunks(self, lines: list):
+        """
+        Yield (start, vectors) per chunk, in original order.
+        """
+        import numpy as np
+
+        for start in range(0, len(lines), self.chunk_lines):
+            chunk = lines[start:start + self.chunk_lines]
+            batches = length_batches(chunk, self.batch_tokens)
+            out = None
+            if self.workers:
+                # largest batches first, so the tail of the chunk isn't one slow straggler
+                batches.sort(key=lambda b: -sum(approx_tokens(chunk[i]) for i in b))
+                futures = [self.pool.submit(_encode_batch, b, [chunk[i] for i in b]) for b in batches]
+                results = (f.result() for f in futures)
+            else:
+                results = ((b, self._encode_local([chunk[i] for i in b])) for b in batches)
+            for positions, vectors in results:
+                if out is None:
+                    out = np.empty((len(chunk), vectors.shape[1]), dtype="float32")
+                out[positions] = vectors
+            yield start, out
+
+    def encode(self, lines: list):
+        import numpy as np
+        return np.concatenate([vectors for _, vectors in self.iter_chunks(lines)])
+
+    def build_index(self, lines: list):
+        """
+        FAISS IndexFlatL2 over `lines`, filled chunk by chunk.
+        """
+        import faiss
+
+        index = None
+        started = time.perf_counter()
+        for _, vectors in self.iter_chunks(lines):
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+        log.info("encoded %d lines in %.1fs", len(lines), time.perf_counter() - started)
+        return index
@@ -0,0 +1,156 @@
+"""
+Sync vs async data layer: latency of the same operations through
+firebase_db.py and firebase_db_async.py.
+
+  - chat view: bot list + bot document + history. Sync reads them one
+    after another; async issues them together (load_chat_view).
+  - history save of a long conversation (many page batches).
+  - registration: read-then-write vs one atomic create, and N
+    concurrent sign-ups for the same name (how many "succeed").
+
+By default both layers run against the in-memory stand-ins in fakes.py
+(one shared document store, `--latency` seconds per round trip). With
+--emulator they run against the Firestore emulator instead
+(FIRESTORE_EMULATOR_HOST must be set, e.g. localhost:8080).
+
+Usage:
+    python bench/bench_async_db.py --latency 0.03 --repeat 20
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python bench/bench_async_db.py --emulator
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+import types
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeAsyncFirestore, FakeFirestore, fake_async_transactional, fake_transactional  # noqa: E402
+
+
+def install_backend(emulator: bool, latency: float):
+    """
+    Register a firebase_config module for both layers. Returns the sync
+    store (a FakeFirestore has round-trip counters; the emulator doesn't).
+    """
+    config_module = types.ModuleType("firebase_config")
+    if emulator:
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            raise SystemExit("set FIRESTORE_EMULATOR_HOST to use --emulator")
+        from google.cloud import firestore
+
+        project = os.getenv("GOOGLE_CLOUD_PROJECT", "bench-async-db")
+        config_module.db = firestore.Client(project=project)
+        config_module.transactional = firestore.transactional
+        config_module.async_db = firestore.AsyncClient(project=project)
+        config_module.async_transactional = firestore.async_transactional
+    else:
+        config_module.db = FakeFirestore(latency=latency)
+        config_module.transactional = fake_transactional
+        config_module.async_db = FakeAsyncFirestore(config_module.db)
+        config_module.async_transactional = fake_async_transactional
+    sys.modules["firebase_config"] = config_module
+    return config_module.db
+
+
+def round_trips(store) -> int:
+    return getattr(store, "round_trips", 0)
+
+
+def seed(firebase_db, user: str, history_len: int) -> str:
+    text = "\n".join(f"line {i} of the corpus" for i in range(2000))
+    bot_ids = [firebase_db.add_bot(user, f"Bot{i}", text, persona="chill") for i in range(3)]
+    history = [{"user": f"msg {i}", "bot": f"reply {i}", "ts": "00:00"} for i in range(history_len)]
+    firebase_db.save_chat_history_cloud(user, bot_ids[0], history)
+    return bot_ids[0]
+
+
+def measure(store, fn, repeat: int) -> dict:
+    times = []
+    trips = round_trips(store)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return {"p50_ms": statistics.median(times) * 1000, "max_ms": max(times) * 1000,
+            "round_trips": (round_trips(store) - trips) / repeat}
+
+
+def race_sync(firebase_db, name: str, n: int) -> int:
+    wins = []
+    threads = [threading.Thread(target=lambda: wins.append(firebase_db.register_user(name, "pw")))
+               for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(wins)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the sync vs async Firestore data layer")
+    parser.add_argument("--latency", type=float, default=0.03, help="fake round-trip latency (s)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--history", type=int, default=2000, help="entries in the seeded history")
+    parser.add_argument("--racers", type=int, default=8, help="concurrent sign-ups for one name")
+    parser.add_argument("--emulator", action="store_true")
+    args = parser.parse_args(argv)
+
+    store = install_backend(args.emulator, args.latency)
+    import firebase_db
+    import firebase_db_async
+
+    user = f"bench-{uuid.uuid4().hex[:8]}"
+    bot_id = seed(firebase_db, user, args.history)
+    history = firebase_db.load_chat_history_cloud(user, bot_id)
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+
+    def sync_view():
+        firebase_db.get_user_bots(user)
+        firebase_db.get_bot(user, bot_id)
+        firebase_db.load_chat_history_cloud(user, bot_id)
+
+    def sync_save():
+        firebase_db.save_chat_history_cloud(user, bot_id, history)
+
+    def async_save():
+        run(firebase_db_async.save_chat_history_cloud(user, bot_id, history))
+
+    rows = [
+        ("chat view", "sync", measure(store, sync_view, args.repeat)),
+        ("chat view", "async", measure(store, lambda: run(firebase_db_async.load_chat_view(user, bot_id)),
+                                       args.repeat)),
+        ("history save", "sync", measure(store, sync_save, args.repeat)),
+        ("history save", "async", measure(store, async_save, args.repeat)),
+        ("register", "sync", measure(store, lambda: firebase_db.register_user(uuid.uuid4().hex, "pw"),
+                                     args.repeat)),
+        ("register", "async", measure(store, lambda: run(firebase_db_async.register_user(uuid.uuid4().hex, "pw")),
+                                      args.repeat)),
+    ]
+
+    header = f"{'operation':>14} {'layer':>6} {'p50 ms':>8} {'max ms':>8} {'trips':>6}"
+    print(header)
+    print("-" * len(header))
+    for op, layer, r in rows:
+        trips = f"{r['round_trips']:6.1f}" if not args.emulator else f"{'-':>6}"
+        print(f"{op:>14} {layer:>6} {r['p50_ms']:8.1f} {r['max_ms']:8.1f} {trips}")
+
+    sync_wins = race_sync(firebase_db, f"race-{uuid.uuid4().hex[:8]}", args.racers)
+
+    async def race_async(name):
+        return sum(await asyncio.gather(*(firebase_db_async.register_user(name, "pw") for _ in range(args.racers))))
+
+    async_wins = run(race_async(f"race-{uuid.uuid4().hex[:8]}"))
+    print(f"\n{args.racers} concurrent sign-ups for one name: "
+          f"sync {sync_wins} succeeded, async {async_wins} succeeded (1 is correct)")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Corpus storage benchmark: plain `file_text` documents versus the
+compressed, chunked codec in firebase_db.py.
+
+Seeds bots into the in-memory Firestore from fakes.py and measures, per
+corpus size, the stored bytes, bytes read on a cold and a warm
+`get_bot`, and encode / decode time. With `zstandard` installed a run
+with a dictionary trained on sibling corpora is included.
+
+Usage:
+    python bench/bench_codec.py --lines 2000 20000 200000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeFirestore, fake_transactional  # noqa: E402
+
+fake_db = FakeFirestore()
+config_module = types.ModuleType("firebase_config")
+config_module.db = fake_db
+config_module.transactional = fake_transactional
+sys.modules["firebase_config"] = config_module
+
+import firebase_db  # noqa: E402
+
+WORDS = (
+    "yeah nah lol ok bro tomorrow tonight food pizza movie college exam "
+    "bus late sleep gym coffee chai call later send pic weekend trip "
+    "mom dad class boring same haha wait what really cool nice 😂 🙏"
+).split()
+
+
+def synthetic_corpus(n_lines: int, rng: random.Random) -> str:
+    return "\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+        for _ in range(n_lines)
+    )
+
+
+def timed(fn, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def bytes_read(fn) -> int:
+    before = fake_db.bytes_read
+    fn()
+    return fake_db.bytes_read - before
+
+
+def clear_caches() -> None:
+    firebase_db._corpus_cache.clear()
+    firebase_db._corpus_cache_bytes = 0
+
+
+def run_plain(text: str) -> dict:
+    ref = fake_db.collection("users").document("bench").collection("bots").document("plain")
+    ref.set({"name": "plain", "file_text": text})
+    cold = bytes_read(lambda: firebase_db.get_bot("bench", "plain"))
+    _, decode_s = timed(lambda: firebase_db.get_bot("bench", "plain"), 3)
+    return {"codec": "plain", "stored": len(text.encode("utf-8")), "chunks": 1,
+            "cold_read": cold, "warm_read": cold, "encode_ms": 0.0, "decode_ms": decode_s * 1000}
+
+
+def run_codec(text: str, label: str, dict_id: str = None) -> dict:
+    encoded, encode_s = timed(lambda: firebase_db.encode_corpus(text, dict_id), 3)
+    _, decode_s = timed(lambda: firebase_db.decode_corpus(encoded["codec"], encoded["blob"], dict_id), 3)
+
+    bot_id = firebase_db.add_bot("bench", label, text)
+    clear_caches()
+    cold = bytes_read(lambda: firebase_db.get_bot("bench", bot_id))
+    warm = bytes_read(lambda: firebase_db.get_bot("bench", bot_id))
+    assert firebase_db.get_bot("bench", bot_id)["file_text"] == text
+    meta = fake_db.docs[("users", "bench", "bots", bot_id)]
+    return {"codec": label, "stored": meta["file_stored_bytes"], "chunks": meta["file_chunks"],
+            "cold_read": cold, "warm_read": warm, "encode_ms": encode_s * 1000, "decode_ms": decode_s * 1000}
+
+
+def print_report(n_lines: int, raw_bytes: int, rows: list) -> None:
+    print(f"\n{n_lines} lines, {raw_bytes / 1024:.0f} KiB raw")
+    header = f"{'codec':>10} {'stored KiB':>11} {'ratio':>6} {'chunks':>6} {'cold KiB':>9} {'warm KiB':>9} {'enc ms':>8} {'dec ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['codec']:>10} {r['stored'] / 1024:11.1f} {raw_bytes / max(1, r['stored']):6.1f} {r['chunks']:6d} "
+            f"{r['cold_read'] / 1024:9.1f} {r['warm_read'] / 1024:9.1f} {r['encode_ms']:8.1f} {r['decode_ms']:8.1f}"
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark compressed bot corpus storage")
+    parser.add_argument("--lines", type=int, nargs="+", default=[2000, 20000, 200000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    dict_id = None
+    if firebase_db.zstandard is not None:
+        samples = [synthetic_corpus(500, rng) for _ in range(64)]
+        dict_id = firebase_db.train_corpus_dictionary(samples)
+
+    for n_lines in args.lines:
+        text = synthetic_corpus(n_lines, rng)
+        rows = [run_plain(text)]
+        if dict_id:
+            # the first add_bot already picks up the active dictionary
+            rows.append(run_codec(text, "zstd+dict", dict_id))
+            fake_db.collection("meta").document("codec").set({"active_dict": None})
+            rows.append(run_codec(text, "zstd"))
+            fake_db.collection("meta").document("codec").set({"active_dict": dict_id})
+        else:
+            rows.append(run_codec(text, "zlib"))
+        print_report(n_lines, len(text.encode("utf-8")), rows)
+
+
+if __name__ == "__main__":
+    main()
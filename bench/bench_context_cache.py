@@ -0,0 +1,131 @@
+"""
+Gemini context caching: input tokens and time to first token per turn,
+with the bot's static prompt sent as text every turn vs served from a
+cached-content handle (context_cache.py).
+
+A synthetic bot (persona, rules, a fixed sample of its lines) chats for
+`--turns` turns; each turn's dynamic part is the recent conversation,
+a few "retrieved" lines and the message, built with the same template
+functions as ChatEngine. Both runs send exactly the same text; only the
+way the static prefix travels differs.
+
+By default the model is the stand-in in fakes.py, whose time to first
+token grows with the uncached prompt tokens (`--prefill-ms` per 1000).
+With --live it calls Gemini (GEMINI_API_KEY) and the numbers come from
+the API's own usage metadata; the cache is deleted afterwards.
+
+Usage:
+    python bench/bench_context_cache.py --turns 30
+    GEMINI_API_KEY=... python bench/bench_context_cache.py --live --turns 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import dynamic_prompt, stable_examples, static_prompt  # noqa: E402
+from context_cache import StaticPrefix  # noqa: E402
+from fakes import FakeGenaiClient  # noqa: E402
+from gemini_client import DEFAULT_MODEL, ResilientGemini  # noqa: E402
+
+WORDS = (
+    "yeah nah lol ok bro tomorrow tonight food pizza movie college exam "
+    "bus late sleep gym coffee chai call later send pic weekend trip "
+    "mom dad class boring same haha wait what really cool nice"
+).split()
+
+
+def synthetic_bot(rng: random.Random, lines: int = 3000) -> str:
+    return "\n".join(f"Sam: {' '.join(rng.choices(WORDS, k=rng.randint(3, 12)))}" for _ in range(lines))
+
+
+def run(llm: ResilientGemini, model: str, static: str, bot_lines: list, turns: int, cached: bool,
+        seed: int) -> list:
+    rng = random.Random(seed)
+    prefix = StaticPrefix(static, label="bench")
+    history = []
+    rows = []
+    for _ in range(turns):
+        message = " ".join(rng.choices(WORDS, k=rng.randint(3, 10)))
+        retrieved = "\n".join(rng.sample(bot_lines, 12))
+        dynamic = dynamic_prompt("Sam", history, retrieved, message)
+        usage = {}
+        started = time.perf_counter()
+        first = None
+        reply = ""
+        if cached:
+            chunks = llm.stream(dynamic, model=model, usage=usage, prefix=prefix)
+        else:
+            chunks = llm.stream(static + dynamic, model=model, usage=usage)
+        for text in chunks:
+            if first is None:
+                first = time.perf_counter() - started
+            reply += text
+        history.append({"user": message, "bot": reply.strip(), "ts": "00:00"})
+        rows.append({"ttft": first or 0.0, "prompt": usage.get("prompt", 0), "cached": usage.get("cached", 0)})
+    return rows
+
+
+def summarize(label: str, rows: list) -> None:
+    ttfts = sorted(r["ttft"] for r in rows)
+    prompt = sum(r["prompt"] for r in rows)
+    cached = sum(r["cached"] for r in rows)
+    print(f"{label:>9} {prompt / len(rows):9.0f} {(prompt - cached) / len(rows):9.0f} {cached / len(rows):8.0f} "
+          f"{statistics.median(ttfts) * 1000:8.0f} {ttfts[int(0.95 * (len(ttfts) - 1))] * 1000:8.0f}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Gemini context caching of the static prompt")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--first-token-ms", type=float, default=80, help="fake model: fixed time to first token")
+    parser.add_argument("--prefill-ms", type=float, default=150,
+                        help="fake model: extra time to first token per 1000 uncached prompt tokens")
+    parser.add_argument("--live", action="store_true", help="call Gemini (GEMINI_API_KEY) instead of the fake")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if args.live:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise SystemExit("set GEMINI_API_KEY to use --live")
+        from google import genai
+
+        client = genai.Client(api_key=api_key)
+    else:
+        client = FakeGenaiClient(first_token_latency=args.first_token_ms / 1000,
+                                 prefill_latency=args.prefill_ms / 1000 / 1000, per_token_latency=0.001)
+
+    rng = random.Random(args.seed)
+    bot_text = synthetic_bot(rng)
+    static = static_prompt("Sam", "laid-back college student, short replies, teases friends", None,
+                           stable_examples(bot_text))
+    bot_lines = bot_text.splitlines()
+
+    # the fallback model is the same one, so a fallback can't skew the comparison
+    plain = ResilientGemini(client, model=args.model, fallback_model=args.model, requests_per_minute=600)
+    caching = ResilientGemini(client, model=args.model, fallback_model=args.model, requests_per_minute=600,
+                              cache_ttl=600)
+
+    print(f"static prefix: {len(static)} chars; {args.turns} turns per run"
+          f"{' against ' + args.model if args.live else ' against the fake model'}\n")
+    header = f"{'run':>9} {'prompt':>9} {'billed':>9} {'cached':>8} {'ttft p50':>8} {'ttft p95':>8}"
+    print(header + "\n" + " " * 10 + "(tokens per turn; ms)")
+    print("-" * len(header))
+    try:
+        summarize("uncached", run(plain, args.model, static, bot_lines, args.turns, False, args.seed))
+        summarize("cached", run(caching, args.model, static, bot_lines, args.turns, True, args.seed))
+        print(f"\ncontext cache: {caching.context_cache.stats()}")
+    finally:
+        caching.context_cache.clear()
+    print("billed = prompt tokens charged at the full input rate (prompt - cached); the first cached turn "
+          "also pays for creating the handle.")
+
+
+if __name__ == "__main__":
+    main()
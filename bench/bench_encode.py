@@ -0,0 +1,104 @@
+"""
+Ingestion encoder benchmark: lines/sec for building a bot index.
+
+Compares the old path (one `model.encode(lines)` call on one process)
+with batch_encoder.BatchEncoder (length-bucketed batches, optionally
+over a process pool) on a synthetic export with chat-like, heavy-tailed
+message lengths. Also reports the padding overhead of each batching
+(padded tokens / real tokens) and peak RSS of this process and its
+workers.
+
+Usage:
+    python bench/bench_encode.py --lines 50000 200000 --workers 0 2 4
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from batch_encoder import BATCH_TOKENS, BatchEncoder, approx_tokens, length_batches  # noqa: E402
+from chat_engine import EMBED_MODEL_NAME  # noqa: E402
+
+WORDS = (
+    "yeah nah lol ok bro tomorrow tonight food pizza movie college exam "
+    "bus late sleep gym coffee chai call later send pic weekend trip "
+    "mom dad class boring same haha wait what really cool nice"
+).split()
+
+
+def synthetic_lines(n: int, rng: random.Random) -> list:
+    # mostly short chat lines, with a long tail of paragraphs
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(max(2, int(rng.paretovariate(1.3) * 3))))[:1200]
+        for _ in range(n)
+    ]
+
+
+def padding_ratio(lines: list, batches: list) -> float:
+    real = sum(approx_tokens(line) for line in lines)
+    padded = sum(max(approx_tokens(lines[i]) for i in b) * len(b) for b in batches)
+    return padded / max(1, real)
+
+
+def peak_rss_mb(who) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_baseline(model, lines: list) -> dict:
+    started = time.perf_counter()
+    model.encode(lines, convert_to_numpy=True)
+    seconds = time.perf_counter() - started
+    # sentence-transformers sorts by length, then cuts fixed batches of 32
+    order = sorted(range(len(lines)), key=lambda i: -len(lines[i]))
+    batches = [order[i:i + 32] for i in range(0, len(order), 32)]
+    return {"mode": "baseline", "seconds": seconds, "padding": padding_ratio(lines, batches)}
+
+
+def run_encoder(encoder: BatchEncoder, lines: list) -> dict:
+    started = time.perf_counter()
+    index = encoder.build_index(lines)
+    seconds = time.perf_counter() - started
+    assert index.ntotal == len(lines)
+    return {"mode": f"bucketed w={encoder.workers} t={encoder.threads}", "seconds": seconds,
+            "padding": padding_ratio(lines, length_batches(lines, BATCH_TOKENS))}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion encoder")
+    parser.add_argument("--lines", type=int, nargs="+", default=[50000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4],
+                        help="pool sizes to try (0: bucketed, in-process)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(EMBED_MODEL_NAME)
+    rng = random.Random(args.seed)
+    header = f"{'lines':>8} {'mode':>22} {'seconds':>8} {'lines/s':>9} {'padding':>8}"
+    print(header)
+    print("-" * len(header))
+    for n in args.lines:
+        lines = synthetic_lines(n, rng)
+        rows = [run_baseline(model, lines)]
+        for workers in args.workers:
+            encoder = BatchEncoder(EMBED_MODEL_NAME, workers=workers, model=model)
+            encoder.warm_up()
+            try:
+                rows.append(run_encoder(encoder, lines))
+            finally:
+                encoder.close()
+        for r in rows:
+            print(f"{n:8d} {r['mode']:>22} {r['seconds']:8.1f} {n / r['seconds']:9.0f} {r['padding']:7.2f}x")
+    print(f"\npeak RSS: parent {peak_rss_mb(resource.RUSAGE_SELF):.0f} MB, "
+          f"largest worker {peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
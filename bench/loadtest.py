@@ -0,0 +1,273 @@
+"""
+Headless multi-user load generator for app.py.
+
+Every simulated user drives its own Streamlit `AppTest` session in a
+thread of this process (so the whole run is one "app instance"): log in,
+pick a bot, then send messages on a fixed think-time schedule. Gemini
+and Firestore are replaced by the local stand-ins in fakes.py, with
+configurable latencies, so nothing leaves the machine.
+
+For each concurrency level N it reports:
+  - rerun latency (p50 / p95 / max) of every AppTest run
+  - queueing delay: how late a message was sent versus its schedule,
+    i.e. how far the session fell behind because reruns were too slow
+  - CPU (cores busy) and RSS (current / peak) of the process
+
+Usage:
+    python bench/loadtest.py --users 1 2 4 8 --messages 5 --think 2
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeAsyncFirestore, FakeFirestore, FakeGenaiClient, fake_async_transactional, fake_transactional  # noqa: E402
+
+WORDS = (
+    "yeah nah lol ok bro tomorrow tonight food pizza movie college exam "
+    "bus late sleep gym coffee chai call later send pic weekend trip "
+    "mom dad class boring same haha wait what really cool nice"
+).split()
+
+
+# ---------------------------
+# Stand-in wiring
+# ---------------------------
+def install_fakes(db_latency: float, llm_first_token: float, llm_per_token: float) -> FakeFirestore:
+    """
+    Swap firebase_config and google.genai.Client for local stand-ins.
+    Must run before app.py / firebase_db.py are imported by AppTest.
+    """
+    fake_db = FakeFirestore(latency=db_latency)
+    config_module = types.ModuleType("firebase_config")
+    config_module.db = fake_db
+    config_module.transactional = fake_transactional
+    config_module.async_db = FakeAsyncFirestore(fake_db)
+    config_module.async_transactional = fake_async_transactional
+    sys.modules["firebase_config"] = config_module
+
+    import google.genai as genai
+
+    def make_client(api_key=None, **kwargs):
+        return FakeGenaiClient(
+            api_key=api_key,
+            first_token_latency=llm_first_token,
+            per_token_latency=llm_per_token,
+        )
+
+    genai.Client = make_client
+    os.environ["GEMINI_API_KEY"] = "loadtest"
+    # measure the app, not the quota limiter
+    os.environ.setdefault("GEMINI_RPM", "100000")
+    return fake_db
+
+
+def synthetic_corpus(n_lines: int, rng: random.Random) -> str:
+    return "\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+        for _ in range(n_lines)
+    )
+
+
+def seed_users(level: int, n_users: int, corpus_lines: int, rng: random.Random) -> list:
+    """
+    Create users (one bot each) through firebase_db so documents have
+    exactly the shape the app expects.
+    """
+    from firebase_db import register_user, add_bot
+
+    users = []
+    for i in range(n_users):
+        username = f"load_{level}_{i}"
+        register_user(username, "pw")
+        bot_id = add_bot(username, "Buddy", synthetic_corpus(corpus_lines, rng), persona="chill friend")
+        users.append((username, bot_id))
+    return users
+
+
+# ---------------------------
+# Process metrics
+# ---------------------------
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+# ---------------------------
+# One simulated user
+# ---------------------------
+class SimulatedUser(threading.Thread):
+    def __init__(self, username: str, bot_id: str, args, t0: float, rng: random.Random):
+        super().__init__(daemon=True)
+        self.username = username
+        self.bot_id = bot_id
+        self.args = args
+        self.t0 = t0
+        self.rng = rng
+        self.rerun_latencies = []
+        self.queue_delays = []
+        self.errors = []
+
+    def timed_run(self, at) -> None:
+        start = time.perf_counter()
+        at.run(timeout=self.args.timeout)
+        self.rerun_latencies.append(time.perf_counter() - start)
+        if at.exception:
+            self.errors.append(str(at.exception[0].message))
+
+    def run(self) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=self.args.timeout)
+            self.timed_run(at)
+
+            at.text_input(key="sb_user").input(self.username)
+            at.text_input(key="sb_pass").input("pw")
+            at.sidebar.button[0].click()
+            self.timed_run(at)
+
+            at.selectbox(key="chat_selected_bot").select(self.bot_id)
+            self.timed_run(at)
+
+            for n in range(self.args.messages):
+                scheduled = self.t0 + (n + 1) * self.args.think
+                now = time.perf_counter()
+                if now < scheduled:
+                    time.sleep(scheduled - now)
+                self.queue_delays.append(max(0.0, time.perf_counter() - scheduled))
+
+                message = " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(2, 10)))
+                at.text_input(key="chat_input_box").input(message)
+                at.button(key="send_chat_btn").click()
+                self.timed_run(at)
+        except Exception as e:  # keep the other users running
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+# ---------------------------
+# Driver
+# ---------------------------
+def run_level(level: int, n_users: int, args, fake_db: FakeFirestore, rng: random.Random) -> dict:
+    seeded = seed_users(level, n_users, args.corpus_lines, rng)
+
+    round_trips_before = fake_db.round_trips
+    cpu_before = cpu_seconds()
+    wall_before = time.perf_counter()
+
+    t0 = time.perf_counter() + 0.5
+    users = [SimulatedUser(u, bot_id, args, t0, random.Random(rng.random())) for u, bot_id in seeded]
+    for u in users:
+        u.start()
+
+    samples = []
+    while any(u.is_alive() for u in users):
+        samples.append(rss_bytes())
+        time.sleep(0.25)
+    for u in users:
+        u.join()
+
+    wall = time.perf_counter() - wall_before
+    cpu = cpu_seconds() - cpu_before
+    latencies = [x for u in users for x in u.rerun_latencies]
+    delays = [x for u in users for x in u.queue_delays]
+    errors = [e for u in users for e in u.errors]
+
+    return {
+        "users": n_users,
+        "reruns": len(latencies),
+        "rerun_p50_s": round(percentile(latencies, 50), 4),
+        "rerun_p95_s": round(percentile(latencies, 95), 4),
+        "rerun_max_s": round(max(latencies, default=0.0), 4),
+        "queue_delay_mean_s": round(statistics.fmean(delays), 4) if delays else 0.0,
+        "queue_delay_p95_s": round(percentile(delays, 95), 4),
+        "cpu_cores_busy": round(cpu / wall, 3) if wall else 0.0,
+        "rss_mb": round(max(samples, default=rss_bytes()) / 2**20, 1),
+        "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1),
+        "firestore_round_trips": fake_db.round_trips - round_trips_before,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def print_report(rows: list) -> None:
+    header = (
+        f"{'users':>5} {'reruns':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8} "
+        f"{'q-mean s':>9} {'q-p95 s':>8} {'cpu':>6} {'rss MB':>8} {'peak MB':>8} {'fs rt':>6} {'err':>4}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['users']:>5} {r['reruns']:>6} {r['rerun_p50_s']:>8.3f} {r['rerun_p95_s']:>8.3f} "
+            f"{r['rerun_max_s']:>8.3f} {r['queue_delay_mean_s']:>9.3f} {r['queue_delay_p95_s']:>8.3f} "
+            f"{r['cpu_cores_busy']:>6.2f} {r['rss_mb']:>8.1f} {r['peak_rss_mb']:>8.1f} "
+            f"{r['firestore_round_trips']:>6} {r['errors']:>4}"
+        )
+    for r in rows:
+        if r["first_error"]:
+            print(f"[{r['users']} users] first error: {r['first_error']}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Multi-user load generator for the Chat Builder app")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="concurrency levels to run, one after another")
+    parser.add_argument("--messages", type=int, default=5, help="messages sent per user")
+    parser.add_argument("--think", type=float, default=2.0, help="seconds between a user's messages")
+    parser.add_argument("--corpus-lines", type=int, default=2000, help="lines in each synthetic bot")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="Firestore round trip (s)")
+    parser.add_argument("--llm-first-token", type=float, default=0.4, help="Gemini time to first token (s)")
+    parser.add_argument("--llm-per-token", type=float, default=0.004, help="Gemini time per output token (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AppTest run timeout (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report rows to this file")
+    args = parser.parse_args(argv)
+
+    fake_db = install_fakes(args.db_latency, args.llm_first_token, args.llm_per_token)
+    rng = random.Random(args.seed)
+
+    rows = []
+    for level, n_users in enumerate(args.users):
+        rows.append(run_level(level, n_users, args, fake_db, rng))
+        print(f"done: {n_users} users", file=sys.stderr)
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Portable single-file bot bundle, for moving a bot between nodes or
+environments without re-fetching its corpus and re-encoding it.
+
+Layout (little-endian):
+
+    magic  b"CBBUNDLE"                          8 bytes
+    format version (uint32), header length (uint32)
+    sha256 of the header                        32 bytes
+    header: UTF-8 JSON (bot fields, model, dims, section table)
+    sections, each starting on a 64-byte boundary:
+      corpus         the bot's text (UTF-8)
+      embeddings     one row per corpus line, float16 or int8
+      scales         float32 per-dimension scales (int8 only)
+      index          faiss.serialize_index of the bot's IndexFlatL2
+      message_store  message_store.MessageStore.to_bytes() (optional)
+
+Every section carries its own sha256 in the header. Opening a bundle
+memory-maps the file: embeddings are NumPy views straight into the map,
+and a trusted bundle's index is deserialized from it (a copy, not a
+rebuild). Bundles from elsewhere (uploads) only have their embeddings
+trusted: the index is rebuilt from them, still with no model involved,
+so a crafted index section never reaches faiss.deserialize_index.
+
+    python bot_bundle.py export --user bob --bot <bot_id> john.cbb [--dtype int8]
+    python bot_bundle.py import --user alice john.cbb
+    python bot_bundle.py info john.cbb
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"CBBUNDLE"
+FORMAT_VERSION = 1
+ALIGN = 64
+DTYPES = ("float16", "int8")
+_PREFIX = struct.Struct("<8sII32s")
+
+
+def _pad(n: int) -> int:
+    return -n % ALIGN
+
+
+def quantize(vectors, dtype: str):
+    """
+    float32 rows -> (stored rows, per-dimension scales or None).
+    int8 uses a symmetric scale per dimension.
+    """
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype="float32")
+    if dtype == "float16":
+        return vectors.astype("<f2"), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales).clip(-127, 127).astype("i1"), scales.astype("<f4")
+    raise ValueError(f"unknown embedding dtype {dtype!r}")
+
+
+def dequantize(stored, scales=None):
+    import numpy as np
+
+    if scales is None:
+        return stored.astype("float32")
+    return stored.astype("float32") * np.asarray(scales, dtype="float32")
+
+
+# ---------------------------
+# Writing
+# ---------------------------
+def write_bundle(path: str, bot_text: str, vectors, name: str, persona: str = "", style_profile: dict = None,
+                 index=None, message_store: bytes = None, dtype: str = "float16",
+                 model_name: str = None) -> dict:
+    """
+    Write a bundle. `vectors` has one float32 row per line of `bot_text`
+    (chat_engine.split_bot_lines); `index` is the matching FAISS index, or
+    None to leave it out. Written to a temporary file and renamed, so a
+    reader never sees half a bundle. Returns the header.
+    """
+    import numpy as np
+
+    from chat_engine import EMBED_MODEL_NAME, split_bot_lines
+
+    rows = len(split_bot_lines(bot_text))
+    if len(vectors) != rows:
+        raise ValueError(f"{len(vectors)} embedding rows for {rows} corpus lines")
+    stored, scales = quantize(vectors, dtype)
+    sections = [("corpus", bot_text.encode("utf-8")), ("embeddings", stored.tobytes())]
+    if scales is not None:
+        sections.append(("scales", scales.tobytes()))
+    if index is not None:
+        import faiss
+        sections.append(("index", faiss.serialize_index(index).tobytes()))
+    if message_store:
+        sections.append(("message_store", bytes(message_store)))
+
+    header = {
+        "version": FORMAT_VERSION,
+        "created": int(time.time()),
+        "bot": {"name": name, "persona": persona or "", "style_profile": style_profile or {}},
+        "model": model_name or EMBED_MODEL_NAME,
+        "rows": rows,
+        "dim": int(np.asarray(vectors).shape[1]),
+        "dtype": dtype,
+        "sections": {},
+    }
+    # offsets depend on the header length, which depends on the offsets: fix the
+    # header size first with placeholder offsets, then fill them in
+    table = {key: {"offset": 0, "length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+             for key, data in sections}
+    header["sections"] = table
+    body_start = _PREFIX.size + len(json.dumps(header).encode("utf-8")) + 16 * len(sections)
+    body_start += _pad(body_start)
+    offset = body_start
+    for key, data in sections:
+        table[key]["offset"] = offset
+        offset += len(data) + _pad(len(data))
+    header_bytes = json.dumps(header).encode("utf-8")
+    if _PREFIX.size + len(header_bytes) > body_start:
+        raise ValueError("bundle header outgrew its reserved space")
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes), hashlib.sha256(header_bytes).digest()))
+        f.write(header_bytes)
+        f.write(b"\0" * (body_start - f.tell()))
+        for key, data in sections:
+            f.write(data)
+            f.write(b"\0" * _pad(len(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return header
+
+
+# ---------------------------
+# Reading
+# ---------------------------
+class BotBundle:
+    """
+    An open (memory-mapped) bundle. Use as a context manager or `close()`
+    it; arrays returned by `embeddings()` are views into the map and must
+    not outlive it.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty, not a bot bundle")
+        try:
+            self.header = self._read_header()
+            if verify:
+                self.verify()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self) -> dict:
+        if len(self._map) < _PREFIX.size:
+            raise ValueError(f"{self.path} is not a bot bundle")
+        magic, version, length, digest = _PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a bot bundle")
+        if not 1 <= version <= FORMAT_VERSION:
+            raise ValueError(f"unsupported bot bundle version {version}")
+        header_bytes = self._map[_PREFIX.size:_PREFIX.size + length]
+        if hashlib.sha256(header_bytes).digest() != digest:
+            raise ValueError(f"{self.path}: header checksum mismatch")
+        header = json.loads(header_bytes)
+        for key, entry in header["sections"].items():
+            if entry["offset"] + entry["length"] > len(self._map):
+                raise ValueError(f"{self.path}: section {key} is truncated")
+        self._check_shape(header)
+        return header
+
+    def _check_shape(self, header: dict) -> None:
+        # the header is checksummed, not trusted: sizes must agree with each other
+        rows, dim, dtype = header.get("rows"), header.get("dim"), header.get("dtype")
+        if not (isinstance(rows, int) and isinstance(dim, int) and rows > 0 and dim > 0):
+            raise ValueError(f"{self.path}: bad shape {rows} x {dim}")
+        if dtype not in DTYPES:
+            raise ValueError(f"{self.path}: unknown embedding dtype {dtype!r}")
+        sections = header["sections"]
+        for key in ("corpus", "embeddings"):
+            if key not in sections:
+                raise ValueError(f"{self.path}: no {key} section")
+        if sections["embeddings"]["length"] != rows * dim * (2 if dtype == "float16" else 1):
+            raise ValueError(f"{self.path}: embeddings section doesn't hold {rows} x {dim} {dtype}")
+        if dtype == "int8" and sections.get("scales", {}).get("length") != 4 * dim:
+            raise ValueError(f"{self.path}: int8 embeddings without {dim} scales")
+
+    def check_corpus(self) -> None:
+        """
+        One embedding row per corpus line (chat_engine.split_bot_lines).
+        """
+        from chat_engine import split_bot_lines
+
+        lines = len(split_bot_lines(self.bot_text))
+        if lines != self.header["rows"]:
+            raise ValueError(f"{self.path}: {self.header['rows']} embedding rows for {lines} corpus lines")
+
+    def verify(self) -> None:
+        """
+        Check every section against its sha256 (reads the whole file once).
+        """
+        for key, entry in self.header["sections"].items():
+            if hashlib.sha256(self._section(key)).hexdigest() != entry["sha256"]:
+                raise ValueError(f"{self.path}: section {key} checksum mismatch")
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _section(self, key: str) -> memoryview:
+        entry = self.header["sections"][key]
+        return memoryview(self._map)[entry["offset"]:entry["offset"] + entry["length"]]
+
+    # ----- contents -----
+    @property
+    def name(self) -> str:
+        return self.header["bot"]["name"]
+
+    @property
+    def persona(self) -> str:
+        return self.header["bot"]["persona"]
+
+    @property
+    def style_profile(self) -> dict:
+        return self.header["bot"]["style_profile"]
+
+    @property
+    def bot_text(self) -> str:
+        return str(self._section("corpus"), "utf-8")
+
+    def message_store(self):
+        """
+        The serialized message store (bytes), or None.
+        """
+        return bytes(self._section("message_store")) if "message_store" in self.header["sections"] else None
+
+    def embeddings(self):
+        """
+        Stored rows as a read-only view into the map (float16 or int8).
+        """
+        import numpy as np
+
+        dtype = "<f2" if self.header["dtype"] == "float16" else "i1"
+        return np.frombuffer(self._section("embeddings"), dtype=dtype).reshape(self.header["rows"], self.header["dim"])
+
+    def vectors(self):
+        """
+        Embeddings as float32 (dequantized copy).
+        """
+        import numpy as np
+
+        scales = None
+        if "scales" in self.header["sections"]:
+            scales = np.frombuffer(self._section("scales"), dtype="<f4")
+        return dequantize(self.embeddings(), scales)
+
+    def faiss_index(self, trust_index: bool = False):
+        """
+        The stored FAISS index if `trust_index` (bundles this deployment
+        wrote itself), else one built from the embeddings. A stored index
+        that doesn't match the header's rows / dim is rejected.
+        """
+        import faiss
+        import numpy as np
+
+        if trust_index and "index" in self.header["sections"]:
+            index = faiss.deserialize_index(np.frombuffer(self._section("index"), dtype="uint8"))
+            if index.ntotal != self.header["rows"] or index.d != self.header["dim"]:
+                raise ValueError(f"{self.path}: index holds {index.ntotal} x {index.d}, "
+                                 f"header says {self.header['rows']} x {self.header['dim']}")
+            return index
+        index = faiss.IndexFlatL2(self.header["dim"])
+        index.add(np.ascontiguousarray(self.vectors()))
+        return index
+
+
+def read_bundle(path: str, verify: bool = True) -> BotBundle:
+    return BotBundle(path, verify)
+
+
+# ---------------------------
+# Firestore / retriever glue
+# ---------------------------
+def export_bot(path: str, store, retriever, username: str, bot_id: str, dtype: str = "float16",
+               include_index: bool = True) -> dict:
+    """
+    Bundle a stored bot. The index comes from a local `retriever` (warm if
+    the bot was used recently, built otherwise) and its rows are the
+    embeddings. A sidecar client (index_server.RemoteRetriever) has no
+    local index to hand out, so the lines are encoded through it and the
+    bundle goes without an index section.
+    """
+    from chat_engine import EMBED_MODEL_NAME, split_bot_lines
+
+    bot = store.get_bot(username, bot_id)
+    if bot is None:
+        raise ValueError(f"unknown bot {bot_id}")
+    bot_index = retriever.index_for(bot["file_text"], bot_id)
+    if bot_index is not None:
+        index = bot_index.index
+        vectors = index.reconstruct_n(0, index.ntotal)
+    else:
+        index = None
+        vectors = retriever.encode(split_bot_lines(bot["file_text"]))
+    return write_bundle(path, bot["file_text"], vectors, bot["name"], bot["persona"], bot["style_profile"],
+                        index=index if include_index else None,
+                        message_store=store.get_bot_message_store(username, bot_id) if bot.get("store_sha") else None,
+                        dtype=dtype, model_name=getattr(retriever, "model_name", EMBED_MODEL_NAME))
+
+
+def import_bot(path: str, store, retriever, username: str, name: str = None, trust_index: bool = False) -> str:
+    """
+    Add the bundled bot to `username` and hand its embeddings to
+    `retriever` (Retriever or RemoteRetriever `adopt_bundle`), so the first
+    message doesn't re-encode the corpus. Only with `trust_index` is the
+    stored FAISS index used as is. Returns the new bot ID; raises
+    ValueError for a malformed bundle, before anything is stored.
+    """
+    with read_bundle(path) as bundle:
+        bundle.check_corpus()
+        bot_id = store.add_bot(username, name or bundle.name, bundle.bot_text, persona=bundle.persona or None,
+                               style_profile=bundle.style_profile or None, message_store=bundle.message_store())
+        try:
+            retriever.adopt_bundle(bundle, bot_id, trust_index=trust_index)
+        except ValueError as e:
+            # e.g. embeddings from another model: the index is built from the text on first use
+            log.warning("bundle index not used for %s: %s", bot_id, e)
+    return bot_id
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export / import single-file bot bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("--user", required=True)
+    p.add_argument("--bot", required=True)
+    p.add_argument("--dtype", choices=DTYPES, default="float16")
+    p.add_argument("--no-index", action="store_true", help="leave out the FAISS index (smaller file)")
+    p.add_argument("path")
+    p = sub.add_parser("import")
+    p.add_argument("--user", required=True)
+    p.add_argument("--name", help="display name (default: the bundled one)")
+    p.add_argument("--trust-index", action="store_true",
+                   help="use the bundled FAISS index as is (only for bundles you exported yourself)")
+    p.add_argument("path")
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        started = time.perf_counter()
+        with read_bundle(args.path) as bundle:
+            opened = time.perf_counter() - started
+            header = dict(bundle.header)
+        header["open_verify_s"] = round(opened, 4)
+        print(json.dumps(header, indent=2))
+        return
+
+    import firebase_db
+    from chat_engine import Retriever
+
+    retriever = Retriever()
+    if args.command == "export":
+        header = export_bot(args.path, firebase_db, retriever, args.user, args.bot, args.dtype, not args.no_index)
+        print(f"wrote {args.path}: {header['rows']} rows, {os.path.getsize(args.path) / 2**20:.1f} MB")
+    else:
+        started = time.perf_counter()
+        bot_id = import_bot(args.path, firebase_db, retriever, args.user, args.name, args.trust_index)
+        print(f"imported as {bot_id} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Bulk import: many chat exports of one person (a zip of WhatsApp .txt and
+Instagram message_*.json files) merged into a single bot.
+
+Member files are parsed and embedded in a process pool, one file per
+task. The parent then merges the records in time order, drops the copies
+of messages that appear in more than one export (overlapping exports of
+the same chat), builds the message store and reuses the workers' vectors
+for the index, so nothing is encoded twice. Repeats within one export
+(two "ok"s in the same minute) are real messages and are kept.
+
+    python bulk_import.py exports.zip --name John --alias "John Doe" --workers 4
+
+prints the per-file results and a throughput report; add --user to
+also store the bot.
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_encoder import init_worker, length_batches, worker_encode
+
+log = logging.getLogger(__name__)
+
+MAX_MEMBERS = 200
+MAX_UNCOMPRESSED_BYTES = 512 * 2**20
+
+# Instagram placeholders for non-text messages
+INSTAGRAM_SKIP = ("sent an attachment.", "Liked a message", "reacted ", "shared a story", "sent a voice message.")
+
+
+# ---------------------------
+# Parsing (runs in workers)
+# ---------------------------
+def _fix_mojibake(text: str) -> str:
+    # Instagram JSON stores UTF-8 bytes as latin-1 code points
+    try:
+        return text.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+
+def parse_instagram(data: bytes) -> list:
+    """
+    Instagram message_N.json -> [(ts, speaker, text), ...] oldest first.
+    """
+    doc = json.loads(data)
+    records = []
+    for m in doc.get("messages", []):
+        content = m.get("content")
+        if not content or content.startswith(INSTAGRAM_SKIP) or content.endswith(INSTAGRAM_SKIP):
+            continue
+        ts = int(m["timestamp_ms"]) // 1000 if m.get("timestamp_ms") else -1
+        records.append((ts, _fix_mojibake(m.get("sender_name", "")), _fix_mojibake(content)))
+    records.reverse()
+    return records
+
+
+def normalize(text: str) -> str:
+    # the form MessageStore.bot_text() emits, so vectors can be matched to rows
+    return " ".join(text.split())
+
+
+def _encode(texts: list):
+    # length-bucketed batches (see batch_encoder.py), scattered back into order
+    import numpy as np
+
+    out = None
+    for positions in length_batches(texts):
+        vectors = worker_encode([texts[i] for i in positions])
+        if out is None:
+            out = np.empty((len(texts), vectors.shape[1]), dtype="float32")
+        out[positions] = vectors
+    return out
+
+
+def process_member(name: str, data: bytes, bot_name: str, aliases: list, embed: bool = True) -> dict:
+    """
+    Parse one export, map the person's aliases to `bot_name` and embed
+    the person's distinct lines.
+    """
+    from message_store import parse_export
+
+    started = time.perf_counter()
+    if name.lower().endswith(".json"):
+        records = parse_instagram(data)
+    else:
+        records = parse_export(data.decode("utf-8", "ignore"))
+    names = {a.strip().lower() for a in aliases} | {bot_name.strip().lower()}
+    records = [(ts, bot_name if speaker.strip().lower() in names else speaker, text)
+               for ts, speaker, text in records]
+    texts = sorted({normalize(t) for _, s, t in records if s == bot_name and len(t.split()) > 1})
+    parse_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectors = _encode(texts) if embed and texts else None
+    return {
+        "name": name,
+        "bytes": len(data),
+        "records": records,
+        "texts": texts,
+        "vectors": vectors,
+        "parse_s": parse_s,
+        "embed_s": time.perf_counter() - started,
+    }
+
+
+# ---------------------------
+# Driver (runs in the app / CLI)
+# ---------------------------
+def zip_members(zip_bytes: bytes) -> list:
+    """
+    [(name, bytes)] of the .txt / .json members, with size limits
+    against zip bombs.
+    """
+    members = []
+    total = 0
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if not name.lower().endswith((".txt", ".json")):
+                continue
+            total += info.file_size
+            if len(members) >= MAX_MEMBERS or total > MAX_UNCOMPRESSED_BYTES:
+                raise ValueError("zip is too large to import")
+            members.append((name, zf.read(info)))
+    return members
+
+
+class ImportResult:
+    def __init__(self, bot_text: str, store, vectors, files: list, report: dict):
+        self.bot_text = bot_text
+        self.store = store
+        self.vectors = vectors
+        self.files = files
+        self.report = report
+
+
+def merge_records(per_file: list) -> list:
+    """
+    The records of every file in time order, without the messages that
+    several (overlapping) exports share: a record is kept as many times
+    as the one file holding it most often.
+    """
+    wanted = Counter()
+    for records in per_file:
+        for record, n in Counter(records).items():
+            wanted[record] = max(wanted[record], n)
+    kept = Counter()
+    merged = []
+    for record in sorted((r for records in per_file for r in records), key=lambda r: r[0]):
+        if kept[record] < wanted[record]:
+            kept[record] += 1
+            merged.append(record)
+    return merged
+
+
+def import_zip(zip_bytes: bytes, bot_name: str, aliases: list = (), workers: int = None,
+               model_name: str = None, embed: bool = True, on_file=None) -> ImportResult:
+    """
+    Run the import. `on_file(done, total, file_report)` is called as each
+    member finishes (in completion order), for progress display.
+    """
+    import numpy as np
+
+    from chat_engine import EMBED_MODEL_NAME
+    from message_store import MessageStore
+
+    wall = time.perf_counter()
+    members = zip_members(zip_bytes)
+    if not members:
+        raise ValueError("no .txt or .json exports in the zip")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(members)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    results, files = [], []
+    # spawn, not fork: the parent may be a threaded server with torch loaded
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=init_worker,
+                             initargs=(model_name or EMBED_MODEL_NAME, threads)) as pool:
+        futures = {pool.submit(process_member, name, data, bot_name, list(aliases), embed): name
+                   for name, data in members}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                file_report = {"name": name, "ok": True, "bytes": result["bytes"],
+                               "messages": len(result["records"]), "lines": len(result["texts"]),
+                               "seconds": round(result["parse_s"] + result["embed_s"], 3)}
+            except Exception as e:
+                log.warning("import of %s failed: %s", name, e)
+                file_report = {"name": name, "ok": False, "error": str(e)}
+            files.append(file_report)
+            if on_file:
+                on_file(done, len(members), file_report)
+    pool_s = time.perf_counter() - wall
+
+    started = time.perf_counter()
+    records = sum(len(res["records"]) for res in results)
+    merged = merge_records([res["records"] for res in results])
+    store = MessageStore.from_records(merged, bot_name)
+    bot_text = store.bot_text() if store else ""
+
+    vectors = None
+    if embed and bot_text:
+        by_text = {}
+        for res in results:
+            if res["vectors"] is not None:
+                by_text.update(zip(res["texts"], res["vectors"]))
+        vectors = np.stack([by_text[line] for line in bot_text.split("\n")])
+    merge_s = time.perf_counter() - started
+
+    wall_s = time.perf_counter() - wall
+    lines = bot_text.count("\n") + 1 if bot_text else 0
+    total_bytes = sum(len(data) for _, data in members)
+    report = {
+        "files": len(members),
+        "failed": sum(1 for f in files if not f["ok"]),
+        "workers": workers,
+        "threads_per_worker": threads,
+        "input_mb": round(total_bytes / 2**20, 2),
+        "messages": len(merged),
+        "duplicates_dropped": records - len(merged),
+        "bot_lines": lines,
+        "parse_s": round(sum(res["parse_s"] for res in results), 2),
+        "embed_s": round(sum(res["embed_s"] for res in results), 2),
+        "pool_wall_s": round(pool_s, 2),
+        "merge_s": round(merge_s, 2),
+        "wall_s": round(wall_s, 2),
+        "messages_per_s": round(len(merged) / wall_s, 1) if wall_s else 0.0,
+        "lines_per_s": round(lines / wall_s, 1) if wall_s else 0.0,
+        "mb_per_s": round(total_bytes / 2**20 / wall_s, 2) if wall_s else 0.0,
+    }
+    return ImportResult(bot_text, store, vectors, sorted(files, key=lambda f: f["name"]), report)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Import a zip of chat exports as one bot")
+    parser.add_argument("zip")
+    parser.add_argument("--name", required=True, help="the person's name as it appears in the exports")
+    parser.add_argument("--alias", action="append", default=[], help="other names of the same person")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-embed", action="store_true", help="parse and merge only")
+    parser.add_argument("--user", help="store the bot for this user")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.zip, "rb") as f:
+        data = f.read()
+
+    def progress(done, total, file_report):
+        status = f"{file_report['messages']} msgs, {file_report['lines']} lines, {file_report['seconds']}s" \
+            if file_report["ok"] else f"failed: {file_report['error']}"
+        print(f"[{done}/{total}] {file_report['name']}: {status}")
+
+    result = import_zip(data, args.name, args.alias, args.workers, embed=not args.no_embed, on_file=progress)
+    print(json.dumps(result.report, indent=2))
+    if args.user and result.bot_text:
+        import firebase_db
+        from style_profile import build_profile, describe_profile
+
+        profile = build_profile(result.bot_text.splitlines())
+        bot_id = firebase_db.add_bot(args.user, args.name.capitalize(), result.bot_text,
+                                     persona=describe_profile(profile, short=True), style_profile=profile,
+                                     message_store=result.store.to_bytes())
+        print(f"stored bot {bot_id}")
+
+
+if __name__ == "__main__":
+    main()
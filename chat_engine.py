@@ -0,0 +1,659 @@
+"""
+Chat engine: retrieval, prompt building, generation and persistence for
+one bot reply, independent of Streamlit.
+
+Every user message costs exactly one query encode, one FAISS search
+(plus one over the conversation's own memory, see chat_memory.py) and
+one LLM call. The same engine backs the Streamlit app, the CLI below and
+any other front end:
+
+    engine = ChatEngine(llm=gemini, store=firebase_db, retriever=Retriever())
+    reply = engine.reply(user, bot_id, history)          # sync
+    reply = await engine.areply(user, bot_id, history)   # async
+    for chunk in engine.stream(user, bot_id, history): ...
+
+`history` is the list of {"user", "bot", "ts"} entries; its last entry is
+the pending turn (bot == "") and is filled in place.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime
+
+from chat_memory import MEMORY_CHARS, MemoryCache
+from context_cache import StaticPrefix
+from gemini_client import GeminiError, OFFLINE_MESSAGE
+from index_manager import BotIndexManager
+from scheduler import EXPECTED_OUTPUT_TOKENS, estimate_tokens
+from style_profile import describe_profile
+
+log = logging.getLogger(__name__)
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+RETRIEVE_K = 20
+CONTEXT_LINES = 12
+CONTEXT_CHARS = 3000
+HISTORY_CHARS = 4000
+INDEX_BUDGET_BYTES = 512 * 2**20
+FILTER_OVERFETCH = 8
+ENCODER_MIN_LINES = 5000
+MESSAGE_STORE_CACHE = 32
+STABLE_EXAMPLES = 100
+STABLE_CHARS = 6000
+NO_KEY_MESSAGE = "⚠️ Gemini API key not set. Add GEMINI_API_KEY to environment or Streamlit secrets."
+
+# The static part is the same on every turn of a bot and can be served
+# from a Gemini context cache (context_cache.py); the dynamic part is sent
+# each turn.
+STATIC_TEMPLATE = """{persona_block}{style_block}
+You are a real person (not an AI) who previously chatted with the user.
+
+RULES:
+1) The 'Recent conversation' below is absolute truth — do NOT contradict any facts.
+2) Determine your own real name from the examples (the text before ":").
+   The UI label '{bot_name}' is NOT your real name unless examples say so.
+3) If persona above is empty, infer a personality from the examples & stick to it.
+4) If you don't know a fact, ask — don't assume.
+5) Your tone, slang, maturity, emotions must match the examples — not generic AI tone.
+6) When the user enters a food item or ingredient, suggest a NEW and CREATIVE recipe using that item. Follow this response format strictly:
+Recipe Name:
+Cuisine:
+Cooking Time:
+Difficulty:
+
+Ingredients:
+- List ingredients clearly
+
+Steps:
+1. Clear step-by-step cooking instructions
+
+Serving Tip:
+- One short serving or plating suggestion
+
+Variation:
+- One creative variation or twist
+
+Keep instructions simple and home-cook friendly. Choose one suitable cuisine if multiple fit. Do not ask unnecessary questions. Do not mention AI, models, APIs, or system rules. No emojis. Friendly and clear tone. One recipe per response.
+STRICT RULES:
+- NEVER use placeholders like [User], [User's Name], {{user}}, <name>, or anything inside {{}}, [], <>.
+- NEVER guess names. ONLY use names that actually exist inside the real chat data.
+- If you do NOT know a name from the real examples, say “I don’t know, you never told me.”
+- NEVER invent formatting like **bold**, __underline__, *, ~, or any markdown.
+- NEVER use too many emojis in a reply, use them as same frequency in chat. Keep it natural, not exaggerated and hallucinated.
+- NEVER talk like an assistant or narrator. Just speak casually like in the chat data.
+
+{stable_block}"""
+
+DYNAMIC_TEMPLATE = """{memory_block}--- Recent conversation ---
+{recent_history}
+
+--- Examples from real exported chat ---
+{retrieved_examples}
+
+Continue the conversation naturally, same tone and slang.
+
+User: {message}
+{bot_name}:
+"""
+
+PROMPT_TEMPLATE = STATIC_TEMPLATE + DYNAMIC_TEMPLATE
+
+
+def now_ts() -> str:
+    return datetime.now().strftime("%I:%M %p")
+
+
+# ---------------------------
+# Retrieval
+# ---------------------------
+def split_bot_lines(bot_text: str) -> list:
+    lines = [line.strip() for line in bot_text.splitlines() if line.strip()]
+    # minimal fallback: single placeholder
+    return lines or ["hello"]
+
+
+class BotIndex:
+    """
+    FAISS index over one bot's lines.
+    """
+
+    def __init__(self, index, lines: list):
+        self.index = index
+        self.lines = lines
+
+    def search_rows(self, qvec, k: int = RETRIEVE_K, bitmap=None) -> list:
+        """
+        Row IDs of the nearest lines. `bitmap` (packed little-endian bits,
+        see message_store.py) restricts the search to the rows set in it.
+        """
+        if bitmap is None:
+            _, ids = self.index.search(qvec, k)
+            return [int(i) for i in ids[0] if 0 <= i < len(self.lines)]
+
+        import faiss
+        import numpy as np
+
+        bitmap = np.ascontiguousarray(bitmap, dtype=np.uint8)
+        try:
+            selector = faiss.IDSelectorBitmap(self.index.ntotal, faiss.swig_ptr(bitmap))
+            _, ids = self.index.search(qvec, k, params=faiss.SearchParameters(sel=selector))
+            return [int(i) for i in ids[0] if 0 <= i < len(self.lines)]
+        except (AttributeError, TypeError):
+            # faiss without search-time selectors: over-fetch and filter
+            allowed = np.unpackbits(bitmap, count=self.index.ntotal, bitorder="little").astype(bool)
+            _, ids = self.index.search(qvec, min(self.index.ntotal, k * FILTER_OVERFETCH))
+            return [int(i) for i in ids[0] if 0 <= i < len(self.lines) and allowed[i]][:k]
+
+    def search(self, qvec, k: int = RETRIEVE_K, bitmap=None) -> list:
+        return [self.lines[i] for i in self.search_rows(qvec, k, bitmap)]
+
+
+class Retriever:
+    """
+    Owns the sentence-transformer (loaded once) and a bounded LRU of bot
+    indexes (see index_manager.py), keyed by bot ID + content hash.
+    With `encode_workers`, corpora of ENCODER_MIN_LINES or more are built
+    by a batch_encoder.BatchEncoder process pool instead.
+    """
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME, budget_bytes: int = INDEX_BUDGET_BYTES,
+                 spill_dir: str = None, encode_workers: int = 0):
+        self.model_name = model_name
+        self._model = None
+        self.encoder = None
+        if encode_workers:
+            from batch_encoder import BatchEncoder
+            self.encoder = BatchEncoder(model_name, workers=encode_workers)
+        self._lock = threading.Lock()
+        self.indexes = BotIndexManager(
+            self.build, budget_bytes, spill_dir=spill_dir, load=self.load, save=self.save
+        )
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    def encode(self, texts: list):
+        return self.model.encode(texts, convert_to_numpy=True)
+
+    def build(self, bot_text: str) -> BotIndex:
+        import faiss
+
+        lines = split_bot_lines(bot_text)
+        if self.encoder and len(lines) >= ENCODER_MIN_LINES:
+            return BotIndex(self.encoder.build_index(lines), lines)
+        embeddings = self.encode(lines)
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(embeddings)
+        return BotIndex(index, lines)
+
+    @staticmethod
+    def save(bot_index: BotIndex, path: str) -> None:
+        import faiss
+        faiss.write_index(bot_index.index, path)
+
+    @staticmethod
+    def load(path: str, bot_text: str) -> BotIndex:
+        import faiss
+        return BotIndex(faiss.read_index(path), split_bot_lines(bot_text))
+
+    def adopt(self, bot_text: str, bot_id: str, vectors) -> BotIndex:
+        """
+        Index precomputed embeddings (one row per line of `bot_text`)
+        instead of encoding the corpus again. Raises ValueError if they
+        don't fit the corpus or this model.
+        """
+        import faiss
+        import numpy as np
+
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        lines = split_bot_lines(bot_text)
+        if vectors.ndim != 2 or len(vectors) != len(lines):
+            raise ValueError(f"{len(vectors)} vectors for {len(lines)} lines")
+        dim = self.model.get_sentence_embedding_dimension()
+        if vectors.shape[1] != dim:
+            raise ValueError(f"vectors have {vectors.shape[1]} dimensions, {self.model_name} {dim}")
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        bot_index = BotIndex(index, lines)
+        self.indexes.put(bot_text, bot_id, bot_index)
+        return bot_index
+
+    def adopt_bundle(self, bundle, bot_id: str, trust_index: bool = False) -> BotIndex:
+        """
+        Index the embeddings of an open bot_bundle.BotBundle (no encoding),
+        or take its stored index as is with `trust_index`. Raises
+        ValueError if they don't fit this model or the bundle's corpus.
+        """
+        if bundle.header["model"] != self.model_name:
+            raise ValueError(f"bundle embeddings are from {bundle.header['model']}, not {self.model_name}")
+        dim = self.model.get_sentence_embedding_dimension()
+        if bundle.header["dim"] != dim:
+            raise ValueError(f"bundle embeddings have {bundle.header['dim']} dimensions, {self.model_name} {dim}")
+        bundle.check_corpus()
+        bot_text = bundle.bot_text
+        bot_index = BotIndex(bundle.faiss_index(trust_index), split_bot_lines(bot_text))
+        self.indexes.put(bot_text, bot_id, bot_index)
+        return bot_index
+
+    def index_for(self, bot_text: str, bot_id: str = None) -> BotIndex:
+        return self.indexes.get(bot_text, bot_id)
+
+    def search(self, bot_text: str, qvec, k: int = RETRIEVE_K, bot_id: str = None, bitmap=None) -> list:
+        return self.index_for(bot_text, bot_id).search(qvec, k, bitmap)
+
+    def search_rows(self, bot_text: str, qvec, k: int = RETRIEVE_K, bot_id: str = None, bitmap=None) -> list:
+        return self.index_for(bot_text, bot_id).search_rows(qvec, k, bitmap)
+
+    def evict(self, bot_id: str) -> None:
+        self.indexes.evict(bot_id)
+
+    def stats(self) -> dict:
+        return self.indexes.stats()
+
+
+# ---------------------------
+# Prompt building
+# ---------------------------
+def history_block(history: list, bot_name: str, limit: int = HISTORY_CHARS) -> str:
+    lines = []
+    for entry in history:
+        if "user" in entry:
+            lines.append(f"User: {entry['user']}")
+        if "bot" in entry:
+            lines.append(f"{bot_name}: {entry['bot']}")
+    text = "\n".join(lines)
+    return text[-limit:] if len(text) > limit else text
+
+
+def recent_start(history: list, bot_name: str, limit: int = HISTORY_CHARS) -> int:
+    """
+    Index of the oldest entry that (at least partly) makes it into
+    `history_block(history, bot_name, limit)`.
+    """
+    total = 0
+    for i in range(len(history) - 1, -1, -1):
+        entry = history[i]
+        total += len(f"User: {entry.get('user', '')}\n{bot_name}: {entry.get('bot', '')}\n")
+        if total >= limit:
+            return i
+    return 0
+
+
+def context_block(candidates: list, max_lines: int = CONTEXT_LINES, limit: int = CONTEXT_CHARS) -> str:
+    lines = [c.strip() for c in candidates if len(c.split()) > 2][:max_lines]
+    return "\n".join(lines)[:limit]
+
+
+def stable_examples(bot_text: str, n: int = STABLE_EXAMPLES, limit: int = STABLE_CHARS) -> str:
+    """
+    `n` evenly spaced lines of the bot's chat: a fixed sample of its voice
+    that, unlike the retrieved examples, doesn't change between turns.
+    """
+    lines = [c for c in split_bot_lines(bot_text) if len(c.split()) > 2]
+    if len(lines) > n:
+        step = len(lines) / n
+        lines = [lines[int(i * step)] for i in range(n)]
+    return "\n".join(lines)[:limit]
+
+
+def static_prompt(bot_name: str, persona: str, style_profile: dict = None, stable: str = "") -> str:
+    style = describe_profile(style_profile or {})
+    return STATIC_TEMPLATE.format(
+        persona_block=f"Persona: {persona}\n\n" if persona else "",
+        style_block=f"Writing style (measured from the real chat):\n{style}\n" if style else "",
+        stable_block=f"--- Typical lines from the real chat ---\n{stable}\n\n" if stable else "",
+        bot_name=bot_name,
+    )
+
+
+def dynamic_prompt(bot_name: str, history: list, retrieved: str, message: str, memories: list = None) -> str:
+    """
+    `memories` are older history entries (recalled from chat memory)
+    shown above the recent conversation.
+    """
+    recalled = history_block(memories, bot_name, MEMORY_CHARS) if memories else ""
+    return DYNAMIC_TEMPLATE.format(
+        memory_block=f"--- Earlier in this conversation (relevant) ---\n{recalled}\n\n" if recalled else "",
+        bot_name=bot_name,
+        recent_history=history_block(history, bot_name),
+        retrieved_examples=retrieved,
+        message=message,
+    )
+
+
+def build_prompt(bot_name: str, persona: str, history: list, retrieved: str, message: str,
+                 style_profile: dict = None, memories: list = None, stable: str = "") -> str:
+    return (static_prompt(bot_name, persona, style_profile, stable)
+            + dynamic_prompt(bot_name, history, retrieved, message, memories))
+
+
+class Turn:
+    """
+    Everything prepared for one reply, plus per-stage timings (seconds).
+    With context caching, `prefix` is the static head of `prompt` and
+    `dynamic` the rest.
+    """
+
+    def __init__(self, user, bot, message, prompt="", context="", route=None, timings=None, has_source=True,
+                 prefix: StaticPrefix = None, dynamic=""):
+        self.user = user
+        self.bot = bot
+        self.message = message
+        self.has_source = has_source
+        self.prompt = prompt
+        self.prefix = prefix
+        self.dynamic = dynamic
+        self.context = context
+        self.route = route
+        self.timings = timings or {}
+
+
+# ---------------------------
+# Engine
+# ---------------------------
+class ChatEngine:
+    """
+    `llm` is a gemini_client.ResilientGemini (or None when no key is set),
+    `store` anything with firebase_db's get_bot / save_chat_history_cloud,
+    `router` an optional model_router.ModelRouter, `scheduler` an optional
+    scheduler.GenerationScheduler (shared per process) that queues and
+    meters the LLM calls per user. When the llm has a context cache
+    (GEMINI_CACHE_TTL_S), each bot's static prompt is sent as a cached
+    prefix and only the dynamic part per turn.
+
+    `memories` a chat_memory.MemoryCache; pass a per-process one when the
+    engine itself is rebuilt often (Streamlit reruns). The store also
+    needs load_chat_memory / save_chat_memory for it.
+
+    `filters` (optional, per call) restrict retrieval for bots that have a
+    message store: {"recent_days": 90} or {"since": ts, "until": ts}.
+    """
+
+    def __init__(self, llm, store, retriever: Retriever = None, router=None, memories: MemoryCache = None,
+                 scheduler=None):
+        self.llm = llm
+        self.store = store
+        self.retriever = retriever or Retriever()
+        self.router = router
+        self.scheduler = scheduler
+        self.memories = memories or MemoryCache()
+        self._message_stores = OrderedDict()   # store_sha -> MessageStore
+        self._stores_lock = threading.Lock()
+
+    def message_store(self, user: str, bot: str, bot_data: dict):
+        """
+        The bot's MessageStore, loaded once per content hash, or None.
+        """
+        sha = bot_data.get("store_sha")
+        if not sha:
+            return None
+        with self._stores_lock:
+            store = self._message_stores.get(sha)
+            if store is not None:
+                self._message_stores.move_to_end(sha)
+                return store
+        data = self.store.get_bot_message_store(user, bot)
+        if not data:
+            return None
+        from message_store import MessageStore
+
+        store = MessageStore.from_bytes(data)
+        with self._stores_lock:
+            self._message_stores[sha] = store
+            while len(self._message_stores) > MESSAGE_STORE_CACHE:
+                self._message_stores.popitem(last=False)
+        return store
+
+    def memory(self, user: str, bot: str, history: list):
+        """
+        The conversation's ChatMemory for the completed turns in `history`.
+        A cached one that no longer matches them (the history was cleared
+        or rewritten, maybe by another process) is reloaded from the store,
+        and emptied if the stored one doesn't match either.
+        """
+        memory = self.memories.get(self.store, user, bot)
+        with memory.lock:
+            if memory.matches(history):
+                return memory
+        self.memories.drop(user, bot)
+        memory = self.memories.get(self.store, user, bot)
+        with memory.lock:
+            if not memory.matches(history):
+                memory.reset()
+        return memory
+
+    def _recall(self, user: str, bot: str, history: list, bot_name: str, qvec) -> list:
+        # only turns older than what the recent-history block already shows
+        before = recent_start(history, bot_name)
+        if before <= 0:
+            return []
+        memory = self.memory(user, bot, history)
+        with memory.lock:
+            rows = memory.search(qvec, before)
+        return [history[r] for r in rows]
+
+    def _remember(self, user: str, bot: str, history: list) -> None:
+        """
+        Embed the turns completed since the last call (normally just the
+        one that finished) and persist the changed memory pages.
+        """
+        memory = self.memory(user, bot, history)
+        with memory.lock:
+            if not memory.extend(history, self.retriever.encode, len(history)):
+                return
+            self.store.save_chat_memory(user, bot, memory.dirty_pages(), memory.stale_pages())
+            memory.mark_saved()
+
+    def _retrieve(self, user: str, bot: str, bot_data: dict, bot_text: str, qvec, filters: dict) -> list:
+        store = self.message_store(user, bot, bot_data)
+        # a store built for an older version of the text no longer lines up with the index
+        if store is None or store.n_rows != bot_text.count("\n") + 1:
+            return self.retriever.search(bot_text, qvec, RETRIEVE_K, bot_id=bot)
+        bitmap = store.row_bitmap(**(filters or {}))
+        if bitmap is not None and not bitmap.any():
+            bitmap = None   # nothing in the window: fall back to the whole chat
+        rows = self.retriever.search_rows(bot_text, qvec, RETRIEVE_K, bot_id=bot, bitmap=bitmap)
+        # each hit with the message it answered, as in the export
+        return [store.exchange(r) for r in rows]
+
+    def prepare(self, user: str, bot: str, history: list, bot_data: dict = None, filters: dict = None) -> Turn:
+        """
+        Load the bot (by ID) unless `bot_data` (a firebase_db.get_bot dict)
+        is given, retrieve examples and build the prompt for the pending
+        (last) history entry. No LLM call.
+        """
+        timings = {}
+        message = history[-1].get("user", "")
+
+        t = time.perf_counter()
+        if bot_data is None:
+            bot_data = self.store.get_bot(user, bot) or {}
+        bot_text = bot_data.get("file_text", "")
+        bot_name = bot_data.get("name") or bot
+        timings["load"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        context = ""
+        memories = []
+        if bot_text:
+            # one query embedding for both the bot's examples and the chat memory
+            qvec = self.retriever.encode([message])
+            context = context_block(self._retrieve(user, bot, bot_data, bot_text, qvec, filters))
+            try:
+                memories = self._recall(user, bot, history[:-1], bot_name, qvec)
+            except Exception as e:
+                log.warning("chat memory recall failed for %s/%s: %s", user, bot, e)
+        timings["retrieve"] = time.perf_counter() - t
+
+        route = self.router.route(message, context) if self.router else None
+        dynamic = dynamic_prompt(bot_name, history[:-1], context, message, memories)
+        if not getattr(self.llm, "context_cache", None):
+            prompt = static_prompt(bot_name, bot_data.get("persona", ""), bot_data.get("style_profile")) + dynamic
+            return Turn(user, bot, message, prompt, context, route, timings, has_source=bool(bot_text))
+        # a cached prefix is paid for once, so it can carry a fixed sample of the bot's lines too
+        static = static_prompt(bot_name, bot_data.get("persona", ""), bot_data.get("style_profile"),
+                               stable_examples(bot_text) if bot_text else "")
+        return Turn(user, bot, message, static + dynamic, context, route, timings, has_source=bool(bot_text),
+                    prefix=StaticPrefix(static, label=bot), dynamic=dynamic)
+
+    def _finish(self, turn: Turn, history: list, text: str) -> None:
+        history[-1]["bot"] = text
+        history[-1]["ts"] = now_ts()
+        self.store.save_chat_history_cloud(turn.user, turn.bot, history)
+        if turn.has_source:
+            try:
+                self._remember(turn.user, turn.bot, history)
+            except Exception as e:
+                # memory is an optimization; the reply is already saved
+                log.warning("chat memory update failed for %s/%s: %s", turn.user, turn.bot, e)
+
+    def stream(self, user: str, bot: str, history: list, bot_data: dict = None, filters: dict = None):
+        """
+        Generate the reply for the pending entry, yielding text chunks.
+        The entry is filled in and the history persisted once at the end,
+        also when generation fails or the caller stops reading early (then
+        with the part generated so far).
+        """
+        if not history or not history[-1].get("user"):
+            return
+        try:
+            turn = self.prepare(user, bot, history, bot_data, filters)
+        except Exception:
+            log.exception("preparing a reply failed for %s/%s", user, bot)
+            self._finish(Turn(user, bot, history[-1]["user"], has_source=False), history, OFFLINE_MESSAGE)
+            return
+        if not turn.has_source:
+            self._finish(turn, history, "⚠️ No bot source text available.")
+            return
+        if not self.llm:
+            self._finish(turn, history, NO_KEY_MESSAGE)
+            return
+
+        model = turn.route.model if turn.route else None
+        accumulated = ""
+        usage = {}
+        final = None
+        try:
+            slot = nullcontext(0.0)
+            if self.scheduler:
+                slot = self.scheduler.slot(user, estimate_tokens(turn.prompt) + EXPECTED_OUTPUT_TOKENS)
+            with slot as queued:
+                turn.timings["queue"] = queued
+                started = time.perf_counter()
+                if turn.prefix:
+                    chunks = self.llm.stream(turn.dynamic, model=model, usage=usage, prefix=turn.prefix)
+                else:
+                    chunks = self.llm.stream(turn.prompt, model=model, usage=usage)
+                for text in chunks:
+                    if not accumulated:
+                        turn.timings["first_token"] = time.perf_counter() - started
+                    accumulated += text
+                    history[-1]["bot"] = accumulated
+                    yield text
+                turn.timings["generate"] = time.perf_counter() - started
+            if turn.route:
+                self.router.record(turn.route, turn.timings["generate"])
+            final = accumulated.strip() or OFFLINE_MESSAGE
+        except GeminiError as e:
+            final = accumulated.strip() or e.user_message
+        except Exception:
+            log.exception("generating a reply failed for %s/%s", user, bot)
+            final = accumulated.strip() or OFFLINE_MESSAGE
+        finally:
+            if self.scheduler and (usage or accumulated):
+                self.scheduler.record(user, usage.get("prompt") or estimate_tokens(turn.prompt),
+                                      usage.get("output") or estimate_tokens(accumulated))
+            if final is None:
+                # the caller closed the generator (e.g. the client disconnected)
+                final = accumulated.strip() or OFFLINE_MESSAGE
+            self._finish(turn, history, final)
+
+    def reply(self, user: str, bot: str, history: list, bot_data: dict = None, filters: dict = None) -> str:
+        """
+        Blocking variant of `stream`; returns the final reply text.
+        """
+        for _ in self.stream(user, bot, history, bot_data, filters):
+            pass
+        return history[-1].get("bot", "") if history else ""
+
+    async def areply(self, user: str, bot: str, history: list, bot_data: dict = None, filters: dict = None) -> str:
+        return await asyncio.to_thread(self.reply, user, bot, history, bot_data, filters)
+
+    async def astream(self, user: str, bot: str, history: list, bot_data: dict = None, filters: dict = None):
+        """
+        Async generator over reply chunks; generation runs in a worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # the loop is gone; nobody is reading
+
+        def produce():
+            chunks = self.stream(user, bot, history, bot_data, filters)
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        break
+                    put(chunk)
+            finally:
+                # stops generation and saves the partial reply if the reader left early
+                chunks.close()
+                put(done)
+
+        worker = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            # set when the client disconnects or the generator is closed or cancelled
+            stop.set()
+        await worker
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv=None) -> None:
+    """
+    Chat with a stored bot from the terminal:
+        python chat_engine.py --user bob --bot <bot_id> "hey, what's up?"
+    """
+    import argparse
+    import os
+
+    import firebase_db
+    from gemini_client import client_from_settings
+
+    parser = argparse.ArgumentParser(description="Send one message to a Chat Builder bot")
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--bot", required=True)
+    parser.add_argument("message")
+    args = parser.parse_args(argv)
+
+    engine = ChatEngine(llm=client_from_settings(os.getenv), store=firebase_db)
+    history = firebase_db.load_chat_history_cloud(args.user, args.bot) or []
+    history.append({"user": args.message, "bot": "", "ts": now_ts()})
+    for chunk in engine.stream(args.user, args.bot, history):
+        print(chunk, end="", flush=True)
+    print()
+
+
+if __name__ == "__main__":
+    main()
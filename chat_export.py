@@ -0,0 +1,67 @@
+"""
+Streaming chat history export (txt, JSON, JSONL, optionally gzipped).
+
+`iter_export` turns an iterable of history entries into an iterable of
+bytes chunks, so with `firebase_db.iter_chat_history(..., stream_pages=False)`
+as the source only one history page and one output buffer are in memory
+at a time, however long the conversation is.
+"""
+import json
+import zlib
+
+FORMATS = {
+    "txt": ("text/plain", ".txt"),
+    "json": ("application/json", ".json"),
+    "jsonl": ("application/x-ndjson", ".jsonl"),
+}
+FLUSH_BYTES = 64 * 1024
+
+
+def _render(entries, fmt: str, bot_name: str):
+    if fmt == "txt":
+        for entry in entries:
+            ts = f"[{entry['ts']}] " if entry.get("ts") else ""
+            if entry.get("user"):
+                yield f"{ts}You: {entry['user']}\n"
+            if entry.get("bot"):
+                yield f"{ts}{bot_name}: {entry['bot']}\n"
+    elif fmt == "jsonl":
+        for entry in entries:
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+    elif fmt == "json":
+        yield "["
+        sep = "\n"
+        for entry in entries:
+            yield sep + json.dumps(entry, ensure_ascii=False)
+            sep = ",\n"
+        yield "\n]\n"
+    else:
+        raise ValueError(f"unknown export format {fmt!r}")
+
+
+def iter_export(entries, fmt: str = "txt", bot_name: str = "Bot", compress: bool = False):
+    """
+    Yield the export as bytes chunks of roughly FLUSH_BYTES.
+    """
+    # wbits=31: gzip container, so the output is a regular .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = bytearray()
+    for piece in _render(entries, fmt, bot_name):
+        buf.extend(piece.encode("utf-8"))
+        if len(buf) >= FLUSH_BYTES:
+            out = compressor.compress(bytes(buf)) if compressor else bytes(buf)
+            buf.clear()
+            if out:
+                yield out
+    tail = compressor.compress(bytes(buf)) + compressor.flush() if compressor else bytes(buf)
+    if tail:
+        yield tail
+
+
+def export_filename(bot_name: str, fmt: str, compress: bool = False) -> str:
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in bot_name) or "chat"
+    return f"{safe}{FORMATS[fmt][1]}" + (".gz" if compress else "")
+
+
+def export_mime(fmt: str, compress: bool = False) -> str:
+    return "application/gzip" if compress else FORMATS[fmt][0]
@@ -0,0 +1,191 @@
+"""
+Long-term memory over a user's own conversation with a bot.
+
+Prompts only carry the last HISTORY_CHARS of the chat, so older facts
+fall out of view, while sending the whole history grows the token cost
+without bound. A ChatMemory keeps one embedding per completed turn (the
+user's message and the reply) in a FAISS IndexFlatL2 whose row i is
+history[i]. The query embedding already computed for example retrieval
+is searched against it, and only the few closest turns from before the
+recent window go into the prompt.
+
+Turns are embedded as they complete (ChatEngine._finish). Vectors are
+persisted as float16 pages next to the chat history pages
+(firebase_db.save_chat_memory), MEMORY_PAGE turns per document, so a
+new turn rewrites only the last page. Each page also stores a digest of
+its last turn, so a memory built for a history that was since cleared or
+rewritten (possibly by another process) is recognised and rebuilt.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+MEMORY_K = 4
+MEMORY_CHARS = 1200
+MEMORY_PAGE = 500            # 500 x 384 dims x 2 bytes ~ 375 KB per document
+MEMORY_CACHE = 64
+MEMORY_OVERFETCH = 4
+# squared L2 between unit vectors; 1.2 ~ cosine similarity 0.4
+MEMORY_MAX_DISTANCE = 1.2
+
+
+def turn_text(entry: dict) -> str:
+    return f"User: {entry.get('user', '')}\nBot: {entry.get('bot', '')}"
+
+
+def turn_digest(entry: dict) -> str:
+    return hashlib.sha1(f"{entry.get('ts', '')}\n{turn_text(entry)}".encode("utf-8")).hexdigest()[:16]
+
+
+class ChatMemory:
+    """
+    Turn embeddings of one (user, bot) conversation. Callers hold `lock`
+    around every use, since turns can finish on another thread.
+    """
+
+    def __init__(self, pages: list = ()):
+        self.index = None
+        self.saved = 0               # rows already persisted
+        self.stored_pages = 0        # page documents currently in the store
+        self.tail = None             # turn_digest of the last row (None: unknown)
+        self._page_tails = {}        # page -> turn_digest of its last row, for full pages
+        self.lock = threading.Lock()
+        self._load(pages)
+
+    @property
+    def n_turns(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def _add(self, vectors) -> None:
+        import faiss
+        import numpy as np
+
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if self.index is None:
+            self.index = faiss.IndexFlatL2(vectors.shape[1])
+        self.index.add(vectors)
+
+    def _load(self, pages: list) -> None:
+        """
+        Pages as stored ({"turns", "dim", "vectors"}), in page order. A
+        short page anywhere but at the end means a save was cut off; the
+        rows after it are dropped and re-embedded on the next turn.
+        """
+        import numpy as np
+
+        self.stored_pages = len(pages)
+        for page in pages:
+            vectors = np.frombuffer(page["vectors"], dtype="<f2").reshape(-1, page["dim"])[:page["turns"]]
+            if len(vectors):
+                self._add(vectors)
+                # pages saved before digests existed leave it unknown
+                self.tail = page.get("tail")
+            if page["turns"] < MEMORY_PAGE:
+                break
+        self.saved = self.n_turns
+
+    def reset(self) -> None:
+        # the history was cleared or rewritten; stale pages are replaced on the next save
+        self.index = None
+        self.saved = 0
+        self.tail = None
+        self._page_tails = {}
+
+    def matches(self, history: list) -> bool:
+        """
+        Whether the rows are embeddings of the first n_turns of `history`,
+        judged by the last one.
+        """
+        n = self.n_turns
+        if n > len(history):
+            return False
+        return n == 0 or self.tail is None or turn_digest(history[n - 1]) == self.tail
+
+    def extend(self, history: list, encode, upto: int) -> int:
+        """
+        Embed turns [n_turns, upto) of `history`. Returns how many were added.
+        """
+        start = self.n_turns
+        if upto <= start:
+            return 0
+        self._add(encode([turn_text(entry) for entry in history[start:upto]]))
+        for row in range(start, upto):
+            if (row + 1) % MEMORY_PAGE == 0:
+                self._page_tails[row // MEMORY_PAGE] = turn_digest(history[row])
+        self.tail = turn_digest(history[upto - 1])
+        return upto - start
+
+    def dirty_pages(self) -> dict:
+        """
+        {page number: document} for every page holding unsaved rows.
+        """
+        pages = {}
+        first = self.saved // MEMORY_PAGE
+        for page in range(first, -(-self.n_turns // MEMORY_PAGE)):
+            start = page * MEMORY_PAGE
+            end = min(self.n_turns, start + MEMORY_PAGE)
+            rows = self.index.reconstruct_n(start, end - start)
+            tail = self.tail if end == self.n_turns else self._page_tails.get(page)
+            pages[page] = {"turns": len(rows), "dim": rows.shape[1], "vectors": rows.astype("<f2").tobytes(),
+                           "tail": tail}
+        return pages
+
+    def stale_pages(self) -> range:
+        return range(-(-self.n_turns // MEMORY_PAGE), self.stored_pages)
+
+    def mark_saved(self) -> None:
+        self.saved = self.n_turns
+        self.stored_pages = -(-self.n_turns // MEMORY_PAGE)
+
+    def search(self, qvec, before: int, k: int = MEMORY_K) -> list:
+        """
+        Rows (oldest first) of the turns closest to `qvec` among the first
+        `before`, within MEMORY_MAX_DISTANCE.
+        """
+        before = min(before, self.n_turns)
+        if before <= 0:
+            return []
+        k = min(k, before)
+        try:
+            import faiss
+
+            selector = faiss.IDSelectorRange(0, before)
+            distances, ids = self.index.search(qvec, k, params=faiss.SearchParameters(sel=selector))
+        except (AttributeError, TypeError):
+            # faiss without search-time selectors: over-fetch and filter
+            distances, ids = self.index.search(qvec, min(self.n_turns, k * MEMORY_OVERFETCH))
+        hits = [int(i) for d, i in zip(distances[0], ids[0])
+                if 0 <= i < before and d <= MEMORY_MAX_DISTANCE]
+        return sorted(hits[:k])
+
+
+class MemoryCache:
+    """
+    Per-process LRU of ChatMemory by (user, bot), loaded from `store`
+    (firebase_db's load_chat_memory) on first use.
+    """
+
+    def __init__(self, max_entries: int = MEMORY_CACHE):
+        self.max_entries = max_entries
+        self._memories = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, store, user: str, bot: str) -> ChatMemory:
+        key = (user, bot.lower())
+        with self._lock:
+            memory = self._memories.get(key)
+            if memory is not None:
+                self._memories.move_to_end(key)
+                return memory
+        memory = ChatMemory(store.load_chat_memory(user, bot))
+        with self._lock:
+            # another thread may have loaded it meanwhile; keep the first
+            memory = self._memories.setdefault(key, memory)
+            self._memories.move_to_end(key)
+            while len(self._memories) > self.max_entries:
+                self._memories.popitem(last=False)
+        return memory
+
+    def drop(self, user: str, bot: str) -> None:
+        with self._lock:
+            self._memories.pop((user, bot.lower()), None)
@@ -0,0 +1,178 @@
+"""
+Gemini explicit context caching for the static part of chat prompts.
+
+Every turn of a bot starts with the same rules, persona, style summary
+and a fixed sample of the bot's lines; only the recent history, the
+retrieved examples and the message change. ContextCache keeps one
+cached-content handle (`client.caches.create`) per distinct static
+prefix and model, so a turn sends just the dynamic part plus the
+handle's name, and the model skips re-reading the prefix (cheaper input
+tokens, faster first token).
+
+Handles live for `ttl_s` on the server. One that is used within
+`refresh_s` of expiring gets its TTL extended; the least recently used
+ones beyond `max_entries` are deleted. Prefixes the API refuses to cache
+(too few tokens, unsupported model) are not retried for `retry_s`.
+ResilientGemini.stream falls back to sending the full prompt whenever no
+handle is available.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+log = logging.getLogger(__name__)
+
+CACHE_TTL_S = 3600
+REFRESH_S = 600
+RETRY_S = 600
+MAX_CACHES = 64
+
+
+class StaticPrefix:
+    """
+    The cacheable head of a prompt; `label` only names the handle.
+    """
+
+    def __init__(self, text: str, label: str = ""):
+        self.text = text
+        self.label = label
+        self.sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("name", "expires", "failed_at")
+
+    def __init__(self, name: str = None, expires: float = 0.0, failed_at: float = None):
+        self.name = name
+        self.expires = expires
+        self.failed_at = failed_at
+
+
+class ContextCache:
+    """
+    `client` is a google.genai.Client (or fakes.FakeGenaiClient). Share one
+    per process, with the ResilientGemini that owns the client.
+    """
+
+    def __init__(self, client, ttl_s: float = CACHE_TTL_S, refresh_s: float = REFRESH_S,
+                 retry_s: float = RETRY_S, max_entries: int = MAX_CACHES):
+        self.client = client
+        self.ttl_s = ttl_s
+        self.refresh_s = min(refresh_s, ttl_s / 2)
+        self.retry_s = retry_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()      # (model, sha) -> _Entry
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def handle(self, model: str, prefix: StaticPrefix):
+        """
+        Name of a live cached-content handle for `prefix` on `model`,
+        creating or refreshing it as needed; None if there is none.
+        """
+        key = (model, prefix.sha)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            build_lock = self._locks.setdefault(key, threading.Lock())
+        now = time.time()
+        if entry is not None and entry.failed_at is not None and now - entry.failed_at < self.retry_s:
+            self._count("skipped")
+            return None
+        if entry is not None and entry.name and entry.expires - now > self.refresh_s:
+            self._count("hits")
+            return entry.name
+        # one create / refresh per prefix at a time; other turns wait for its result
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            now = time.time()
+            if entry is not None and entry.name and entry.expires - now > self.refresh_s:
+                self._count("hits")
+                return entry.name
+            if entry is not None and entry.name and entry.expires > now:
+                return self._refresh(key, entry)
+            return self._create(key, model, prefix)
+
+    def _create(self, key, model: str, prefix: StaticPrefix):
+        try:
+            cached = self.client.caches.create(model=model, config={
+                "system_instruction": prefix.text,
+                "ttl": f"{int(self.ttl_s)}s",
+                "display_name": f"chatbuilder-{prefix.label or prefix.sha[:12]}"[:128],
+            })
+        except Exception as e:
+            log.warning("context cache for %s not created: %s", model, e)
+            self._count("create_failed")
+            self._store(key, _Entry(failed_at=time.time()))
+            return None
+        self._count("created")
+        self._store(key, _Entry(cached.name, time.time() + self.ttl_s))
+        return cached.name
+
+    def _refresh(self, key, entry: _Entry):
+        try:
+            self.client.caches.update(name=entry.name, config={"ttl": f"{int(self.ttl_s)}s"})
+        except Exception as e:
+            log.warning("context cache %s not refreshed: %s", entry.name, e)
+            self._count("refresh_failed")
+            # still valid until it expires
+            return entry.name
+        self._count("refreshed")
+        self._store(key, _Entry(entry.name, time.time() + self.ttl_s))
+        return entry.name
+
+    def _store(self, key, entry: _Entry) -> None:
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                old_key, old = self._entries.popitem(last=False)
+                self._locks.pop(old_key, None)
+                if old.name:
+                    evicted.append(old.name)
+        for name in evicted:
+            self._delete(name)
+
+    def _delete(self, name: str) -> None:
+        try:
+            self.client.caches.delete(name=name)
+            self._count("deleted")
+        except Exception as e:
+            log.info("context cache %s not deleted (expires on its own): %s", name, e)
+
+    def invalidate(self, model: str, prefix: StaticPrefix) -> None:
+        """
+        Forget a handle the API rejected (expired or deleted server-side).
+        """
+        with self._lock:
+            entry = self._entries.pop((model, prefix.sha), None)
+        if entry is not None and entry.name:
+            self._count("invalidated")
+
+    def clear(self) -> None:
+        """
+        Delete every handle now rather than leaving them to expire.
+        """
+        with self._lock:
+            names = [e.name for e in self._entries.values() if e.name]
+            self._entries.clear()
+            self._locks.clear()
+        for name in names:
+            self._delete(name)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            out = dict(self.counters)
+            out["active"] = sum(1 for e in self._entries.values() if e.name and e.expires > now)
+        return out
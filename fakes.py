@@ -0,0 +1,548 @@
+"""
+Local stand-ins for Firestore and the Gemini client.
+
+These mimic just enough of `google.cloud.firestore` and `google.genai`
+for the app to run without network access (load tests, benchmarks,
+offline development). Each remote call can be given an artificial
+latency so timings stay roughly realistic.
+"""
+import asyncio
+import copy
+import itertools
+import threading
+import time
+from collections import Counter
+
+
+# =========================================================
+# 🔥 Firestore stand-in
+# =========================================================
+def payload_bytes(data) -> int:
+    """
+    Rough wire size of a document: string and bytes field lengths, 8 per
+    scalar, recursing into maps and arrays.
+    """
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    if isinstance(data, dict):
+        return sum(len(k) + payload_bytes(v) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return sum(payload_bytes(v) for v in data)
+    return 8
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, store, path: tuple):
+        self._store = store
+        self._path = path
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
+
+    def collection(self, name: str) -> "FakeCollectionRef":
+        return FakeCollectionRef(self._store, self._path + (name,))
+
+    def get(self, transaction=None) -> FakeSnapshot:
+        if transaction is None:
+            self._store.round_trip()
+        with self._store.lock:
+            data = copy.deepcopy(self._store.docs.get(self._path))
+            self._store.bytes_read += payload_bytes(data)
+        return FakeSnapshot(self.id, data)
+
+    def set(self, data: dict, merge: bool = False) -> None:
+        self._store.round_trip()
+        with self._store.lock:
+            if merge and self._path in self._store.docs:
+                self._store.docs[self._path].update(copy.deepcopy(data))
+            else:
+                self._store.docs[self._path] = copy.deepcopy(data)
+
+    def update(self, data: dict) -> None:
+        self._store.round_trip()
+        with self._store.lock:
+            if self._path not in self._store.docs:
+                raise KeyError(f"No document to update: {'/'.join(self._path)}")
+            self._store.docs[self._path].update(copy.deepcopy(data))
+
+    def delete(self) -> None:
+        self._store.round_trip()
+        with self._store.lock:
+            self._store.docs.pop(self._path, None)
+
+
+class FakeCollectionRef:
+    def __init__(self, store, path: tuple):
+        self._store = store
+        self._path = path
+
+    def document(self, doc_id: str) -> FakeDocumentRef:
+        return FakeDocumentRef(self._store, self._path + (doc_id,))
+
+    def stream(self):
+        self._store.round_trip()
+        depth = len(self._path) + 1
+        with self._store.lock:
+            items = [
+                (path, copy.deepcopy(data))
+                for path, data in sorted(self._store.docs.items())
+                if len(path) == depth and path[:-1] == self._path
+            ]
+            self._store.bytes_read += sum(payload_bytes(data) for _, data in items)
+        for path, data in items:
+            yield FakeSnapshot(path[-1], data)
+
+
+class FakeTransaction:
+    """
+    Buffers writes and applies them together on commit. Reads made through
+    the transaction happen under the store lock (see `fake_transactional`),
+    so the read-modify-write is serialized against other writers.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, ref: FakeDocumentRef, data: dict, merge: bool = False) -> None:
+        self._writes.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref: FakeDocumentRef, data: dict) -> None:
+        self._writes.append(lambda: ref.update(data))
+
+    def delete(self, ref: FakeDocumentRef) -> None:
+        self._writes.append(ref.delete)
+
+    def commit(self) -> None:
+        writes, self._writes = self._writes, []
+        for write in writes:
+            write()
+
+
+class FakeWriteBatch:
+    """
+    Stand-in for `db.batch()`: buffered writes applied atomically in a
+    single round trip on commit.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, ref: FakeDocumentRef, data: dict, merge: bool = False) -> None:
+        self._writes.append(("set", ref._path, copy.deepcopy(data), merge))
+
+    def update(self, ref: FakeDocumentRef, data: dict) -> None:
+        self._writes.append(("update", ref._path, copy.deepcopy(data), True))
+
+    def delete(self, ref: FakeDocumentRef) -> None:
+        self._writes.append(("delete", ref._path, None, False))
+
+    def commit(self) -> None:
+        self._store.round_trip()
+        self._apply()
+
+    def _apply(self) -> None:
+        writes, self._writes = self._writes, []
+        docs = self._store.docs
+        with self._store.lock:
+            for op, path, data, merge in writes:
+                if op == "update" and path not in docs:
+                    raise KeyError(f"No document to update: {'/'.join(path)}")
+            for op, path, data, merge in writes:
+                if op == "delete":
+                    docs.pop(path, None)
+                elif merge and path in docs:
+                    docs[path].update(data)
+                else:
+                    docs[path] = data
+
+
+def fake_transactional(fn):
+    """
+    Stand-in for `firestore.transactional`: runs `fn(transaction, ...)`
+    while holding the store lock, then commits its buffered writes.
+    """
+    def wrapper(transaction, *args, **kwargs):
+        store = transaction._store
+        with store.lock:
+            store.round_trip()
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return wrapper
+
+
+class FakeFirestore:
+    """
+    In-memory Firestore client. Documents live in a flat dict keyed by
+    their full path tuple, e.g. ("users", "bob", "bots", "john").
+    `latency` (seconds) is slept on every round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.docs = {}
+        self.lock = threading.RLock()
+        self.round_trips = 0
+        self.bytes_read = 0
+
+    def round_trip(self) -> None:
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self, (name,))
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+
+# =========================================================
+# ⚡ Async Firestore stand-in
+# =========================================================
+# Same documents as a FakeFirestore, but every round trip is an
+# `asyncio.sleep`, so concurrent reads overlap like they do on the wire.
+async def _async_round_trip(store) -> None:
+    with store.lock:
+        store.round_trips += 1
+    if store.latency:
+        await asyncio.sleep(store.latency)
+
+
+class FakeAsyncDocumentRef:
+    def __init__(self, store, path: tuple):
+        self._store = store
+        self._path = path
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
+
+    def collection(self, name: str) -> "FakeAsyncCollectionRef":
+        return FakeAsyncCollectionRef(self._store, self._path + (name,))
+
+    async def get(self, transaction=None) -> FakeSnapshot:
+        if transaction is None:
+            await _async_round_trip(self._store)
+        with self._store.lock:
+            data = copy.deepcopy(self._store.docs.get(self._path))
+            self._store.bytes_read += payload_bytes(data)
+        return FakeSnapshot(self.id, data)
+
+    async def create(self, data: dict) -> None:
+        from google.api_core.exceptions import AlreadyExists
+
+        await _async_round_trip(self._store)
+        with self._store.lock:
+            if self._path in self._store.docs:
+                raise AlreadyExists(f"Document already exists: {'/'.join(self._path)}")
+            self._store.docs[self._path] = copy.deepcopy(data)
+
+    async def set(self, data: dict, merge: bool = False) -> None:
+        await _async_round_trip(self._store)
+        with self._store.lock:
+            if merge and self._path in self._store.docs:
+                self._store.docs[self._path].update(copy.deepcopy(data))
+            else:
+                self._store.docs[self._path] = copy.deepcopy(data)
+
+    async def update(self, data: dict) -> None:
+        from google.api_core.exceptions import NotFound
+
+        await _async_round_trip(self._store)
+        with self._store.lock:
+            if self._path not in self._store.docs:
+                raise NotFound(f"No document to update: {'/'.join(self._path)}")
+            self._store.docs[self._path].update(copy.deepcopy(data))
+
+    async def delete(self) -> None:
+        await _async_round_trip(self._store)
+        with self._store.lock:
+            self._store.docs.pop(self._path, None)
+
+
+class FakeAsyncCollectionRef:
+    def __init__(self, store, path: tuple):
+        self._store = store
+        self._path = path
+
+    def document(self, doc_id: str) -> FakeAsyncDocumentRef:
+        return FakeAsyncDocumentRef(self._store, self._path + (doc_id,))
+
+    async def stream(self):
+        await _async_round_trip(self._store)
+        depth = len(self._path) + 1
+        with self._store.lock:
+            items = [
+                (path, copy.deepcopy(data))
+                for path, data in sorted(self._store.docs.items())
+                if len(path) == depth and path[:-1] == self._path
+            ]
+            self._store.bytes_read += sum(payload_bytes(data) for _, data in items)
+        for path, data in items:
+            yield FakeSnapshot(path[-1], data)
+
+
+class FakeAsyncWriteBatch(FakeWriteBatch):
+    async def commit(self) -> None:
+        await _async_round_trip(self._store)
+        self._apply()
+
+
+class FakeAsyncTransaction(FakeWriteBatch):
+    """
+    Writes are buffered like a batch and applied by `fake_async_transactional`.
+    """
+
+
+def fake_async_transactional(fn):
+    """
+    Stand-in for `firestore.async_transactional`: runs `fn(transaction, ...)`
+    under the client's asyncio lock (transactions on one event loop are
+    serialized), then applies its writes in one commit round trip.
+    """
+    async def wrapper(transaction, *args, **kwargs):
+        async with transaction._client.lock:
+            result = await fn(transaction, *args, **kwargs)
+            await _async_round_trip(transaction._store)
+            transaction._apply()
+        return result
+    return wrapper
+
+
+class FakeAsyncFirestore:
+    """
+    Async view of a FakeFirestore (pass one to share its documents and
+    counters with sync code, as the real clients share a database).
+    """
+
+    def __init__(self, store: FakeFirestore = None, latency: float = 0.0):
+        self.store = store or FakeFirestore(latency=latency)
+        self.lock = asyncio.Lock()
+
+    def collection(self, name: str) -> FakeAsyncCollectionRef:
+        return FakeAsyncCollectionRef(self.store, (name,))
+
+    def batch(self) -> FakeAsyncWriteBatch:
+        return FakeAsyncWriteBatch(self.store)
+
+    def transaction(self) -> FakeAsyncTransaction:
+        transaction = FakeAsyncTransaction(self.store)
+        transaction._client = self
+        return transaction
+
+
+# =========================================================
+# ✨ Gemini stand-in
+# =========================================================
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        # like the API, prompt_token_count includes the cached part
+        self.prompt_token_count = prompt_tokens
+        self.cached_content_token_count = cached_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeAPIError(Exception):
+    """
+    Stands in for google.genai.errors.APIError (`code` is the HTTP status).
+    """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def count_tokens(text) -> int:
+    """
+    Rough token estimate (~4 characters per token), good enough for
+    metering and benchmarks against the fake model.
+    """
+    return max(1, len(str(text)) // 4)
+
+
+class FakeCachedContent:
+    def __init__(self, name: str, model: str, tokens: int, expires: float, display_name: str = ""):
+        self.name = name
+        self.model = model
+        self.display_name = display_name
+        self.tokens = tokens
+        self.expires = expires
+
+
+def _ttl_seconds(ttl) -> float:
+    # the API takes durations as "<seconds>s"
+    return float(str(ttl).rstrip("s"))
+
+
+class FakeCaches:
+    """
+    Explicit context caching (`client.caches`): create / get / update /
+    delete, with the API's minimum cacheable size and expiry on TTL.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._items = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, model: str, config: dict) -> FakeCachedContent:
+        client = self._client
+        client.round_trip()
+        tokens = sum(count_tokens(config[k]) for k in ("system_instruction", "contents") if config.get(k))
+        if tokens < client.min_cache_tokens:
+            raise FakeAPIError(400, f"INVALID_ARGUMENT: cached content has {tokens} tokens, "
+                                    f"minimum is {client.min_cache_tokens}")
+        with self._lock:
+            name = f"cachedContents/fake-{next(self._ids)}"
+            cached = FakeCachedContent(name, model, tokens, time.time() + _ttl_seconds(config.get("ttl", "3600s")),
+                                       config.get("display_name", ""))
+            self._items[name] = cached
+            client.calls["caches.create"] += 1
+        return cached
+
+    def get(self, name: str) -> FakeCachedContent:
+        self._client.round_trip()
+        return self._live(name)
+
+    def update(self, name: str, config: dict) -> FakeCachedContent:
+        self._client.round_trip()
+        with self._lock:
+            cached = self._live(name)
+            cached.expires = time.time() + _ttl_seconds(config["ttl"])
+            self._client.calls["caches.update"] += 1
+        return cached
+
+    def delete(self, name: str) -> None:
+        self._client.round_trip()
+        with self._lock:
+            if self._items.pop(name, None) is None:
+                raise FakeAPIError(404, f"NOT_FOUND: {name}")
+            self._client.calls["caches.delete"] += 1
+
+    def _live(self, name: str) -> FakeCachedContent:
+        cached = self._items.get(name)
+        if cached is None or cached.expires <= time.time():
+            self._items.pop(name, None)
+            raise FakeAPIError(404, f"NOT_FOUND: {name}")
+        return cached
+
+    def expire(self, name: str = None) -> None:
+        """
+        Drop one handle (or all) server-side, as if its TTL had run out.
+        """
+        with self._lock:
+            if name is None:
+                self._items.clear()
+            else:
+                self._items.pop(name, None)
+
+
+class FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _reply_for(self, contents) -> str:
+        n = next(self._client.counter)
+        return self._client.replies[n % len(self._client.replies)]
+
+    def _prompt(self, model: str, contents, kwargs) -> tuple:
+        """
+        (prompt tokens, cached tokens, seconds to first token) of a call;
+        cached tokens are not prefilled again.
+        """
+        client = self._client
+        client.calls[model] += 1
+        prompt_tokens = count_tokens(contents)
+        cached_tokens = 0
+        name = (kwargs.get("config") or {}).get("cached_content")
+        if name:
+            cached = client.caches._live(name)
+            if cached.model != model:
+                raise FakeAPIError(400, f"INVALID_ARGUMENT: {name} was created for {cached.model}")
+            cached_tokens = cached.tokens
+            prompt_tokens += cached_tokens
+        ttft = client.first_token_latency + client.prefill_latency * (prompt_tokens - cached_tokens)
+        return prompt_tokens, cached_tokens, ttft
+
+    def generate_content(self, model: str, contents, **kwargs) -> FakeResponse:
+        client = self._client
+        prompt_tokens, cached_tokens, ttft = self._prompt(model, contents, kwargs)
+        text = self._reply_for(contents)
+        time.sleep(ttft + client.per_token_latency * count_tokens(text))
+        return FakeResponse(text, FakeUsage(prompt_tokens, count_tokens(text), cached_tokens))
+
+    def generate_content_stream(self, model: str, contents, **kwargs):
+        client = self._client
+        prompt_tokens, cached_tokens, ttft = self._prompt(model, contents, kwargs)
+        text = self._reply_for(contents)
+        words = text.split(" ")
+        time.sleep(ttft)
+        for i, word in enumerate(words):
+            time.sleep(client.per_token_latency * count_tokens(word))
+            chunk = word if i == len(words) - 1 else word + " "
+            usage = FakeUsage(prompt_tokens, count_tokens(text), cached_tokens) if i == len(words) - 1 else None
+            yield FakeResponse(chunk, usage)
+
+
+class FakeGenaiClient:
+    """
+    Drop-in for `google.genai.Client`. Replies cycle through `replies`;
+    `first_token_latency`, `prefill_latency` (per uncached prompt token)
+    and `per_token_latency` (per output token) shape the timing, and
+    `latency` is the round trip of a `caches` call.
+    """
+
+    def __init__(self, api_key: str = None, first_token_latency: float = 0.3,
+                 per_token_latency: float = 0.005, replies=None, prefill_latency: float = 0.0,
+                 latency: float = 0.0, min_cache_tokens: int = 1024, **kwargs):
+        self.first_token_latency = first_token_latency
+        self.per_token_latency = per_token_latency
+        self.prefill_latency = prefill_latency
+        self.latency = latency
+        self.min_cache_tokens = min_cache_tokens
+        self.replies = replies or [
+            "haha yeah same",
+            "nah i was busy all day, what about you",
+            "lol ok see you tomorrow then",
+        ]
+        self.counter = itertools.count()
+        self.calls = Counter()
+        self.models = FakeModels(self)
+        self.caches = FakeCaches(self)
+
+    def round_trip(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
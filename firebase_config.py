@@ -1,6 +1,6 @@
 import streamlit as st
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 
 # Load Firebase credentials from Streamlit secrets
 firebase_secrets = dict(st.secrets["firebase_service_account"])
@@ -12,4 +12,9 @@ if not firebase_admin._apps:
 
 db = firestore.client()
 
+# exported next to `db` so callers (and local stand-ins) bind both together
+transactional = firestore.transactional
 
+# async client for code running on an event loop (firebase_db_async.py)
+async_db = firestore_async.client()
+async_transactional = firestore.async_transactional
@@ -1,10 +1,23 @@
+import hashlib
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
 import bcrypt
-from firebase_config import db
+from firebase_config import db, transactional
+
+try:
+    import zstandard
+except ImportError:  # zlib fallback keeps the app working without the wheel
+    zstandard = None
 
 # =========================================================
 # 🔖 Firestore Collections
 # =========================================================
 USERS_COLLECTION = "users"
+META_COLLECTION = "meta"
 
 # =========================================================
 # 👤 Authentication Functions
@@ -42,105 +55,519 @@ def login_user(username: str, password: str) -> bool:
     return bcrypt.checkpw(password.encode(), stored.encode())
 
 
+# =========================================================
+# 🎟️ Token Usage (see scheduler.py)
+# =========================================================
+# Kept on the user document:
+#   "token_usage":  {"day": "YYYY-MM-DD" (UTC), "prompt", "output", "total", "lifetime"}
+#   "token_budget": optional per-user daily budget (overrides the default; 0 = unlimited)
+#   "sched_weight": optional scheduling weight (default 1)
+def _usage_view(data: dict, day: str = None) -> dict:
+    usage = dict(data.get("token_usage") or {})
+    if day and usage.get("day") != day:
+        usage = {"day": day, "prompt": 0, "output": 0, "total": 0, "lifetime": usage.get("lifetime", 0)}
+    usage["budget"] = data.get("token_budget")
+    usage["weight"] = data.get("sched_weight")
+    return usage
+
+
+def get_token_usage(username: str) -> dict:
+    """
+    The user's token usage as stored, plus "budget" and "weight"
+    (None when not set on the user).
+    """
+    doc = db.collection(USERS_COLLECTION).document(username).get()
+    return _usage_view(doc.to_dict() if doc.exists else {})
+
+
+def add_token_usage(username: str, day: str, prompt_tokens: int, output_tokens: int) -> dict:
+    """
+    Add one call's tokens to the user's count for `day`, starting a new
+    count when the day changed. Returns the updated usage (as
+    get_token_usage).
+    """
+    ref = db.collection(USERS_COLLECTION).document(username)
+
+    @transactional
+    def _add(transaction):
+        snapshot = ref.get(transaction=transaction)
+        data = snapshot.to_dict() if snapshot.exists else {}
+        usage = _usage_view(data, day)
+        tokens = prompt_tokens + output_tokens
+        stored = {
+            "day": day,
+            "prompt": usage.get("prompt", 0) + prompt_tokens,
+            "output": usage.get("output", 0) + output_tokens,
+            "total": usage.get("total", 0) + tokens,
+            "lifetime": usage.get("lifetime", 0) + tokens,
+        }
+        transaction.set(ref, {"token_usage": stored}, merge=True)
+        return dict(usage, **stored)
+
+    return _add(db.transaction())
+
+
+# =========================================================
+# 🗜️ Corpus Storage Codec
+# =========================================================
+# A bot's corpus is stored compressed in chunk documents
+#   users/{username}/bots/{bot_id}/chunks/{generation}-{0000, 0001, ...}
+# so the bot document itself stays small and is never near Firestore's
+# 1 MiB document cap. The bot document records codec, generation, chunk
+# count, sizes and a content hash; decoded corpora are kept in a small
+# in-process LRU keyed by that hash, so a warm read is one small document
+# fetch. A new corpus is written under a new generation before the bot
+# document points at it, and the old generation is deleted afterwards:
+# the chunks never go through a transaction, whose 500 writes / 10 MiB
+# a large corpus would exceed. Corpora stored before generations existed
+# have plain {0000, 0001, ...} chunks and no generation field.
+CHUNK_BYTES = 900_000
+ZSTD_LEVEL = 9
+CORPUS_CACHE_BYTES = 64 * 2**20
+
+_corpus_cache = OrderedDict()   # sha -> text
+_corpus_cache_bytes = 0
+_dict_cache = {}                # dict_id -> zstandard.ZstdCompressionDict
+_codec_lock = threading.Lock()
+
+
+def _load_dictionary(dict_id: str):
+    if not dict_id or zstandard is None:
+        return None
+    with _codec_lock:
+        cached = _dict_cache.get(dict_id)
+    if cached is None:
+        doc = db.collection(META_COLLECTION).document(f"zstd_dict_{dict_id}").get()
+        if not doc.exists:
+            raise ValueError(f"zstd dictionary {dict_id} not found")
+        cached = zstandard.ZstdCompressionDict(doc.to_dict()["data"])
+        with _codec_lock:
+            _dict_cache[dict_id] = cached
+    return cached
+
+
+def _active_dictionary_id():
+    if zstandard is None:
+        return None
+    doc = db.collection(META_COLLECTION).document("codec").get()
+    return doc.to_dict().get("active_dict") if doc.exists else None
+
+
+def train_corpus_dictionary(samples: list, dict_size: int = 112_640) -> str:
+    """
+    Train a zstd dictionary on sample corpora (e.g. a few existing bots)
+    and make it the one new bots are compressed with.
+    Returns the dictionary ID.
+    """
+    if zstandard is None:
+        raise RuntimeError("zstandard is not installed")
+    data = zstandard.train_dictionary(dict_size, [s.encode("utf-8") for s in samples if s])
+    raw = data.as_bytes()
+    dict_id = hashlib.sha1(raw).hexdigest()[:12]
+    meta = db.collection(META_COLLECTION)
+    meta.document(f"zstd_dict_{dict_id}").set({"data": raw})
+    meta.document("codec").set({"active_dict": dict_id}, merge=True)
+    return dict_id
+
+
+def encode_corpus(data, dict_id: str = None) -> dict:
+    """
+    Compress a corpus (str) or binary payload (bytes).
+    Returns {codec, dict_id, blob, sha, raw_bytes}.
+    """
+    raw = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+    if zstandard is not None:
+        zdict = _load_dictionary(dict_id)
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zdict) if zdict \
+            else zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        codec, blob = "zstd", compressor.compress(raw)
+    else:
+        dict_id = None
+        codec, blob = "zlib", zlib.compress(raw, 9)
+    return {
+        "codec": codec,
+        "dict_id": dict_id,
+        "blob": blob,
+        "sha": hashlib.sha1(raw).hexdigest(),
+        "raw_bytes": len(raw),
+    }
+
+
+def decode_corpus(codec: str, blob: bytes, dict_id: str = None, binary: bool = False):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("bot corpus is zstd-compressed but zstandard is not installed")
+        zdict = _load_dictionary(dict_id)
+        decompressor = zstandard.ZstdDecompressor(dict_data=zdict) if zdict else zstandard.ZstdDecompressor()
+        raw = decompressor.decompress(blob)
+    elif codec == "zlib":
+        raw = zlib.decompress(blob)
+    elif codec == "raw":
+        raw = bytes(blob)
+    else:
+        raise ValueError(f"unknown corpus codec {codec!r}")
+    return raw if binary else raw.decode("utf-8")
+
+
+def _cache_corpus(sha: str, text) -> None:
+    global _corpus_cache_bytes
+    with _codec_lock:
+        if sha in _corpus_cache:
+            _corpus_cache.move_to_end(sha)
+            return
+        _corpus_cache[sha] = text
+        _corpus_cache_bytes += len(text)
+        while _corpus_cache_bytes > CORPUS_CACHE_BYTES and len(_corpus_cache) > 1:
+            _, old = _corpus_cache.popitem(last=False)
+            _corpus_cache_bytes -= len(old)
+
+
+def _cached_corpus(sha: str):
+    with _codec_lock:
+        text = _corpus_cache.get(sha)
+        if text is not None:
+            _corpus_cache.move_to_end(sha)
+        return text
+
+
+def _chunk_collection(field: str) -> str:
+    return "chunks" if field == "file" else f"{field}_chunks"
+
+
+def _chunk_id(generation, i: int) -> str:
+    return f"{generation}-{i:04d}" if generation else f"{i:04d}"
+
+
+def _chunk_generation(doc_id: str):
+    return doc_id.rsplit("-", 1)[0] if "-" in doc_id else None
+
+
+def _encode_chunks(text, field: str = "file"):
+    """
+    Compress `text` (or a bytes payload for fields other than "file") into
+    chunks of a new generation. Returns (chunks, `{field}_*` metadata for
+    the bot document).
+    """
+    # the shared dictionary is trained on chat text; binary payloads go without it
+    encoded = encode_corpus(text, _active_dictionary_id() if isinstance(text, str) else None)
+    blob = encoded["blob"]
+    chunks = [blob[i:i + CHUNK_BYTES] for i in range(0, len(blob), CHUNK_BYTES)] or [b""]
+    _cache_corpus(encoded["sha"], text)
+    meta = {
+        f"{field}_codec": encoded["codec"],
+        f"{field}_gen": uuid.uuid4().hex[:12],
+        f"{field}_chunks": len(chunks),
+        f"{field}_sha": encoded["sha"],
+        f"{field}_raw_bytes": encoded["raw_bytes"],
+        f"{field}_stored_bytes": len(blob),
+    }
+    if encoded["dict_id"]:
+        meta[f"{field}_dict"] = encoded["dict_id"]
+    return chunks, meta
+
+
+def _write_corpus(bot_ref, text, field: str = "file") -> dict:
+    """
+    Write the chunk documents of `text` under a new generation and return
+    the metadata that makes the bot document point at them.
+    """
+    chunks, meta = _encode_chunks(text, field)
+    chunks_ref = bot_ref.collection(_chunk_collection(field))
+    for i, chunk in enumerate(chunks):
+        chunks_ref.document(_chunk_id(meta[f"{field}_gen"], i)).set({"data": chunk})
+    return meta
+
+
+def _stale_chunks(bot_ref, data: dict, field: str = "file") -> list:
+    """
+    References to the chunk documents `data` (a bot document) points at,
+    to delete once the bot document no longer does.
+    """
+    if f"{field}_codec" not in data:
+        return []
+    chunks_ref = bot_ref.collection(_chunk_collection(field))
+    generation = data.get(f"{field}_gen")
+    return [chunks_ref.document(_chunk_id(generation, i)) for i in range(data.get(f"{field}_chunks", 0))]
+
+
+def _delete_docs(refs: list) -> None:
+    for start in range(0, len(refs), BATCH_LIMIT):
+        batch = db.batch()
+        for ref in refs[start:start + BATCH_LIMIT]:
+            batch.delete(ref)
+        batch.commit()
+
+
+def _read_corpus(bot_ref, data: dict, field: str = "file", retry: bool = True):
+    """
+    Return the corpus for a bot document, from the in-process cache when
+    the content hash matches, else by fetching and decoding its chunks.
+    Bots stored before the codec existed still have plain `file_text`;
+    other fields return None when absent.
+    """
+    if f"{field}_codec" not in data:
+        return data.get("file_text", "") if field == "file" else None
+    sha = data.get(f"{field}_sha")
+    if field != "file" and not sha:
+        return None
+    text = _cached_corpus(sha) if sha else None
+    if text is not None:
+        return text
+    generation = data.get(f"{field}_gen")
+    chunks = [doc for doc in bot_ref.collection(_chunk_collection(field)).stream()
+              if _chunk_generation(doc.id) == generation]
+    if len(chunks) != data.get(f"{field}_chunks", len(chunks)):
+        # replaced since `data` was read, and its chunks already deleted
+        fresh = bot_ref.get()
+        if retry and fresh.exists:
+            return _read_corpus(bot_ref, fresh.to_dict(), field, retry=False)
+        raise RuntimeError(f"{field} chunks of {bot_ref.id} changed while reading")
+    blob = b"".join(doc.to_dict().get("data", b"") for doc in chunks)
+    text = decode_corpus(data[f"{field}_codec"], blob, data.get(f"{field}_dict"), binary=field != "file")
+    if sha:
+        _cache_corpus(sha, text)
+    return text
+
+
 # =========================================================
 # 🤖 Bot Management
 # =========================================================
-def add_bot(username: str, name: str, file_text: str, persona: str = None) -> None:
+def _bots_ref(username: str):
+    return db.collection(USERS_COLLECTION).document(username).collection("bots")
+
+
+def add_bot(username: str, name: str, file_text: str, persona: str = None, style_profile: dict = None,
+            message_store: bytes = None) -> str:
     """
     Store bot data inside Firestore:
-      users/{username}/bots/{bot_name}
-    Supports optional 'persona' (personality description).
+      users/{username}/bots/{bot_id}
+      users/{username}/bots/{bot_id}/chunks/*         (compressed corpus)
+      users/{username}/bots/{bot_id}/store_chunks/*   (message store, optional)
+    The ID is immutable; the display name is just a field.
+    Supports optional 'persona' (personality description),
+    'style_profile' (see style_profile.py) and 'message_store'
+    (serialized message_store.MessageStore).
+    Returns the new bot ID.
     """
-    bots_ref = db.collection(USERS_COLLECTION).document(username).collection("bots")
-    bot_data = {
-        "name": name,
-        "file_text": file_text,
-    }
+    bot_id = uuid.uuid4().hex
+    bot_ref = _bots_ref(username).document(bot_id)
+    bot_data = {"name": name}
+    bot_data.update(_write_corpus(bot_ref, file_text))
+    if message_store:
+        bot_data.update(_write_corpus(bot_ref, message_store, field="store"))
     if persona:
         bot_data["persona"] = persona
+    if style_profile:
+        bot_data["style_profile"] = style_profile
 
-    bots_ref.document(name.lower()).set(bot_data)
+    # chunks first, so a visible bot document always has its corpus
+    bot_ref.set(bot_data)
+    return bot_id
 
 
 def get_user_bots(username: str):
     """
     Retrieve all bots for a given user.
-    Returns a list of dicts [{name, file, persona?}, ...]
+    Returns a list of dicts [{id, name, file, persona?, last_used}, ...]
+    Bots created before IDs existed keep their old document key
+    (the lowercased name) as their ID.
     """
-    bots_ref = db.collection(USERS_COLLECTION).document(username).collection("bots").stream()
     bots = []
-    for doc in bots_ref:
+    for doc in _bots_ref(username).stream():
         data = doc.to_dict()
         bots.append({
+            "id": doc.id,
             "name": data.get("name"),
             "file": doc.id,
-            "persona": data.get("persona", "")
+            "persona": data.get("persona", ""),
+            "last_used": data.get("last_used", 0),
         })
     return bots
 
 
-def get_bot_file(username: str, bot_name: str):
+def get_bot(username: str, bot_id: str):
+    """
+    Get a bot's document as a dict {name, file_text, persona, style_profile,
+    store_sha}, or None. `store_sha` is None for bots without a message store.
+    """
+    bot_ref = _bots_ref(username).document(bot_id)
+    doc = bot_ref.get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return {
+        "name": data.get("name") or bot_id,
+        "file_text": _read_corpus(bot_ref, data),
+        "persona": data.get("persona", ""),
+        "style_profile": data.get("style_profile") or {},
+        "store_sha": data.get("store_sha"),
+    }
+
+
+def get_bot_message_store(username: str, bot_id: str):
+    """
+    Serialized message store (bytes) of a bot, or None if it has none.
+    """
+    bot_ref = _bots_ref(username).document(bot_id)
+    doc = bot_ref.get()
+    if not doc.exists:
+        return None
+    return _read_corpus(bot_ref, doc.to_dict(), field="store")
+
+
+def get_bot_file(username: str, bot_id: str):
     """
     Get the bot's full text content and optional persona.
     Returns (file_text, persona)
     """
-    doc_ref = db.collection(USERS_COLLECTION).document(username).collection("bots").document(bot_name.lower()).get()
-    if doc_ref.exists:
-        data = doc_ref.to_dict()
-        return data.get("file_text", ""), data.get("persona", "")
+    bot = get_bot(username, bot_id)
+    if bot:
+        return bot["file_text"], bot["persona"]
     return "", ""
 
 
-def update_bot(username: str, old_name: str, new_name: str, new_file_text: str = None):
+def update_bot(username: str, bot_id: str, new_name: str, new_file_text: str = None) -> bool:
     """
-    Rename a bot or update its file text.
-    Creates a new document and deletes the old one.
+    Rename a bot or update its file text. A new text's chunks are written
+    first; the transaction only switches the bot document over to them,
+    and the chunks it pointed at before are deleted after the commit.
+    Only the changed fields are written; the ID (and with it the chat
+    history and any cached index) stays the same.
+    Returns False if the bot does not exist.
     """
-    user_ref = db.collection(USERS_COLLECTION).document(username)
-    old_ref = user_ref.collection("bots").document(old_name.lower())
-    old_doc = old_ref.get()
+    ref = _bots_ref(username).document(bot_id)
+    changes = {"name": new_name}
+    if new_file_text:
+        changes.update(_write_corpus(ref, new_file_text))
+        # the message store's row IDs point into the old text
+        changes.update({"store_sha": None, "store_chunks": 0})
 
-    if not old_doc.exists:
-        return
+    @transactional
+    def _update(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        transaction.update(ref, changes)
+        return snapshot.to_dict()
 
-    data = old_doc.to_dict()
-    data["name"] = new_name
-    if new_file_text:
-        data["file_text"] = new_file_text
+    old = _update(db.transaction())
+    if not new_file_text:
+        return old is not None
+    if old is None:
+        _delete_docs(_stale_chunks(ref, changes))
+        return False
+    _delete_docs(_stale_chunks(ref, old) + _stale_chunks(ref, old, field="store"))
+    return True
 
-    # Create new doc, then delete old
-    new_ref = user_ref.collection("bots").document(new_name.lower())
-    new_ref.set(data)
-    old_ref.delete()
+
+def delete_bot(username: str, bot_id: str):
+    """
+    Delete a bot, its data and its chat history from Firestore.
+    """
+    user_ref = db.collection(USERS_COLLECTION).document(username)
+    bot_ref = user_ref.collection("bots").document(bot_id)
+    for name in (_chunk_collection("file"), _chunk_collection("store")):
+        for chunk in bot_ref.collection(name).stream():
+            bot_ref.collection(name).document(chunk.id).delete()
+    bot_ref.delete()
+    delete_chat_history_cloud(username, bot_id)
 
 
-def delete_bot(username: str, bot_name: str):
+def touch_bot(username: str, bot_id: str) -> None:
     """
-    Delete a bot and its data from Firestore.
+    Record that the user just opened this bot (for most-recently-used ordering).
     """
-    db.collection(USERS_COLLECTION).document(username).collection("bots").document(bot_name.lower()).delete()
+    doc_ref = _bots_ref(username).document(bot_id)
+    if doc_ref.get().exists:
+        doc_ref.update({"last_used": time.time()})
 
 
-def update_bot_persona(username: str, bot_name: str, persona_text: str):
+def update_bot_persona(username: str, bot_id: str, persona_text: str):
     """
     Update only the persona field for a bot.
     """
-    doc_ref = db.collection(USERS_COLLECTION).document(username).collection("bots").document(bot_name.lower())
+    doc_ref = _bots_ref(username).document(bot_id)
     if doc_ref.get().exists:
         doc_ref.update({"persona": persona_text})
 
 
+def update_bot_style_profile(username: str, bot_id: str, profile: dict):
+    """
+    Update only the style_profile field for a bot.
+    """
+    doc_ref = _bots_ref(username).document(bot_id)
+    if doc_ref.get().exists:
+        doc_ref.update({"style_profile": profile})
+
+
 # =========================================================
 # 💬 Chat History (Cloud Stored)
 # =========================================================
+# History is paged so it can be read (and exported) one page at a time:
+#   users/{user}/chats/{bot_id}                  {"count": n}
+#   users/{user}/chats/{bot_id}/pages/{0000...}  {"entries": [...]}   HISTORY_PAGE entries each
+# Histories saved before paging keep the whole list in the main document's
+# "history" field until their next save.
+HISTORY_PAGE = 200
+BATCH_LIMIT = 450        # Firestore allows 500 writes per batch
+TRANSACTION_WRITES = 16  # pages rewritten in the count-reading transaction (each up to ~1 MiB)
+
+
+def _chat_ref(user: str, bot: str):
+    return db.collection(USERS_COLLECTION).document(user).collection("chats").document(bot.lower())
+
+
+def _pages(count: int) -> int:
+    return -(-count // HISTORY_PAGE)
+
+
+def _history_writes(chat_ref, history: list, stored) -> list:
+    """
+    (ref, data) writes that store `history` over `stored` (the chat's main
+    document as a dict, None if absent); data None deletes. Histories only
+    grow at the end (or are cleared), so only pages from the last stored
+    entry onward are rewritten. The main document comes last.
+    """
+    legacy = stored is not None and "history" in stored
+    old_count = len(stored["history"]) if legacy else (stored or {}).get("count", 0)
+    n = len(history)
+    first = 0 if legacy else max(0, min(old_count, n) - 1) // HISTORY_PAGE
+    pages_ref = chat_ref.collection("pages")
+    writes = [(pages_ref.document(f"{page:04d}"), {"entries": history[page * HISTORY_PAGE:(page + 1) * HISTORY_PAGE]})
+              for page in range(first, _pages(n))]
+    writes += [(pages_ref.document(f"{page:04d}"), None) for page in range(_pages(n), 0 if legacy else _pages(old_count))]
+    writes.append((chat_ref, {"count": n}))
+    return writes
+
+
 def save_chat_history_cloud(user: str, bot: str, history: list) -> None:
     """
     Save chat history to Firestore under:
-      users/{user}/chats/{bot}
+      users/{user}/chats/{bot_id}  (+ /pages/*)
+    The stored count is read in the transaction that writes the changed
+    pages, so saves from other processes can't leave pages behind. A
+    rewrite too large for one transaction (the first save of a long or
+    legacy history) goes out in batches instead.
     """
-    db.collection(USERS_COLLECTION).document(user).collection("chats").document(bot.lower()).set({
-        "history": history
-    })
+    chat_ref = _chat_ref(user, bot)
+
+    @transactional
+    def _save(transaction):
+        doc = chat_ref.get(transaction=transaction)
+        writes = _history_writes(chat_ref, history, doc.to_dict() if doc.exists else None)
+        if len(writes) > TRANSACTION_WRITES:
+            return writes
+        for ref, data in writes:
+            transaction.set(ref, data) if data is not None else transaction.delete(ref)
+        return []
+
+    writes = _save(db.transaction())
+    # the main document goes last, so readers never see a count ahead of its pages
+    for start in range(0, len(writes), BATCH_LIMIT):
+        batch = db.batch()
+        for ref, data in writes[start:start + BATCH_LIMIT]:
+            batch.set(ref, data) if data is not None else batch.delete(ref)
+        batch.commit()
 
 
 def load_chat_history_cloud(user: str, bot: str) -> list:
@@ -148,7 +575,87 @@ def load_chat_history_cloud(user: str, bot: str) -> list:
     Load chat history from Firestore.
     Returns an empty list if no history found.
     """
-    doc = db.collection(USERS_COLLECTION).document(user).collection("chats").document(bot.lower()).get()
-    if doc.exists:
-        return doc.to_dict().get("history", [])
-    return []
+    return list(iter_chat_history(user, bot))
+
+
+def iter_chat_history(user: str, bot: str, stream_pages: bool = True):
+    """
+    Yield history entries oldest first. With `stream_pages=False` pages
+    are fetched one document at a time, so only one page is ever held
+    in memory (used by exports); otherwise one query fetches them all.
+    """
+    chat_ref = _chat_ref(user, bot)
+    doc = chat_ref.get()
+    if not doc.exists:
+        return
+    data = doc.to_dict()
+    if "history" in data:
+        yield from data["history"]
+        return
+    count = data.get("count", 0)
+    pages_ref = chat_ref.collection("pages")
+    if stream_pages:
+        for page_doc in pages_ref.stream():
+            if int(page_doc.id) < _pages(count):
+                yield from page_doc.to_dict().get("entries", [])
+        return
+    for page in range(_pages(count)):
+        page_doc = pages_ref.document(f"{page:04d}").get()
+        if page_doc.exists:
+            yield from page_doc.to_dict().get("entries", [])
+
+
+def load_chat_history_page(user: str, bot: str, offset: int, limit: int):
+    """
+    One slice of the history, reading only the pages it spans.
+    Returns (entries, total).
+    """
+    chat_ref = _chat_ref(user, bot)
+    doc = chat_ref.get()
+    if not doc.exists:
+        return [], 0
+    data = doc.to_dict()
+    if "history" in data:
+        return data["history"][offset:offset + limit], len(data["history"])
+    total = data.get("count", 0)
+    end = min(total, offset + limit)
+    entries = []
+    for page in range(offset // HISTORY_PAGE, _pages(end)):
+        page_doc = chat_ref.collection("pages").document(f"{page:04d}").get()
+        entries.extend(page_doc.to_dict().get("entries", []) if page_doc.exists else [])
+    start = offset - (offset // HISTORY_PAGE) * HISTORY_PAGE
+    return entries[start:start + max(0, end - offset)], total
+
+
+def delete_chat_history_cloud(user: str, bot: str) -> None:
+    chat_ref = _chat_ref(user, bot)
+    for name in ("pages", "memory"):
+        for page_doc in chat_ref.collection(name).stream():
+            chat_ref.collection(name).document(page_doc.id).delete()
+    chat_ref.delete()
+
+
+# =========================================================
+# 🧠 Chat Memory (turn embeddings, see chat_memory.py)
+# =========================================================
+#   users/{user}/chats/{bot_id}/memory/{0000...}  {"turns": t, "dim": d, "vectors": float16 bytes,
+#                                                  "tail": digest of the last turn}
+def save_chat_memory(user: str, bot: str, pages: dict, stale=()) -> None:
+    """
+    Write memory pages ({page number: document}) and delete the page
+    numbers in `stale`, in one batch.
+    """
+    memory_ref = _chat_ref(user, bot).collection("memory")
+    batch = db.batch()
+    for page, data in pages.items():
+        batch.set(memory_ref.document(f"{page:04d}"), data)
+    for page in stale:
+        batch.delete(memory_ref.document(f"{page:04d}"))
+    batch.commit()
+
+
+def load_chat_memory(user: str, bot: str) -> list:
+    """
+    Memory page documents in page order (empty if none).
+    """
+    return [doc.to_dict() for doc in _chat_ref(user, bot).collection("memory").stream()]
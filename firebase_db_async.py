@@ -0,0 +1,293 @@
+"""
+Async variant of the Firestore data layer, on `firestore.AsyncClient`.
+
+Same documents, codecs and caches as firebase_db.py (the two can be used
+side by side), for code that already runs on an event loop, like the
+API server. The difference is in how round trips are spent:
+
+  - reads that don't depend on each other are issued together with
+    `asyncio.gather` (a chat view's bot list, bot document and history
+    cost one round trip of latency instead of four);
+  - registration is a single atomic create-if-absent instead of a read
+    followed by a write, so two sign-ups for one name can't both win;
+  - history page writes go out as concurrent batches, with the main
+    document committed last;
+  - a corpus update writes its chunks concurrently, then switches the
+    bot document over in an async transaction.
+
+The AsyncClient binds to the event loop it is first used on, so this
+module is meant for one long-lived loop per process (uvicorn workers),
+not for Streamlit reruns.
+"""
+import asyncio
+import time
+
+import bcrypt
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+from firebase_config import async_db, async_transactional
+from firebase_db import (
+    BATCH_LIMIT,
+    HISTORY_PAGE,
+    TRANSACTION_WRITES,
+    USERS_COLLECTION,
+    _cache_corpus,
+    _cached_corpus,
+    _chunk_collection,
+    _chunk_generation,
+    _chunk_id,
+    _encode_chunks,
+    _history_writes,
+    _pages,
+    _stale_chunks,
+    decode_corpus,
+)
+
+
+# =========================================================
+# 👤 Authentication Functions
+# =========================================================
+async def register_user(username: str, password: str) -> bool:
+    """
+    Register a new user with hashed password, atomically.
+    Returns False if username already exists.
+    """
+    hashed = await asyncio.to_thread(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
+    try:
+        await async_db.collection(USERS_COLLECTION).document(username).create(
+            {"password": hashed.decode("utf-8", "ignore")})
+    except AlreadyExists:
+        return False
+    return True
+
+
+async def login_user(username: str, password: str) -> bool:
+    """
+    Validate login credentials.
+    Returns True if correct, False otherwise.
+    """
+    if not username:
+        return False
+    doc = await async_db.collection(USERS_COLLECTION).document(username).get()
+    if not doc.exists:
+        return False
+    stored = doc.to_dict().get("password")
+    if not stored:
+        return False
+    # bcrypt is deliberately slow; keep it off the event loop
+    return await asyncio.to_thread(bcrypt.checkpw, password.encode(), stored.encode())
+
+
+# =========================================================
+# 🤖 Bot Management
+# =========================================================
+def _bots_ref(username: str):
+    return async_db.collection(USERS_COLLECTION).document(username).collection("bots")
+
+
+async def _read_corpus(bot_ref, data: dict, field: str = "file", retry: bool = True):
+    # see firebase_db._read_corpus
+    if f"{field}_codec" not in data:
+        return data.get("file_text", "") if field == "file" else None
+    sha = data.get(f"{field}_sha")
+    if field != "file" and not sha:
+        return None
+    text = _cached_corpus(sha) if sha else None
+    if text is not None:
+        return text
+    generation = data.get(f"{field}_gen")
+    chunks = [doc async for doc in bot_ref.collection(_chunk_collection(field)).stream()
+              if _chunk_generation(doc.id) == generation]
+    if len(chunks) != data.get(f"{field}_chunks", len(chunks)):
+        fresh = await bot_ref.get()
+        if retry and fresh.exists:
+            return await _read_corpus(bot_ref, fresh.to_dict(), field, retry=False)
+        raise RuntimeError(f"{field} chunks of {bot_ref.id} changed while reading")
+    blob = b"".join(doc.to_dict().get("data", b"") for doc in chunks)
+    text = await asyncio.to_thread(decode_corpus, data[f"{field}_codec"], blob, data.get(f"{field}_dict"),
+                                   field != "file")
+    if sha:
+        _cache_corpus(sha, text)
+    return text
+
+
+async def get_user_bots(username: str):
+    """
+    Same as firebase_db.get_user_bots.
+    """
+    return [
+        {
+            "id": doc.id,
+            "name": data.get("name"),
+            "file": doc.id,
+            "persona": data.get("persona", ""),
+            "last_used": data.get("last_used", 0),
+        }
+        async for doc in _bots_ref(username).stream()
+        for data in (doc.to_dict(),)
+    ]
+
+
+async def get_bot(username: str, bot_id: str):
+    """
+    Same as firebase_db.get_bot.
+    """
+    bot_ref = _bots_ref(username).document(bot_id)
+    doc = await bot_ref.get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return {
+        "name": data.get("name") or bot_id,
+        "file_text": await _read_corpus(bot_ref, data),
+        "persona": data.get("persona", ""),
+        "style_profile": data.get("style_profile") or {},
+        "store_sha": data.get("store_sha"),
+    }
+
+
+async def update_bot(username: str, bot_id: str, new_name: str, new_file_text: str = None) -> bool:
+    """
+    Same as firebase_db.update_bot: the chunks are written concurrently
+    and compressed off the event loop, the transaction only switches the
+    bot document over to them.
+    """
+    ref = _bots_ref(username).document(bot_id)
+    changes = {"name": new_name}
+    if new_file_text:
+        chunks, meta = await asyncio.to_thread(_encode_chunks, new_file_text)
+        chunks_ref = ref.collection(_chunk_collection("file"))
+        await asyncio.gather(*(chunks_ref.document(_chunk_id(meta["file_gen"], i)).set({"data": chunk})
+                               for i, chunk in enumerate(chunks)))
+        changes.update(meta)
+        changes.update({"store_sha": None, "store_chunks": 0})
+
+    @async_transactional
+    async def _update(transaction):
+        snapshot = await ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        transaction.update(ref, changes)
+        return snapshot.to_dict()
+
+    old = await _update(async_db.transaction())
+    if not new_file_text:
+        return old is not None
+    stale = _stale_chunks(ref, changes) if old is None else \
+        _stale_chunks(ref, old) + _stale_chunks(ref, old, field="store")
+    for start in range(0, len(stale), BATCH_LIMIT):
+        batch = async_db.batch()
+        for chunk_ref in stale[start:start + BATCH_LIMIT]:
+            batch.delete(chunk_ref)
+        await batch.commit()
+    return old is not None
+
+
+async def touch_bot(username: str, bot_id: str) -> None:
+    """
+    Record that the user just opened this bot. One write; a missing bot
+    is reported by the server instead of checked beforehand.
+    """
+    try:
+        await _bots_ref(username).document(bot_id).update({"last_used": time.time()})
+    except NotFound:
+        pass
+
+
+# =========================================================
+# 💬 Chat History (Cloud Stored)
+# =========================================================
+# Paged layout as in firebase_db.py.
+def _chat_ref(user: str, bot: str):
+    return async_db.collection(USERS_COLLECTION).document(user).collection("chats").document(bot.lower())
+
+
+async def _stream(collection_ref) -> list:
+    return [doc async for doc in collection_ref.stream()]
+
+
+async def load_chat_history_cloud(user: str, bot: str) -> list:
+    """
+    Load chat history; the main document and the pages are fetched
+    concurrently. Returns an empty list if no history found.
+    """
+    chat_ref = _chat_ref(user, bot)
+    doc, page_docs = await asyncio.gather(chat_ref.get(), _stream(chat_ref.collection("pages")))
+    if not doc.exists:
+        return []
+    data = doc.to_dict()
+    if "history" in data:
+        return data["history"]
+    count = data.get("count", 0)
+    # pages past the count belong to a save that hasn't committed its main document yet
+    return [entry for page_doc in page_docs if int(page_doc.id) < _pages(count)
+            for entry in page_doc.to_dict().get("entries", [])]
+
+
+async def load_chat_history_page(user: str, bot: str, offset: int, limit: int):
+    """
+    One slice of the history. The pages it spans are fetched together
+    with the main document. Returns (entries, total).
+    """
+    chat_ref = _chat_ref(user, bot)
+    pages_ref = chat_ref.collection("pages")
+    first = offset // HISTORY_PAGE
+    doc, *page_docs = await asyncio.gather(
+        chat_ref.get(), *(pages_ref.document(f"{page:04d}").get() for page in range(first, _pages(offset + limit))))
+    if not doc.exists:
+        return [], 0
+    data = doc.to_dict()
+    if "history" in data:
+        return data["history"][offset:offset + limit], len(data["history"])
+    total = data.get("count", 0)
+    end = min(total, offset + limit)
+    entries = []
+    for page_doc in page_docs[:max(0, _pages(end) - first)]:
+        entries.extend(page_doc.to_dict().get("entries", []) if page_doc.exists else [])
+    start = offset - first * HISTORY_PAGE
+    return entries[start:start + max(0, end - offset)], total
+
+
+async def save_chat_history_cloud(user: str, bot: str, history: list) -> None:
+    """
+    Same writes as firebase_db.save_chat_history_cloud, in an async
+    transaction. A rewrite too large for it goes out as page batches
+    committed concurrently; the batch holding the main document goes
+    last, so readers never see a count ahead of its pages.
+    """
+    chat_ref = _chat_ref(user, bot)
+
+    @async_transactional
+    async def _save(transaction):
+        doc = await chat_ref.get(transaction=transaction)
+        writes = _history_writes(chat_ref, history, doc.to_dict() if doc.exists else None)
+        if len(writes) > TRANSACTION_WRITES:
+            return writes
+        for ref, data in writes:
+            transaction.set(ref, data) if data is not None else transaction.delete(ref)
+        return []
+
+    writes = await _save(async_db.transaction())
+    if not writes:
+        return
+    batches = []
+    for start in range(0, len(writes), BATCH_LIMIT):
+        batch = async_db.batch()
+        for ref, data in writes[start:start + BATCH_LIMIT]:
+            batch.set(ref, data) if data is not None else batch.delete(ref)
+        batches.append(batch)
+    await asyncio.gather(*(batch.commit() for batch in batches[:-1]))
+    await batches[-1].commit()
+
+
+# =========================================================
+# 🧩 Combined Reads
+# =========================================================
+async def load_chat_view(username: str, bot_id: str) -> dict:
+    """
+    Everything the chat screen needs for one bot, read concurrently:
+    {"bots": [...], "bot": {...} or None, "history": [...]}.
+    """
+    bots, bot, history = await asyncio.gather(
+        get_user_bots(username), get_bot(username, bot_id), load_chat_history_cloud(username, bot_id))
+    return {"bots": bots, "bot": bot, "history": history}
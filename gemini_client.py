@@ -0,0 +1,447 @@
+"""
+Resilient wrapper around the google-genai client.
+
+Adds, in front of every `generate_content` / `generate_content_stream`:
+  - a token-bucket rate limiter sized to the API quota
+  - jittered exponential retries for transient errors
+  - per-call deadlines, with at most `max_workers` calls in flight (a call
+    abandoned at its deadline keeps its worker until the HTTP request
+    times out, see client_from_settings)
+  - a circuit breaker per model that fails fast while the API is down
+  - fallback to a secondary model
+  - optional explicit context caching of static prompt prefixes
+    (context_cache.py)
+and keeps counters for all of it (see `ResilientGemini.stats`).
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_FALLBACK_MODEL = "gemini-2.0-flash"
+
+USER_MESSAGES = {
+    "quota": "⚠️API quota exceeded. Please try again later or upgrade your plan.",
+    "not_found": "⚠️Model not available. Please check your API configuration.",
+    "budget": "⚠️You have used today's message budget. Please try again tomorrow.",
+}
+OFFLINE_MESSAGE = "⚠️Offline (Try after sometime)"
+
+RETRYABLE = {"quota", "unavailable", "timeout"}
+
+
+# ---------------------------
+# Errors
+# ---------------------------
+class GeminiError(Exception):
+    """
+    Raised once retries and fallbacks are exhausted.
+    `kind` is one of: quota, not_found, timeout, unavailable, circuit_open, budget, error.
+    """
+
+    def __init__(self, kind: str, message: str = ""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+    @property
+    def user_message(self) -> str:
+        return USER_MESSAGES.get(self.kind, OFFLINE_MESSAGE)
+
+
+def classify_error(exc: Exception) -> str:
+    """
+    Map an exception from google-genai (or the network stack) to an error kind.
+    """
+    if isinstance(exc, GeminiError):
+        return exc.kind
+    # httpx's ReadTimeout / ConnectTimeout / PoolTimeout are not TimeoutErrors
+    if isinstance(exc, (FutureTimeout, TimeoutError)) or type(exc).__name__.endswith("Timeout"):
+        return "timeout"
+    code = getattr(exc, "code", None)
+    text = str(exc)
+    if code == 429 or "RESOURCE_EXHAUSTED" in text:
+        return "quota"
+    if code == 404 or "NOT_FOUND" in text:
+        return "not_found"
+    if code in (500, 502, 503, 504) or any(s in text for s in ("UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED")):
+        return "unavailable"
+    if isinstance(exc, (ConnectionError, OSError)):
+        return "unavailable"
+    return "error"
+
+
+def response_text(resp) -> str:
+    """
+    Pull the text out of a response or stream chunk (dict-like or object-like).
+    """
+    if resp is None:
+        return ""
+    if isinstance(resp, dict):
+        return resp.get("message", {}).get("content", "") or resp.get("text", "") or ""
+    return getattr(resp, "text", None) or ""
+
+
+def record_usage(usage: dict, resp) -> None:
+    """
+    Copy token counts from a response's usage metadata into `usage`
+    (prompt / output / total, and cached: the part of prompt served from
+    a context cache); responses without it leave it untouched.
+    """
+    meta = getattr(resp, "usage_metadata", None)
+    if meta is None:
+        return
+    usage["prompt"] = getattr(meta, "prompt_token_count", None) or 0
+    usage["cached"] = getattr(meta, "cached_content_token_count", None) or 0
+    usage["output"] = getattr(meta, "candidates_token_count", None) or 0
+    usage["total"] = getattr(meta, "total_token_count", None) or usage["prompt"] + usage["output"]
+
+
+# ---------------------------
+# Rate limiter + circuit breaker
+# ---------------------------
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, up to `capacity` banked.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """
+        Block until `tokens` are available. Returns False if that would
+        take longer than `timeout` seconds (the caller should shed the call).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds, then lets a single probe through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a probe that ended without reaching the API (e.g. it was shed)."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+# ---------------------------
+# Client wrapper
+# ---------------------------
+class ResilientGemini:
+    """
+    Wraps a `google.genai.Client`. Create one per process and share it
+    across sessions so the limiter, breakers and counters are global.
+    """
+
+    def __init__(self, client, model: str = DEFAULT_MODEL, fallback_model: str = DEFAULT_FALLBACK_MODEL,
+                 requests_per_minute: float = 10, burst: float = None, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0, deadline: float = 30.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0, max_workers: int = 16,
+                 cache_ttl: float = 0):
+        self.client = client
+        self.context_cache = None
+        if cache_ttl:
+            from context_cache import ContextCache
+            self.context_cache = ContextCache(client, ttl_s=cache_ttl)
+        self.model = model
+        self.fallback_model = fallback_model
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst or max(1.0, requests_per_minute / 6.0))
+        self._breaker_args = (breaker_threshold, breaker_reset)
+        self.breakers = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+        # one per pool worker, held until the call returns (not just until the caller gives up on it)
+        self._workers = threading.BoundedSemaphore(max_workers)
+        self._in_flight = 0
+
+    # ----- observability -----
+    def _count(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["in_flight"] = self._in_flight
+        out["breakers"] = {m: b.state for m, b in self.breakers.items()}
+        if self.context_cache:
+            out["context_cache"] = self.context_cache.stats()
+        return out
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(*self._breaker_args)
+            return self.breakers[model]
+
+    # ----- core retry loop -----
+    def _models(self, model: str = None) -> list:
+        primary = model or self.model
+        models = [primary]
+        if self.fallback_model and self.fallback_model != primary:
+            models.append(self.fallback_model)
+        return models
+
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call(self, fn, model: str, deadline: float):
+        """
+        Run `fn(model)` on the worker pool with retries, honouring the
+        overall `deadline` (monotonic timestamp). Returns fn's result.
+        """
+        breaker = self._breaker(model)
+        last_kind = "error"
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                self._count("short_circuited")
+                raise GeminiError("circuit_open", f"circuit open for {model}")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._workers.acquire(timeout=remaining):
+                # every worker is still busy, e.g. with calls abandoned at their deadline
+                breaker.release()
+                self._count("shed_busy")
+                raise GeminiError("timeout", "no Gemini worker free before deadline")
+            remaining = deadline - time.monotonic()
+            waited_from = time.monotonic()
+            if remaining <= 0 or not self.bucket.acquire(timeout=remaining):
+                self._workers.release()
+                breaker.release()
+                self._count("shed")
+                raise GeminiError("quota", "rate limit: no capacity before deadline")
+            self._count("rate_limit_wait_s", time.monotonic() - waited_from)
+
+            self._count("attempts")
+            try:
+                future = self._submit(fn, model)
+            except Exception:
+                breaker.release()
+                raise
+            try:
+                result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                breaker.record_success()
+                return result
+            except Exception as e:
+                if not future.cancel() and not future.done():
+                    self._count("abandoned")
+                last_kind = classify_error(e)
+                self._count(f"error_{last_kind}")
+                log.warning("Gemini %s failed (attempt %d, %s): %s", model, attempt + 1, last_kind, e)
+                if last_kind not in RETRYABLE:
+                    if last_kind == "not_found":
+                        # the API answered: a completed probe, not an outage
+                        breaker.record_success()
+                    else:
+                        breaker.record_failure()
+                    raise GeminiError(last_kind, str(e))
+                breaker.record_failure()
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self._count("retries")
+                time.sleep(delay)
+        raise GeminiError(last_kind, f"{model}: retries exhausted")
+
+    def _submit(self, fn, model: str):
+        # caller holds a worker slot; it is released when fn returns or the future is cancelled
+        with self._lock:
+            self._in_flight += 1
+
+        def release(_):
+            with self._lock:
+                self._in_flight -= 1
+            self._workers.release()
+
+        try:
+            future = self._pool.submit(fn, model)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    def _with_fallback(self, fn, model: str = None, deadline: float = None):
+        deadline = time.monotonic() + (deadline or self.deadline)
+        self._count("calls")
+        error = GeminiError("error")
+        for i, candidate in enumerate(self._models(model)):
+            if i:
+                self._count("fallbacks")
+            try:
+                result = fn(candidate, deadline)
+                self._count("success")
+                return result
+            except GeminiError as e:
+                error = e
+                if e.kind == "error" or time.monotonic() >= deadline:
+                    break
+        self._count("failures")
+        raise error
+
+    # ----- public API -----
+    def generate(self, contents, model: str = None, deadline: float = None, **kwargs):
+        """
+        Single-shot generation. Returns the raw response object.
+        Raises GeminiError when every attempt and fallback failed.
+        """
+        def attempt(m, dl):
+            return self._call(lambda mm: self.client.models.generate_content(model=mm, contents=contents, **kwargs), m, dl)
+
+        return self._with_fallback(attempt, model, deadline)
+
+    def generate_text(self, contents, model: str = None, deadline: float = None, **kwargs) -> str:
+        return response_text(self.generate(contents, model=model, deadline=deadline, **kwargs)).strip()
+
+    def stream(self, contents, model: str = None, deadline: float = None, usage: dict = None, prefix=None,
+               **kwargs):
+        """
+        Streaming generation, yielding text chunks. Retries and fallback only
+        apply until the first chunk arrives; the deadline bounds time to
+        first token. Errors after that surface as GeminiError("unavailable").
+        `usage`, if given, receives the token counts (see `record_usage`).
+        `prefix` (a context_cache.StaticPrefix) goes in front of `contents`:
+        as a cached-content handle when context caching is on and the model
+        accepts one, else as plain text.
+        """
+        def start(mm, call_contents, call_kwargs):
+            it = iter(self.client.models.generate_content_stream(model=mm, contents=call_contents, **call_kwargs))
+            try:
+                first = next(it)
+            except StopIteration:
+                first = None
+            return first, it
+
+        def open_stream(mm):
+            if prefix is None:
+                return start(mm, contents, kwargs)
+            name = self.context_cache.handle(mm, prefix) if self.context_cache else None
+            if name:
+                config = dict(kwargs.get("config") or {}, cached_content=name)
+                try:
+                    return start(mm, contents, dict(kwargs, config=config))
+                except Exception as e:
+                    if classify_error(e) not in ("not_found", "error"):
+                        raise
+                    # handle expired or was rejected: forget it and send the whole prompt
+                    log.warning("cached content %s unusable on %s: %s", name, mm, e)
+                    self.context_cache.invalidate(mm, prefix)
+                    self._count("cache_fallbacks")
+            return start(mm, prefix.text + contents, kwargs)
+
+        def attempt(m, dl):
+            return self._call(open_stream, m, dl)
+
+        first, it = self._with_fallback(attempt, model, deadline)
+
+        def chunks():
+            text = response_text(first)
+            if usage is not None:
+                record_usage(usage, first)
+            if text:
+                yield text
+            if first is None:
+                return
+            try:
+                for chunk in it:
+                    if usage is not None:
+                        record_usage(usage, chunk)
+                    text = response_text(chunk)
+                    if text:
+                        yield text
+            except Exception as e:
+                self._count("stream_errors")
+                kind = classify_error(e)
+                raise GeminiError("unavailable" if kind == "error" else kind, str(e))
+
+        return chunks()
+
+
+def client_from_settings(setting):
+    """
+    Build a ResilientGemini from a `setting(name, default)` getter
+    (os.getenv, or the app's env-then-secrets lookup).
+    Returns None when GEMINI_API_KEY is not configured.
+    """
+    api_key = setting("GEMINI_API_KEY", None)
+    if not api_key:
+        return None
+    import google.genai as genai
+
+    deadline = float(setting("GEMINI_DEADLINE_S", 30))
+    return ResilientGemini(
+        # an HTTP request never outlives its call's deadline by much, so a
+        # worker whose call was abandoned is freed instead of hanging
+        genai.Client(api_key=api_key, http_options={"timeout": int(deadline * 1000)}),
+        model=setting("GEMINI_MODEL", DEFAULT_MODEL),
+        fallback_model=setting("GEMINI_FALLBACK_MODEL", DEFAULT_FALLBACK_MODEL),
+        requests_per_minute=float(setting("GEMINI_RPM", 10)),
+        deadline=deadline,
+        cache_ttl=float(setting("GEMINI_CACHE_TTL_S", 0)),
+    )
@@ -0,0 +1,207 @@
+"""
+Bounded, memory-aware LRU of in-process bot indexes.
+
+Replaces the unbounded per-text cache: every resident index is charged
+its byte size (vectors + lines), and once the total goes over the budget
+the least-recently-used bots are evicted. With a spill directory set,
+evicted indexes are written to disk (keyed by bot ID + content hash) and
+read back on the next access instead of re-encoding the whole corpus;
+only a bot's most recently spilled corpus is kept.
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def index_nbytes(bot_index) -> int:
+    """
+    Approximate resident size of a BotIndex: float32 vectors + line strings.
+    """
+    index = bot_index.index
+    vectors = index.ntotal * index.d * 4
+    lines = sum(sys.getsizeof(line) for line in bot_index.lines) + sys.getsizeof(bot_index.lines)
+    return vectors + lines
+
+
+class BotIndexManager:
+    """
+    `build(bot_text)` makes a BotIndex; `load(path, bot_text)` / `save(bot_index, path)`
+    read and write the on-disk form (only used when `spill_dir` is set).
+    """
+
+    def __init__(self, build, budget_bytes: int, spill_dir: str = None, load=None, save=None):
+        self.build = build
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.load = load
+        self.save = save
+        self._entries = OrderedDict()   # (bot_id, digest) -> (bot_index, nbytes)
+        self._resident_bytes = 0
+        self._building = {}
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    # ----- keys / paths -----
+    @staticmethod
+    def key_for(bot_text: str, bot_id: str = None) -> tuple:
+        return (bot_id, content_hash(bot_text))
+
+    @staticmethod
+    def _spill_prefix(bot_id) -> str:
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in bot_id) if bot_id else "_"
+
+    def _spill_path(self, key: tuple):
+        if not (self.spill_dir and self.load and self.save):
+            return None
+        bot_id, digest = key
+        return os.path.join(self.spill_dir, f"{self._spill_prefix(bot_id)}-{digest[:16]}.faiss")
+
+    # ----- public API -----
+    def get(self, bot_text: str, bot_id: str = None):
+        key = self.key_for(bot_text, bot_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0]
+            self.counters["misses"] += 1
+            # [lock, callers holding or waiting for it]
+            building = self._building.setdefault(key, [threading.Lock(), 0])
+            building[1] += 1
+
+        # one builder per key; other sessions asking for it wait here
+        try:
+            with building[0]:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        return entry[0]
+                bot_index = self._load_or_build(key, bot_text)
+                self._insert(key, bot_index)
+        finally:
+            # dropped by the last caller out (also after a failed build), so one
+            # arriving meanwhile still waits on the same lock instead of building again
+            with self._lock:
+                building[1] -= 1
+                if not building[1]:
+                    del self._building[key]
+        return bot_index
+
+    def resident(self, bot_id: str, digest: str):
+        """
+        The resident index of this bot and content hash, or None (not built
+        yet, evicted or spilled) -- the caller needs the text to get it.
+        """
+        with self._lock:
+            entry = self._entries.get((bot_id, digest))
+            if entry is None:
+                return None
+            self._entries.move_to_end((bot_id, digest))
+            return entry[0]
+
+    def put(self, bot_text: str, bot_id: str, bot_index) -> None:
+        """
+        Insert an index built elsewhere (e.g. from vectors computed during
+        a bulk import), replacing any resident one for the same text.
+        """
+        key = self.key_for(bot_text, bot_id)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._resident_bytes -= old[1]
+        self._insert(key, bot_index)
+
+    def _load_or_build(self, key: tuple, bot_text: str):
+        path = self._spill_path(key)
+        if path and os.path.exists(path):
+            try:
+                bot_index = self.load(path, bot_text)
+                self._count("spill_loads")
+                return bot_index
+            except Exception as e:
+                log.warning("Could not read spilled index %s, rebuilding: %s", path, e)
+        self._count("builds")
+        return self.build(bot_text)
+
+    def _insert(self, key: tuple, bot_index) -> None:
+        nbytes = index_nbytes(bot_index)
+        evicted = []
+        with self._lock:
+            self._entries[key] = (bot_index, nbytes)
+            self._resident_bytes += nbytes
+            # evict LRU entries, but never the one just inserted
+            while self._resident_bytes > self.budget_bytes and len(self._entries) > 1:
+                old_key, (old_index, old_bytes) = self._entries.popitem(last=False)
+                self._resident_bytes -= old_bytes
+                self.counters["evictions"] += 1
+                self.counters["evicted_bytes"] += old_bytes
+                evicted.append((old_key, old_index))
+        for old_key, old_index in evicted:
+            self._spill(old_key, old_index)
+
+    def _spill(self, key: tuple, bot_index) -> None:
+        path = self._spill_path(key)
+        if not path:
+            return
+        if not os.path.exists(path):
+            try:
+                tmp = path + ".tmp"
+                self.save(bot_index, tmp)
+                os.replace(tmp, path)
+                self._count("spills")
+            except Exception as e:
+                log.warning("Could not spill index %s: %s", key, e)
+                return
+        if key[0]:
+            # spills of the bot's earlier corpora would never be read again
+            self._unlink_spills(key[0], keep=os.path.basename(path))
+
+    def _unlink_spills(self, bot_id: str, keep: str = None) -> None:
+        # exactly "<bot>-<16 hex digits>.faiss": "bob" must not match "bob-2-<digest>.faiss"
+        pattern = re.compile(re.escape(self._spill_prefix(bot_id)) + r"-[0-9a-f]{16}\.faiss")
+        for name in os.listdir(self.spill_dir):
+            if name != keep and pattern.fullmatch(name):
+                try:
+                    os.unlink(os.path.join(self.spill_dir, name))
+                    self._count("spill_deletes")
+                except OSError as e:
+                    log.warning("Could not delete spilled index %s: %s", name, e)
+
+    def evict(self, bot_id: str) -> None:
+        """
+        Drop every resident and spilled index of a bot (e.g. after it was deleted).
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bot_id]:
+                _, nbytes = self._entries.pop(key)
+                self._resident_bytes -= nbytes
+        if self._spill_path((bot_id, "")):
+            self._unlink_spills(bot_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out.update({
+                "resident": len(self._entries),
+                "resident_bytes": self._resident_bytes,
+                "budget_bytes": self.budget_bytes,
+            })
+        return out
@@ -0,0 +1,342 @@
+"""
+Index sidecar: one process per node owns the embedding model and the bot
+FAISS indexes, and Streamlit / API workers query it over a Unix socket.
+
+Without it, every worker process (and every replica) loads its own model
+and builds its own copy of each bot's index. With it there is one warm
+copy per node. Start it next to the app:
+
+    python index_server.py --socket /tmp/chatbuilder-index.sock --memory-mb 2048
+
+and point workers at it with INDEX_SOCKET=/tmp/chatbuilder-index.sock.
+If the sidecar is unreachable, `RemoteRetriever` falls back to an
+in-process `Retriever`. Requests that build an index (load, adopt,
+bundle) may take minutes on a large corpus, so they wait up to
+`load_timeout` instead of the per-request `timeout`.
+
+Wire format: each message is a 4-byte big-endian length followed by a
+UTF-8 JSON object. Requests carry an "op"; a search "bitmap" is the
+base64 of a packed row bitmap (see message_store.py):
+    encode  {"texts": [...]}                          -> {"vectors": [[...]]}
+    search  {"bot_id", "hash", "vector", "k",
+             "bitmap"?, "rows"?}                      -> {"lines": [...]} (or {"rows": [...]})
+                                                         or error "unknown_bot" (not resident:
+                                                         send a load with the text, then retry)
+    load    {"bot_id", "text"}                        -> {"hash"}
+    adopt   {"bot_id", "text", "path"}                -> {"hash"}   (a .npy of the text's vectors on this node)
+    bundle  {"bot_id", "path", "trust_index"?}        -> {"hash"}   (a bot_bundle.py file on this node)
+    evict   {"bot_id"}                                -> {}
+    stats   {}                                        -> {"stats": {...}}
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+
+from chat_engine import Retriever, RETRIEVE_K
+from index_manager import content_hash
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/chatbuilder-index.sock"
+REQUEST_TIMEOUT = 30.0
+LOAD_TIMEOUT = 600.0
+_HEADER = struct.Struct(">I")
+
+
+# ---------------------------
+# Framing
+# ---------------------------
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_message(sock, obj: dict) -> None:
+    payload = json.dumps(obj).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock) -> dict:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+# ---------------------------
+# Server
+# ---------------------------
+class IndexService:
+    """
+    Request handlers around one shared Retriever. A search names its index
+    by bot ID + hash and only sends the query vector; the service keeps no
+    texts of its own, so everything it holds is inside the index budget.
+    """
+
+    def __init__(self, retriever: Retriever):
+        self.retriever = retriever
+
+    def handle(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "encode":
+            vectors = self.retriever.encode(request["texts"])
+            return {"ok": True, "vectors": vectors.tolist()}
+        if op == "search":
+            import numpy as np
+
+            bot_index = self.retriever.indexes.resident(request.get("bot_id"), request["hash"])
+            if bot_index is None:
+                return {"ok": False, "error": "unknown_bot"}
+            qvec = np.asarray(request["vector"], dtype="float32").reshape(1, -1)
+            bitmap = None
+            if request.get("bitmap"):
+                bitmap = np.frombuffer(base64.b64decode(request["bitmap"]), dtype=np.uint8)
+            k = int(request.get("k", RETRIEVE_K))
+            if request.get("rows"):
+                return {"ok": True, "rows": bot_index.search_rows(qvec, k, bitmap)}
+            return {"ok": True, "lines": bot_index.search(qvec, k, bitmap)}
+        if op == "load":
+            # builds the index, or reads it back from the spill directory
+            self.retriever.index_for(request["text"], request.get("bot_id"))
+            return {"ok": True, "hash": content_hash(request["text"])}
+        if op == "adopt":
+            import numpy as np
+
+            self.retriever.adopt(request["text"], request.get("bot_id"), np.load(request["path"], mmap_mode="r"))
+            return {"ok": True, "hash": content_hash(request["text"])}
+        if op == "bundle":
+            from bot_bundle import read_bundle
+
+            with read_bundle(request["path"]) as bundle:
+                self.retriever.adopt_bundle(bundle, request.get("bot_id"), bool(request.get("trust_index")))
+                return {"ok": True, "hash": content_hash(bundle.bot_text)}
+        if op == "evict":
+            self.retriever.evict(request.get("bot_id"))
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "stats": self.retriever.stats()}
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self.server.service.handle(request)
+            except Exception as e:
+                log.exception("index request failed")
+                response = {"ok": False, "error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                # the client gave up waiting (timeout) and closed the connection
+                return
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, service: IndexService):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.service = service
+
+
+# ---------------------------
+# Client
+# ---------------------------
+class RemoteRetriever:
+    """
+    Same interface as chat_engine.Retriever, served by the sidecar.
+    `fallback` builds a local Retriever if the socket can't be reached.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, fallback=None, timeout: float = REQUEST_TIMEOUT,
+                 load_timeout: float = LOAD_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self._fallback_factory = fallback
+        self._fallback = None
+        self._local = threading.local()
+        # (bot_id, hash) pairs already sent, so warm-ups don't resend the corpus every rerun
+        self._registered = set()
+        # bots already reported as served in-process
+        self._local_bots = set()
+
+    # ----- transport -----
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _call(self, request: dict, timeout: float = None) -> dict:
+        for attempt in range(2):
+            try:
+                sock = self._conn()
+                sock.settimeout(timeout or self.timeout)
+                send_message(sock, request)
+                return recv_message(sock)
+            except OSError as e:
+                # stale connection (sidecar restarted): reconnect once. A late
+                # reply would arrive on this connection, so it is closed either way.
+                sock = getattr(self._local, "sock", None)
+                self._local.sock = None
+                if sock is not None:
+                    sock.close()
+                # resending after a timeout would only wait as long again
+                if attempt or isinstance(e, socket.timeout):
+                    raise
+
+    def _local_retriever(self):
+        if self._fallback is None:
+            if not self._fallback_factory:
+                raise ConnectionError(f"index sidecar unreachable at {self.path}")
+            log.warning("Index sidecar unreachable at %s, using in-process indexes", self.path)
+            self._fallback = self._fallback_factory()
+        return self._fallback
+
+    def _fall_back(self, bot_id: str, error: OSError):
+        local = self._local_retriever()
+        if bot_id not in self._local_bots:
+            self._local_bots.add(bot_id)
+            log.warning("Index sidecar failed for bot %s (%s), indexing it in-process", bot_id, error)
+        return local
+
+    # ----- Retriever interface -----
+    def encode(self, texts: list):
+        import numpy as np
+
+        try:
+            response = self._call({"op": "encode", "texts": list(texts)})
+        except OSError:
+            return self._local_retriever().encode(texts)
+        return np.asarray(response["vectors"], dtype="float32")
+
+    def _register(self, bot_text: str, bot_id: str) -> None:
+        response = self._call({"op": "load", "bot_id": bot_id, "text": bot_text}, self.load_timeout)
+        self._registered.add((bot_id, response.get("hash")))
+
+    def index_for(self, bot_text: str, bot_id: str = None):
+        if (bot_id, content_hash(bot_text)) in self._registered:
+            return
+        try:
+            self._register(bot_text, bot_id)
+        except OSError as e:
+            return self._fall_back(bot_id, e).index_for(bot_text, bot_id)
+
+    def _search(self, bot_text: str, qvec, k: int, bot_id: str, bitmap, rows: bool):
+        request = {"op": "search", "bot_id": bot_id, "hash": content_hash(bot_text),
+                   "vector": [float(x) for x in qvec[0]], "k": k, "rows": rows}
+        if bitmap is not None:
+            request["bitmap"] = base64.b64encode(bytes(bitmap)).decode("ascii")
+        try:
+            response = self._call(request)
+            if not response.get("ok") and response.get("error") == "unknown_bot":
+                self._register(bot_text, bot_id)
+                response = self._call(request)
+        except OSError as e:
+            local = self._fall_back(bot_id, e)
+            return (local.search_rows if rows else local.search)(bot_text, qvec, k, bot_id=bot_id, bitmap=bitmap)
+        if not response.get("ok"):
+            raise RuntimeError(f"index sidecar error: {response.get('error')}")
+        return response["rows" if rows else "lines"]
+
+    def adopt(self, bot_text: str, bot_id: str, vectors) -> None:
+        import numpy as np
+
+        # same node: hand the sidecar a file of the vectors instead of sending them as JSON
+        fd, path = tempfile.mkstemp(suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+            response = self._call({"op": "adopt", "bot_id": bot_id, "text": bot_text, "path": path},
+                                  self.load_timeout)
+        except OSError as e:
+            self._fall_back(bot_id, e).adopt(bot_text, bot_id, vectors)
+            return
+        finally:
+            os.unlink(path)
+        if not response.get("ok"):
+            raise ValueError(f"index sidecar error: {response.get('error')}")
+        self._registered.add((bot_id, response["hash"]))
+
+    def adopt_bundle(self, bundle, bot_id: str, trust_index: bool = False) -> None:
+        # same node: the sidecar maps the file itself instead of receiving the index
+        try:
+            response = self._call({"op": "bundle", "bot_id": bot_id, "path": os.path.abspath(bundle.path),
+                                   "trust_index": trust_index}, self.load_timeout)
+        except OSError as e:
+            self._fall_back(bot_id, e).adopt_bundle(bundle, bot_id, trust_index)
+            return
+        if not response.get("ok"):
+            raise ValueError(f"index sidecar error: {response.get('error')}")
+        self._registered.add((bot_id, response["hash"]))
+
+    def search(self, bot_text: str, qvec, k: int = RETRIEVE_K, bot_id: str = None, bitmap=None) -> list:
+        return self._search(bot_text, qvec, k, bot_id, bitmap, rows=False)
+
+    def search_rows(self, bot_text: str, qvec, k: int = RETRIEVE_K, bot_id: str = None, bitmap=None) -> list:
+        return self._search(bot_text, qvec, k, bot_id, bitmap, rows=True)
+
+    def evict(self, bot_id: str) -> None:
+        self._registered = {r for r in self._registered if r[0] != bot_id}
+        self._local_bots.discard(bot_id)
+        try:
+            self._call({"op": "evict", "bot_id": bot_id})
+        except OSError:
+            pass
+        if self._fallback is not None:
+            self._fallback.evict(bot_id)
+
+    def stats(self) -> dict:
+        try:
+            return {"sidecar": self.path, **self._call({"op": "stats"}).get("stats", {})}
+        except OSError as e:
+            return {"sidecar": self.path, "error": str(e)}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Shared bot-index sidecar for Chat Builder workers")
+    parser.add_argument("--socket", default=os.getenv("INDEX_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--memory-mb", type=float, default=float(os.getenv("INDEX_MEMORY_MB", 2048)))
+    parser.add_argument("--spill-dir", default=os.getenv("INDEX_SPILL_DIR") or None)
+    parser.add_argument("--encode-workers", type=int, default=int(os.getenv("ENCODE_WORKERS", 0)),
+                        help="processes for building large indexes (0: in-process)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    retriever = Retriever(budget_bytes=int(args.memory_mb * 2**20), spill_dir=args.spill_dir,
+                          encode_workers=args.encode_workers)
+    retriever.model  # load the embedding model before accepting requests
+    server = IndexServer(args.socket, IndexService(retriever))
+    log.info("index sidecar listening on %s", args.socket)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Columnar message store for one bot's chat export.
+
+The upload used to keep only the bot person's lines, joined into one
+string, so retrieval could neither filter by date nor show what the
+other person had said. This keeps every parsed message in NumPy
+columns instead of Python objects:
+
+    ts        int64   seconds since epoch (chat-local time), -1 if unknown
+    speaker   int16   index into `speakers`
+    offsets   int64   n + 1 byte offsets into `text` (UTF-8, concatenated)
+    row       int32   embedding row in the bot's FAISS index, -1 if not embedded
+
+Rows are the bot person's messages in order, one per line of
+`bot_text()`, which is exactly what `chat_engine.split_bot_lines` embeds.
+Filters produce row bitmaps (packed little-endian bits, the layout
+FAISS's IDSelectorBitmap reads); the common "recent style" windows are
+precomputed at build time. Message text is only decoded for the rows
+actually returned.
+"""
+import calendar
+import io
+import re
+
+import numpy as np
+
+FORMAT_VERSION = 1
+RECENT_WINDOWS = (30, 90, 365)
+DAY_S = 86400
+PREV_CHARS = 200
+
+# 12/04/2023, 5:22 pm - Name: text        (Android)
+# [12/04/23, 17:22:10] Name: text         (iOS)
+HEADER_RE = re.compile(
+    r"^\[?(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4}),?\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([ap]\.?\s?m\.?)?\]?"
+    r"\s*(?:-\s*)?([^:]{1,60}?):\s?(.*)$",
+    re.IGNORECASE,
+)
+INVISIBLE = dict.fromkeys(map(ord, "\u200e\u200f\u202a\u202c"), None)
+
+
+def _parse_lines(raw_text: str) -> list:
+    """
+    Split an export into [day, month_or_day, year, h, m, s, ampm, speaker, text]
+    records; lines without a header continue the previous message.
+    """
+    records = []
+    for line in raw_text.splitlines():
+        line = line.translate(INVISIBLE).replace("\u202f", " ").replace("\xa0", " ")
+        m = HEADER_RE.match(line)
+        if m:
+            a, b, y, h, mi, s, ampm, speaker, text = m.groups()
+            records.append([int(a), int(b), int(y), int(h), int(mi), int(s or 0),
+                            (ampm or "").replace(".", "").replace(" ", "").lower(),
+                            speaker.strip(), text.strip()])
+        elif records and line.strip():
+            records[-1][8] = f"{records[-1][8]} {line.strip()}".strip()
+    return records
+
+
+def _timestamps(records: list) -> np.ndarray:
+    """
+    Resolve day/month order once for the whole file (exports use one
+    locale), then convert to epoch seconds.
+    """
+    first = np.array([r[0] for r in records], dtype=np.int32)
+    second = np.array([r[1] for r in records], dtype=np.int32)
+    month_first = bool((second > 12).any()) and not bool((first > 12).any())
+
+    out = np.full(len(records), -1, dtype=np.int64)
+    for i, (a, b, y, h, mi, s, ampm, _, _) in enumerate(records):
+        day, month = (b, a) if month_first else (a, b)
+        year = y + 2000 if y < 100 else y
+        if ampm == "pm" and h < 12:
+            h += 12
+        elif ampm == "am" and h == 12:
+            h = 0
+        try:
+            out[i] = calendar.timegm((year, month, day, h, mi, s, 0, 0, 0))
+        except (ValueError, OverflowError):
+            pass
+    return out
+
+
+def parse_export(raw_text: str) -> list:
+    """
+    WhatsApp-style export -> [(ts, speaker, text), ...] in file order
+    (ts in epoch seconds, -1 if the date could not be read).
+    """
+    records = _parse_lines(raw_text)
+    if not records:
+        return []
+    ts = _timestamps(records)
+    return [(int(t), r[7], r[8]) for t, r in zip(ts.tolist(), records)]
+
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask.astype(bool), bitorder="little")
+
+
+class MessageStore:
+    def __init__(self, ts, speaker, offsets, text, row, speakers: list, bot_speaker: int, bitmaps: dict = None):
+        self.ts = ts
+        self.speaker = speaker
+        self.offsets = offsets
+        self.text = text
+        self.row = row
+        self.speakers = list(speakers)
+        self.bot_speaker = bot_speaker
+        # message index of every embedding row, in row order
+        self.row_message = np.flatnonzero(row >= 0)
+        self.bitmaps = bitmaps if bitmaps is not None else self._precompute_bitmaps()
+
+    # ----- build -----
+    @classmethod
+    def from_export(cls, raw_text: str, bot_name: str):
+        """
+        Parse a WhatsApp-style export. Returns None when no message from
+        `bot_name` was found (the caller falls back to plain lines).
+        """
+        return cls.from_records(parse_export(raw_text), bot_name)
+
+    @classmethod
+    def from_records(cls, records: list, bot_name: str):
+        """
+        Build from [(ts, speaker, text), ...] (e.g. several merged exports).
+        Returns None when no message from `bot_name` is embeddable.
+        """
+        if not records:
+            return None
+        speakers = sorted({r[1] for r in records})
+        lookup = {name.lower(): i for i, name in enumerate(speakers)}
+        bot_speaker = lookup.get(bot_name.strip().lower())
+        if bot_speaker is None:
+            return None
+
+        encoded = [r[2].encode("utf-8") for r in records]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        text = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        speaker = np.fromiter((lookup[r[1].lower()] for r in records), dtype=np.int16, count=len(records))
+        ts = np.fromiter((r[0] for r in records), dtype=np.int64, count=len(records))
+
+        # same rule as before: the bot person's messages with more than one word
+        words = np.fromiter((len(r[2].split()) for r in records), dtype=np.int32, count=len(records))
+        embedded = (speaker == bot_speaker) & (words > 1)
+        row = np.full(len(records), -1, dtype=np.int32)
+        row[embedded] = np.arange(int(embedded.sum()), dtype=np.int32)
+        if not embedded.any():
+            return None
+        return cls(ts, speaker, offsets, text, row, speakers, bot_speaker)
+
+    def _precompute_bitmaps(self) -> dict:
+        bitmaps = {}
+        for days in RECENT_WINDOWS:
+            bitmaps[f"recent_{days}"] = self._row_bitmap(self._recent_mask(days))
+        return bitmaps
+
+    # ----- accessors -----
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.row_message)
+
+    @property
+    def bot_name(self) -> str:
+        return self.speakers[self.bot_speaker]
+
+    def message(self, i: int) -> str:
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def bot_text(self) -> str:
+        """
+        The embedded messages, one per line, in row order.
+        """
+        return "\n".join(" ".join(self.message(i).split()) for i in self.row_message)
+
+    def span(self):
+        known = self.ts[self.ts >= 0]
+        if not len(known):
+            return None, None
+        return int(known.min()), int(known.max())
+
+    # ----- filters -----
+    def _recent_mask(self, days: int) -> np.ndarray:
+        _, last = self.span()
+        if last is None:
+            return np.ones(len(self), dtype=bool)
+        return self.ts >= last - days * DAY_S
+
+    def _row_bitmap(self, message_mask: np.ndarray) -> np.ndarray:
+        rows = np.zeros(self.n_rows, dtype=bool)
+        rows[self.row[message_mask & (self.row >= 0)]] = True
+        return _pack(rows)
+
+    def row_bitmap(self, since: int = None, until: int = None, recent_days: int = None):
+        """
+        Packed bitmap over embedding rows for the given filters (epoch
+        seconds / days before the last message), or None for "no filter".
+        """
+        if since is None and until is None and not recent_days:
+            return None
+        if recent_days and since is None and until is None and f"recent_{recent_days}" in self.bitmaps:
+            return self.bitmaps[f"recent_{recent_days}"]
+        mask = np.ones(len(self), dtype=bool)
+        if recent_days:
+            mask &= self._recent_mask(recent_days)
+        if since is not None:
+            mask &= self.ts >= since
+        if until is not None:
+            mask &= (self.ts >= 0) & (self.ts < until)
+        return self._row_bitmap(mask)
+
+    # ----- context -----
+    def exchange(self, row: int) -> str:
+        """
+        An embedded message with the other person's message just before
+        it, formatted like the export ("Name: text").
+        """
+        i = int(self.row_message[row])
+        line = f"{self.bot_name}: {self.message(i)}"
+        if i > 0 and self.speaker[i - 1] != self.bot_speaker:
+            prev = self.message(i - 1)[:PREV_CHARS]
+            line = f"{self.speakers[self.speaker[i - 1]]}: {prev}\n{line}"
+        return line
+
+    # ----- serialization -----
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        np.savez(
+            buf,
+            version=np.array(FORMAT_VERSION),
+            ts=self.ts, speaker=self.speaker, offsets=self.offsets, text=self.text, row=self.row,
+            speakers=np.array(self.speakers), bot_speaker=np.array(self.bot_speaker),
+            **{f"bitmap_{name}": bits for name, bits in self.bitmaps.items()},
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MessageStore":
+        with np.load(io.BytesIO(data), allow_pickle=False) as z:
+            if int(z["version"]) != FORMAT_VERSION:
+                raise ValueError(f"unsupported message store version {int(z['version'])}")
+            bitmaps = {k[len("bitmap_"):]: z[k] for k in z.files if k.startswith("bitmap_")}
+            return cls(z["ts"], z["speaker"], z["offsets"], z["text"], z["row"],
+                       z["speakers"].tolist(), int(z["bot_speaker"]), bitmaps)
@@ -0,0 +1,122 @@
+"""
+Picks the cheapest adequate Gemini model for each chat turn.
+
+Turns are classified locally (no LLM call) from the message length, the
+size of the retrieved context and whether the message looks like a
+recipe / food request (which triggers the long structured recipe format).
+Short casual turns go to the light model, everything else to the heavy one.
+
+The routing table is plain JSON so it can live in an env var or in
+Streamlit secrets (MODEL_ROUTES), e.g.:
+
+    {"light": "gemini-2.5-flash-lite", "heavy": "gemini-2.5-flash",
+     "max_light_words": 25, "max_light_context_chars": 1500}
+"""
+import json
+import logging
+import re
+import threading
+from collections import Counter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ROUTES = {
+    "light": "gemini-2.5-flash-lite",
+    "heavy": "gemini-2.5-flash",
+    # a turn is "light" only if it stays under all of these
+    "max_light_words": 25,
+    "max_light_chars": 160,
+    "max_light_context_chars": 1500,
+    "recipe_keywords": [
+        "recipe", "cook", "cooking", "bake", "baking", "ingredient", "ingredients",
+        "dish", "dinner", "lunch", "breakfast", "snack", "dessert", "meal",
+        "chicken", "paneer", "egg", "eggs", "rice", "pasta", "potato", "tomato",
+        "cheese", "chocolate", "curry", "soup", "salad", "bread", "noodles",
+    ],
+}
+
+
+def load_routes(raw=None) -> dict:
+    """
+    Merge a JSON string or dict over DEFAULT_ROUTES. Bad JSON falls back to defaults.
+    """
+    routes = dict(DEFAULT_ROUTES)
+    if not raw:
+        return routes
+    try:
+        override = json.loads(raw) if isinstance(raw, str) else dict(raw)
+        routes.update(override)
+    except (ValueError, TypeError) as e:
+        log.warning("Ignoring invalid MODEL_ROUTES: %s", e)
+    return routes
+
+
+class Route:
+    def __init__(self, tier: str, model: str, reason: str):
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.tier}, {self.model}, {self.reason})"
+
+
+class ModelRouter:
+    """
+    Classifies turns and keeps per-tier latency averages so it can log
+    how much time light routing saved compared with the heavy model.
+    """
+
+    def __init__(self, routes: dict = None, ewma_alpha: float = 0.2):
+        self.routes = load_routes(routes)
+        self._recipe_re = re.compile(
+            r"\b(" + "|".join(re.escape(k) for k in self.routes["recipe_keywords"]) + r")\b",
+            re.IGNORECASE,
+        )
+        self.alpha = ewma_alpha
+        self.latency = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def classify(self, message: str, context: str = "") -> tuple:
+        """
+        Returns (tier, reason).
+        """
+        r = self.routes
+        if self._recipe_re.search(message or ""):
+            return "heavy", "recipe"
+        if len(message) > r["max_light_chars"] or len(message.split()) > r["max_light_words"]:
+            return "heavy", "long_message"
+        if len(context or "") > r["max_light_context_chars"]:
+            return "heavy", "large_context"
+        return "light", "casual"
+
+    def route(self, message: str, context: str = "") -> Route:
+        tier, reason = self.classify(message, context)
+        route = Route(tier, self.routes[tier], reason)
+        with self._lock:
+            self.counters[f"routed_{tier}"] += 1
+        log.info("route: tier=%s model=%s reason=%s msg_chars=%d ctx_chars=%d",
+                 tier, route.model, reason, len(message), len(context or ""))
+        return route
+
+    def record(self, route: Route, seconds: float) -> None:
+        """
+        Feed back the observed latency of a routed call.
+        """
+        with self._lock:
+            prev = self.latency.get(route.tier)
+            self.latency[route.tier] = seconds if prev is None else (1 - self.alpha) * prev + self.alpha * seconds
+            heavy = self.latency.get("heavy")
+            saved = 0.0
+            if route.tier == "light" and heavy is not None:
+                saved = max(0.0, heavy - seconds)
+                self.counters["saved_s"] += saved
+        log.info("route done: tier=%s model=%s latency=%.3fs est_saved=%.3fs",
+                 route.tier, route.model, seconds, saved)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["latency_ewma_s"] = {k: round(v, 3) for k, v in self.latency.items()}
+        return out
@@ -0,0 +1,184 @@
+"""
+Background prewarm of everything a user's first message needs.
+
+On login the app schedules, per bot (most recently used first): the bot
+document, its chat history, its message store and its FAISS index, plus
+the embedding model once. Jobs run on a small per-process thread pool in
+priority order. A rerun that needs one of the results `take`s it: done
+jobs hand over their result, running ones are waited for, and jobs that
+have not started yet are cancelled so the caller just loads it inline.
+
+Index jobs go through the retriever's BotIndexManager, whose per-key
+build lock means a send that arrives mid-build waits for that build
+instead of starting a second one.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+RESULT_TTL_S = 120
+TAKE_WAIT_S = 10
+# a finished result older than this is dropped on `take`: the data may have changed since
+TAKE_MAX_AGE_S = 30
+
+# priority = rank * STAGES + stage; lower runs first
+STAGES = 3
+STAGE_BOT, STAGE_HISTORY, STAGE_INDEX = range(STAGES)
+
+
+class Prewarmer:
+    def __init__(self, workers: int = 2):
+        self._queue = []
+        self._jobs = {}          # key -> (future, created)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self.counters = Counter()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"prewarm-{i}", daemon=True).start()
+
+    # ----- scheduling -----
+    def submit(self, key, priority: int, fn, *args) -> Future:
+        """
+        Queue `fn(*args)` under `key`, unless a live job for it exists.
+        """
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None and not job[0].cancelled():
+                return job[0]
+            future = Future()
+            self._jobs[key] = (future, time.monotonic())
+            heapq.heappush(self._queue, (priority, next(self._seq), key, future, fn, args))
+            self.counters["submitted"] += 1
+            self._wake.notify()
+        return future
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (f, created) in self._jobs.items() if f.done() and now - created > RESULT_TTL_S]:
+            del self._jobs[key]
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wake.wait()
+                _, _, key, future, fn, args = heapq.heappop(self._queue)
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                future.set_result(fn(*args))
+                with self._lock:
+                    self.counters["completed"] += 1
+                    self.counters["busy_s"] += time.perf_counter() - started
+            except Exception as e:
+                log.warning("prewarm %s failed: %s", key, e)
+                future.set_exception(e)
+                with self._lock:
+                    self.counters["failed"] += 1
+
+    # ----- results -----
+    def take(self, key, wait: float = TAKE_WAIT_S):
+        """
+        Hand over a prewarmed result (removing it), or None if the caller
+        should load it itself.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                self.counters["misses"] += 1
+                return None
+            future, created = job
+            if future.done() and time.monotonic() - created > TAKE_MAX_AGE_S:
+                del self._jobs[key]
+                self.counters["stale"] += 1
+                return None
+            if future.cancel():
+                # still queued: cheaper to load inline than to wait behind other jobs
+                del self._jobs[key]
+                self.counters["cancelled"] += 1
+                return None
+            del self._jobs[key]
+            self.counters["hits" if future.done() else "waits"] += 1
+        try:
+            return future.result(timeout=wait)
+        except Exception:
+            return None
+
+    def discard(self, key) -> None:
+        """
+        Forget the job under `key` (cancelling it if still queued), e.g. after
+        the data it loads was changed.
+        """
+        with self._lock:
+            job = self._jobs.pop(key, None)
+            if job is not None:
+                job[0].cancel()
+                self.counters["discarded"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out.update({"queued": len(self._queue), "tracked": len(self._jobs)})
+        return out
+
+
+def schedule_login(prewarmer: Prewarmer, engine, store, user: str) -> None:
+    """
+    Called from the login handler: fetch the bot list in the background,
+    then queue everything else. The Chat tab `take`s the list as (user, "bots").
+    """
+    def bots_then_schedule():
+        bots = by_recent_use(store.get_user_bots(user) or [])
+        schedule_user(prewarmer, engine, store, user, bots)
+        return bots
+
+    prewarmer.submit((user, "bots"), -2, bots_then_schedule)
+
+
+def schedule_user(prewarmer: Prewarmer, engine, store, user: str, bots: list) -> None:
+    """
+    Queue the model and every bot of `user` (dicts from get_user_bots,
+    most recently used first).
+    """
+    prewarmer.submit(("model",), -1, engine.retriever.encode, ["warmup"])
+    for rank, bot in enumerate(bots):
+        base = rank * STAGES
+        bot_id = bot["id"]
+        prewarmer.submit((user, "bot", bot_id), base + STAGE_BOT, store.get_bot, user, bot_id)
+        prewarmer.submit((user, "history", bot_id), base + STAGE_HISTORY, store.load_chat_history_cloud, user, bot_id)
+        prewarmer.submit((user, "index", bot_id), base + STAGE_INDEX, warm_index, engine, store, user, bot_id)
+
+
+def forget_bot(prewarmer: Prewarmer, user: str, bot_id: str) -> None:
+    """
+    Drop what was prewarmed for a bot that was just renamed, deleted or
+    had its history cleared, and the user's bot list.
+    """
+    prewarmer.discard((user, "bots"))
+    for kind in ("bot", "history", "index"):
+        prewarmer.discard((user, kind, bot_id))
+
+
+def warm_index(engine, store, user: str, bot_id: str, bot_data: dict = None) -> None:
+    """
+    Build (or load) the bot's index and message store. Without `bot_data`
+    it reads the bot document itself (a small, cached-corpus fetch).
+    """
+    if bot_data is None:
+        bot_data = store.get_bot(user, bot_id) or {}
+    if bot_data.get("file_text"):
+        engine.message_store(user, bot_id, bot_data)
+        engine.retriever.index_for(bot_data["file_text"], bot_id)
+
+
+def by_recent_use(bots: list) -> list:
+    return sorted(bots, key=lambda b: b.get("last_used") or 0, reverse=True)
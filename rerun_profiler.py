@@ -0,0 +1,199 @@
+"""
+Opt-in per-rerun profiling for the Streamlit app (PROFILE_RERUNS).
+
+Streamlit re-executes app.py top to bottom on every interaction, except
+for st.fragment reruns, which execute one fragment. To see what a rerun
+actually costs, app.py opens a RerunProfile at the top of each run and
+wraps each part of the script in `section(name)`. For every section it
+records wall time and CPU time, and it keeps a function-level profile
+of the whole run. That profile comes from pyinstrument if it is
+installed and from cProfile otherwise. Finished runs go to a
+per-process RerunLog, which the sidebar shows.
+
+A run cut short by st.rerun / st.stop never reaches `finish`; the next
+run of the same session records it as "interrupted". Fragment reruns
+are recorded as runs of their own (`RerunLog.fragment`).
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PROFILE_RUNS = 100
+TOP_FUNCTIONS = 15
+STATE_KEY = "_rerun_profile"
+
+# one cProfile at a time per process (3.12+ refuses a second one), so
+# concurrent sessions only get section timings while it is busy
+_cprofile_lock = threading.Lock()
+
+
+def _pyinstrument_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler(async_mode="disabled")
+
+
+class RerunProfile:
+    """
+    Timings of one script or fragment run. Sections nest; a nested one is
+    recorded as "outer › inner" and its time also counts towards the outer.
+    """
+
+    def __init__(self, kind: str, function_profile: bool = True):
+        self.kind = kind
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._last = self._t0
+        self.sections = {}       # name -> [wall seconds, cpu seconds]
+        self.finished = False
+        self._stack = []
+        self._pyinstrument = _pyinstrument_profiler() if function_profile else None
+        self._cprofile = None
+        self._cprofile_owned = False
+        self.profiler = "pyinstrument" if self._pyinstrument else ("cProfile" if function_profile else "off")
+
+    def _start_functions(self) -> None:
+        if self._pyinstrument is not None:
+            # successive start/stop pairs accumulate into one session
+            self._pyinstrument.start()
+        elif self.profiler == "cProfile" and _cprofile_lock.acquire(blocking=False):
+            self._cprofile_owned = True
+            self._cprofile = self._cprofile or cProfile.Profile()
+            self._cprofile.enable()
+
+    def _stop_functions(self) -> None:
+        if self._pyinstrument is not None:
+            self._pyinstrument.stop()
+        elif self._cprofile_owned:
+            self._cprofile.disable()
+            self._cprofile_owned = False
+            _cprofile_lock.release()
+
+    @contextmanager
+    def section(self, name: str):
+        if self.finished:
+            yield
+            return
+        outermost = not self._stack
+        self._stack.append(name)
+        key = " › ".join(self._stack)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        if outermost:
+            self._start_functions()
+        try:
+            yield
+        finally:
+            if outermost:
+                self._stop_functions()
+            totals = self.sections.setdefault(key, [0.0, 0.0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.thread_time() - cpu
+            self._stack.pop()
+            self._last = time.perf_counter()
+
+    def _functions_text(self) -> str:
+        if self._pyinstrument is not None and self._pyinstrument.last_session is not None:
+            return self._pyinstrument.output_text(unicode=False, color=False)
+        if self._cprofile is not None:
+            out = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=out)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            return out.getvalue()
+        return ""
+
+    def finish(self, interrupted: bool = False) -> dict:
+        self.finished = True
+        end = self._last if interrupted else time.perf_counter()
+        sectioned = sum(w for name, (w, _) in self.sections.items() if " › " not in name)
+        return {
+            "kind": self.kind,
+            "started": self.started,
+            "status": "interrupted" if interrupted else "ok",
+            "total_ms": round((end - self._t0) * 1000, 1),
+            # script code outside any section
+            "other_ms": round((end - self._t0 - sectioned) * 1000, 1),
+            "sections": {name: {"wall_ms": round(w * 1000, 1), "cpu_ms": round(c * 1000, 1)}
+                         for name, (w, c) in self.sections.items()},
+            "profiler": self.profiler,
+            "functions": self._functions_text(),
+        }
+
+
+class RerunLog:
+    """
+    The last PROFILE_RUNS runs of every session in the process. `state` is
+    the session's st.session_state (any dict works).
+    """
+
+    def __init__(self, max_runs: int = PROFILE_RUNS, function_profile: bool = True):
+        self.function_profile = function_profile
+        self._runs = deque(maxlen=max_runs)
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self._runs.append(record)
+
+    def begin(self, state) -> RerunProfile:
+        """
+        Start profiling a full script run of this session.
+        """
+        previous = state.get(STATE_KEY)
+        if previous is not None and not previous.finished:
+            self.add(previous.finish(interrupted=True))
+        run = RerunProfile("script", self.function_profile)
+        state[STATE_KEY] = run
+        return run
+
+    def finish(self, state) -> None:
+        run = state.get(STATE_KEY)
+        if run is not None and not run.finished:
+            self.add(run.finish())
+
+    @contextmanager
+    def fragment(self, state, name: str):
+        """
+        Profile a fragment: as a section of the script run it is part of,
+        or as a run of its own on a fragment rerun.
+        """
+        run = state.get(STATE_KEY)
+        if run is not None and not run.finished:
+            with run.section(name):
+                yield
+            return
+        run = RerunProfile(f"fragment: {name}", self.function_profile)
+        try:
+            with run.section(name):
+                yield
+        finally:
+            self.add(run.finish())
+
+    def recent(self, n: int = 10) -> list:
+        with self._lock:
+            return list(self._runs)[-n:]
+
+    def summary(self) -> dict:
+        """
+        Per kind of run: count, mean total and mean wall time per section.
+        """
+        with self._lock:
+            runs = list(self._runs)
+        out = {}
+        for record in runs:
+            kind = out.setdefault(record["kind"], {"runs": 0, "total_ms": 0.0, "sections_ms": {}})
+            kind["runs"] += 1
+            kind["total_ms"] += record["total_ms"]
+            for name, timing in record["sections"].items():
+                kind["sections_ms"][name] = kind["sections_ms"].get(name, 0.0) + timing["wall_ms"]
+        for kind in out.values():
+            n = kind["runs"]
+            kind["mean_total_ms"] = round(kind.pop("total_ms") / n, 1)
+            kind["mean_sections_ms"] = {name: round(ms / n, 1) for name, ms in
+                                        sorted(kind.pop("sections_ms").items(), key=lambda item: -item[1])}
+        return out
@@ -0,0 +1,326 @@
+"""
+Fair scheduling and token metering for LLM calls.
+
+Every reply used to call Gemini straight from its rerun, so one user
+firing many messages could drain the shared quota (the client's token
+bucket) and slow everyone else down. GenerationScheduler sits in front
+of the calls (ChatEngine.stream):
+
+  - each user has a FIFO queue, and at most `concurrency` generations
+    run at once per process;
+  - when a slot frees up, the next request is picked by start-time fair
+    queuing (a weighted fair queuing variant): a request's start tag is
+    max(virtual time, its user's last finish tag), its finish tag is
+    start + cost / weight (cost = estimated tokens), and the smallest
+    start tag runs first. A user with a long backlog gets their weighted
+    share while others wait, and all of it when nobody else does;
+  - a TokenMeter counts each user's tokens per UTC day (from the
+    response's usage metadata, else estimated), persists them on the
+    user document from a background thread every `flush_interval`
+    seconds (not inline with the reply) and rejects requests past the
+    user's daily budget before they queue.
+
+Both keep counters for the status panel (`stats`).
+"""
+import atexit
+import itertools
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from gemini_client import GeminiError
+
+log = logging.getLogger(__name__)
+
+EXPECTED_OUTPUT_TOKENS = 300
+MAX_QUEUE_WAIT_S = 60
+WAIT_SAMPLES = 1000
+TOP_USERS = 10
+FLUSH_INTERVAL_S = 2.0
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for chat text
+    return max(1, len(text) // 4)
+
+
+def utc_day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---------------------------
+# Metering
+# ---------------------------
+class TokenMeter:
+    """
+    Per-user daily token counts, cached in-process and persisted through
+    `store` (firebase_db's get_token_usage / add_token_usage). A user's
+    budget is their document's "token_budget", else `default_budget`;
+    0 means unlimited.
+
+    `record` only counts in-process; the tokens are added to the store by
+    a background thread every `flush_interval` seconds, one write per
+    user, and on exit. With `flush_interval=0` every record is written
+    inline.
+    """
+
+    def __init__(self, store, default_budget: int = 0, default_weight: float = 1.0,
+                 flush_interval: float = FLUSH_INTERVAL_S):
+        self.store = store
+        self.default_budget = default_budget
+        self.default_weight = default_weight
+        self.flush_interval = flush_interval
+        self._users = {}     # user -> usage dict as returned by the store, plus unsaved tokens
+        self._pending = {}   # (user, day) -> [prompt, output] tokens not saved yet
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.counters = Counter()
+
+    def _usage(self, user: str) -> dict:
+        with self._lock:
+            usage = self._users.get(user)
+        if usage is None:
+            try:
+                usage = self.store.get_token_usage(user)
+            except Exception as e:
+                log.warning("token usage of %s unavailable: %s", user, e)
+                usage = {}
+            with self._lock:
+                usage = self._users.setdefault(user, usage)
+        if usage.get("day") != utc_day():
+            usage = dict(usage, day=utc_day(), prompt=0, output=0, total=0)
+            with self._lock:
+                self._users[user] = usage
+        return usage
+
+    def budget(self, user: str) -> int:
+        budget = self._usage(user).get("budget")
+        return self.default_budget if budget is None else budget
+
+    def weight(self, user: str) -> float:
+        return self._usage(user).get("weight") or self.default_weight
+
+    def used(self, user: str) -> int:
+        return self._usage(user).get("total", 0)
+
+    def allowed(self, user: str) -> bool:
+        budget = self.budget(user)
+        return not budget or self.used(user) < budget
+
+    def record(self, user: str, prompt_tokens: int, output_tokens: int) -> None:
+        day = self._usage(user)["day"]
+        with self._lock:
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["output_tokens"] += output_tokens
+            local = self._users[user]
+            self._users[user] = dict(local, prompt=local.get("prompt", 0) + prompt_tokens,
+                                     output=local.get("output", 0) + output_tokens,
+                                     total=local.get("total", 0) + prompt_tokens + output_tokens)
+            pending = self._pending.setdefault((user, day), [0, 0])
+            pending[0] += prompt_tokens
+            pending[1] += output_tokens
+        if not self.flush_interval:
+            self.flush()
+        elif self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="token-meter", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Add the tokens recorded since the last flush to the store.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for (user, day), (prompt_tokens, output_tokens) in pending.items():
+            try:
+                usage = self.store.add_token_usage(user, day, prompt_tokens, output_tokens)
+            except Exception as e:
+                # keep the tokens for the next flush; the in-process count already has them
+                log.warning("token usage of %s not saved: %s", user, e)
+                with self._lock:
+                    self.counters["save_errors"] += 1
+                    unsaved = self._pending.setdefault((user, day), [0, 0])
+                    unsaved[0] += prompt_tokens
+                    unsaved[1] += output_tokens
+                continue
+            with self._lock:
+                self.counters["flushes"] += 1
+                if self._users.get(user, {}).get("day") != day:
+                    continue
+                # the stored count (which includes other processes' tokens) plus what was recorded meanwhile
+                later = self._pending.get((user, day), [0, 0])
+                self._users[user] = dict(usage, prompt=usage.get("prompt", 0) + later[0],
+                                         output=usage.get("output", 0) + later[1],
+                                         total=usage.get("total", 0) + later[0] + later[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            today = utc_day()
+            users = sorted(((u, d.get("total", 0)) for u, d in self._users.items() if d.get("day") == today),
+                           key=lambda item: -item[1])
+        out["top_users_today"] = dict(users[:TOP_USERS])
+        return out
+
+
+class BudgetExceeded(GeminiError):
+    def __init__(self, user: str):
+        super().__init__("budget", f"{user} is over the daily token budget")
+
+
+# ---------------------------
+# Scheduling
+# ---------------------------
+class _Ticket:
+    __slots__ = ("user", "start", "finish", "seq", "enqueued", "granted")
+
+    def __init__(self, user: str, start: float, finish: float, seq: int):
+        self.user = user
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class GenerationScheduler:
+    """
+    Create one per process and share it (like the Gemini client), so the
+    queues and the concurrency limit span every session.
+    """
+
+    def __init__(self, concurrency: int = 4, meter: TokenMeter = None, max_wait: float = MAX_QUEUE_WAIT_S):
+        self.concurrency = max(1, concurrency)
+        self.meter = meter
+        self.max_wait = max_wait
+        self._queues = {}         # user -> deque of waiting tickets
+        self._finish = {}         # user -> finish tag of their last request
+        self._vtime = 0.0
+        self._running = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.counters = Counter()
+
+    def _dispatch(self) -> None:
+        # caller holds self._cond
+        while self._running < self.concurrency:
+            heads = [q[0] for q in self._queues.values() if q]
+            if not heads:
+                break
+            ticket = min(heads, key=lambda t: (t.start, t.seq))
+            self._queues[ticket.user].popleft()
+            ticket.granted = True
+            self._vtime = max(self._vtime, ticket.start)
+            self._running += 1
+        self._cond.notify_all()
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        """
+        Take a waiting ticket out of its queue and give its cost back: the
+        user's later tickets and finish tag move back by it, as if it had
+        never been submitted. Caller holds self._cond.
+        """
+        queue = self._queues[ticket.user]
+        cost = ticket.finish - ticket.start
+        later = list(queue)[queue.index(ticket) + 1:]
+        queue.remove(ticket)
+        for other in later:
+            other.start -= cost
+            other.finish -= cost
+        self._finish[ticket.user] -= cost
+        self._forget_idle(ticket.user)
+
+    def _forget_idle(self, user: str) -> None:
+        # an idle user's tags are behind virtual time and no longer matter
+        if not self._queues.get(user) and self._finish.get(user, 0.0) <= self._vtime:
+            self._queues.pop(user, None)
+            self._finish.pop(user, None)
+
+    @contextmanager
+    def slot(self, user: str, cost: int):
+        """
+        Wait for a generation slot; yields the seconds spent queued.
+        Raises BudgetExceeded when the user is out of tokens, and
+        GeminiError("quota") when no slot frees up within `max_wait`.
+        """
+        if self.meter and not self.meter.allowed(user):
+            with self._cond:
+                self.counters["rejected_budget"] += 1
+            raise BudgetExceeded(user)
+        weight = self.meter.weight(user) if self.meter else 1.0
+        with self._cond:
+            start = max(self._vtime, self._finish.get(user, 0.0))
+            self._finish[user] = start + cost / weight
+            ticket = _Ticket(user, start, self._finish[user], next(self._seq))
+            self._queues.setdefault(user, deque()).append(ticket)
+            self.counters["submitted"] += 1
+            self._dispatch()
+            deadline = ticket.enqueued + self.max_wait
+            try:
+                while not ticket.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timed_out"] += 1
+                        raise GeminiError("quota", "generation queue wait exceeded")
+                    self._cond.wait(remaining)
+            except BaseException:
+                # timed out or interrupted while queued: it never ran, so it costs nothing
+                if ticket.granted:
+                    self._running -= 1
+                    self._dispatch()
+                else:
+                    self._withdraw(ticket)
+                raise
+            waited = time.monotonic() - ticket.enqueued
+            self._waits.append(waited)
+            self.counters["granted"] += 1
+            self.counters["queue_wait_s"] += waited
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._forget_idle(user)
+                self._dispatch()
+
+    def record(self, user: str, prompt_tokens: int, output_tokens: int) -> None:
+        if self.meter:
+            self.meter.record(user, prompt_tokens, output_tokens)
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self.counters)
+            waits = list(self._waits)
+            out.update({
+                "running": self._running,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "users_waiting": sum(1 for q in self._queues.values() if q),
+                "queue_wait_p50_s": round(_percentile(waits, 0.5), 3),
+                "queue_wait_p95_s": round(_percentile(waits, 0.95), 3),
+            })
+        if self.meter:
+            out["tokens"] = self.meter.stats()
+        return out
@@ -0,0 +1,152 @@
+"""
+Local stylometric profile of a bot's messages, computed at upload time.
+
+Runs over the whole parsed corpus (not just a sample) with no LLM call:
+per-message features go into NumPy arrays and are aggregated in one pass.
+The result is a small JSON-able dict stored next to the persona, and
+`describe_profile` turns it into a few prompt-ready lines.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+
+PROFILE_VERSION = 1
+TOP_N = 12
+
+EMOJI_RE = re.compile(
+    "[\U0001F300-\U0001FAFF\U0001F1E6-\U0001F1FF☀-➿⭐⭕‼⁉]"
+)
+WORD_RE = re.compile(r"[a-zA-Z']+")
+ELONGATED_RE = re.compile(r"\b\w*([a-zA-Z])\1{2,}\w*\b")
+
+SLANG = {
+    "lol", "lmao", "lmfao", "rofl", "haha", "hahaha", "hehe", "bro", "bruh", "dude", "ya", "yaa",
+    "yeah", "yea", "yep", "nah", "nope", "ok", "okk", "okay", "k", "kk", "u", "ur", "r", "pls",
+    "plz", "thx", "ty", "idk", "idc", "imo", "tbh", "btw", "omg", "wtf", "smh", "fr", "ngl",
+    "gonna", "wanna", "gotta", "kinda", "sorta", "yo", "sup", "wassup", "cya", "ttyl", "brb",
+    "gn", "gm", "hmm", "hmmm", "ohh", "ahh", "yaar", "bhai", "acha", "accha", "arey", "arre",
+}
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "but", "to", "of", "in", "on", "at", "for", "is", "it", "i",
+    "you", "me", "my", "we", "be", "was", "are", "that", "this", "so", "do", "if", "with", "have",
+    "just", "not", "no", "its", "it's", "i'm", "im", "what", "all", "will", "can", "he", "she",
+}
+LENGTH_BUCKETS = [(1, 3), (4, 7), (8, 15), (16, 30), (31, None)]
+
+
+def build_profile(lines: list) -> dict:
+    """
+    Compute the style profile for a list of messages from one person.
+    """
+    lines = [l.strip() for l in lines if l and l.strip()]
+    if not lines:
+        return {}
+
+    n = len(lines)
+    words_per_line = [WORD_RE.findall(l) for l in lines]
+
+    chars = np.fromiter((len(l) for l in lines), dtype=np.int32, count=n)
+    words = np.fromiter((len(w) for w in words_per_line), dtype=np.int32, count=n)
+    emoji_counts = np.fromiter((len(EMOJI_RE.findall(l)) for l in lines), dtype=np.int32, count=n)
+    last = np.array([l[-1] for l in lines])
+    first_alpha = [next((c for c in l if c.isalpha()), "") for l in lines]
+    starts_upper = np.fromiter((c.isupper() for c in first_alpha), dtype=bool, count=n)
+    has_alpha = np.fromiter((bool(c) for c in first_alpha), dtype=bool, count=n)
+    all_lower = np.fromiter((l == l.lower() for l in lines), dtype=bool, count=n)
+    ellipsis = np.fromiter(("..." in l or "…" in l for l in lines), dtype=bool, count=n)
+    multi_bang = np.fromiter(("!!" in l or "??" in l for l in lines), dtype=bool, count=n)
+
+    tokens = [w.lower() for ws in words_per_line for w in ws]
+    caps_words = sum(1 for ws in words_per_line for w in ws if len(w) > 1 and w.isupper())
+    unigrams = Counter(t for t in tokens if t not in STOPWORDS and len(t) > 1)
+    bigrams = Counter()
+    for ws in words_per_line:
+        low = [w.lower() for w in ws]
+        bigrams.update(f"{a} {b}" for a, b in zip(low, low[1:]))
+    slang = Counter(t for t in tokens if t in SLANG)
+    elongated = Counter(m.group(0).lower() for l in lines for m in ELONGATED_RE.finditer(l))
+    emojis = Counter(e for l in lines for e in EMOJI_RE.findall(l))
+
+    pct = np.percentile(words, [10, 25, 50, 75, 90]).round(1).tolist()
+    buckets = {}
+    for lo, hi in LENGTH_BUCKETS:
+        mask = (words >= lo) if hi is None else ((words >= lo) & (words <= hi))
+        buckets[f"{lo}+" if hi is None else f"{lo}-{hi}"] = round(float(mask.mean()), 3)
+
+    def share(mask) -> float:
+        return round(float(np.mean(mask)), 3)
+
+    return {
+        "version": PROFILE_VERSION,
+        "messages": n,
+        "avg_chars": round(float(chars.mean()), 1),
+        "avg_words": round(float(words.mean()), 1),
+        "word_percentiles": dict(zip(["p10", "p25", "p50", "p75", "p90"], pct)),
+        "length_buckets": buckets,
+        "emoji_rate": share(emoji_counts > 0),
+        "emojis_per_message": round(float(emoji_counts.mean()), 2),
+        "top_emojis": [e for e, _ in emojis.most_common(5)],
+        "capitalized_start": round(float(starts_upper[has_alpha].mean()), 3) if has_alpha.any() else 0.0,
+        "all_lowercase": share(all_lower),
+        "caps_word_rate": round(caps_words / max(1, len(tokens)), 3),
+        "ends_with": {
+            ".": share(last == "."),
+            "!": share(last == "!"),
+            "?": share(last == "?"),
+            "none": share(~np.isin(last, [".", "!", "?"]) & (emoji_counts == 0)),
+        },
+        "ellipsis_rate": share(ellipsis),
+        "repeated_punct_rate": share(multi_bang),
+        "top_words": [w for w, _ in unigrams.most_common(TOP_N)],
+        "top_bigrams": [
+            b for b, _ in bigrams.most_common() if not all(w in STOPWORDS for w in b.split())
+        ][:TOP_N],
+        "slang": [w for w, _ in slang.most_common(TOP_N)],
+        "elongated": [w for w, _ in elongated.most_common(5)],
+    }
+
+
+def _rate(x: float) -> str:
+    if x >= 0.6:
+        return "usually"
+    if x >= 0.3:
+        return "often"
+    if x >= 0.1:
+        return "sometimes"
+    return "rarely"
+
+
+def describe_profile(profile: dict, short: bool = False) -> str:
+    """
+    Human/prompt-readable summary. `short=True` gives a one-line persona.
+    """
+    if not profile:
+        return ""
+    p50 = profile["word_percentiles"]["p50"]
+    length = "very short" if p50 <= 4 else "short" if p50 <= 9 else "medium-length" if p50 <= 20 else "long"
+    case = "mostly lowercase" if profile["all_lowercase"] >= 0.6 else "normal capitalization"
+    emoji = f"{_rate(profile['emoji_rate'])} uses emoji"
+    if profile["top_emojis"] and profile["emoji_rate"] >= 0.1:
+        emoji += " (" + " ".join(profile["top_emojis"][:3]) + ")"
+    slang = ", ".join(profile["slang"][:5])
+
+    if short:
+        text = f"Writes {length} messages, {case}, {emoji}"
+        return text + (f"; slang like {slang}." if slang else ".")
+
+    ends = profile["ends_with"]
+    lines = [
+        f"- Message length: {length} (median {p50:g} words, 90% under {profile['word_percentiles']['p90']:g}).",
+        f"- Case: {case}; starts with a capital {_rate(profile['capitalized_start'])}.",
+        f"- Punctuation: ends with '.' {_rate(ends['.'])}, '!' {_rate(ends['!'])}, '?' {_rate(ends['?'])}, "
+        f"no end punctuation {_rate(ends['none'])}; '...' {_rate(profile['ellipsis_rate'])}.",
+        f"- Emoji: {emoji}, about {profile['emojis_per_message']:g} per message.",
+    ]
+    if slang:
+        lines.append(f"- Slang: {slang}.")
+    if profile["elongated"]:
+        lines.append(f"- Stretches words like: {', '.join(profile['elongated'][:3])}.")
+    if profile["top_bigrams"]:
+        lines.append(f"- Common phrases: {', '.join(profile['top_bigrams'][:6])}.")
+    return "\n".join(lines)
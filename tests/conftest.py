@@ -0,0 +1,74 @@
+import hashlib
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+# the modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIM = 16
+
+
+class HashEncoder:
+    """
+    Deterministic stand-in for the sentence-transformer, so retrieval
+    needs no model download.
+    """
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, convert_to_numpy=True):
+        import numpy as np
+
+        rows = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            v = np.random.default_rng(seed).standard_normal(DIM).astype("float32")
+            rows.append(v / np.linalg.norm(v))
+        return np.vstack(rows)
+
+
+@pytest.fixture
+def index_sidecar(tmp_path):
+    """
+    An in-thread index_server.py on a socket in tmp_path; yields the
+    IndexService, whose Retriever encodes with HashEncoder.
+    """
+    pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    from chat_engine import Retriever
+    from index_server import IndexServer, IndexService
+
+    retriever = Retriever()
+    retriever._model = HashEncoder()
+    service = IndexService(retriever)
+    service.socket_path = str(tmp_path / "index.sock")
+    server = IndexServer(service.socket_path, service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield service
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_firestore(monkeypatch):
+    """
+    firebase_db / firebase_db_async on a fresh in-memory FakeFirestore,
+    installed as the firebase_config module; yields the FakeFirestore.
+    """
+    from fakes import FakeAsyncFirestore, FakeFirestore, fake_async_transactional, fake_transactional
+
+    fake_db = FakeFirestore()
+    config_module = types.ModuleType("firebase_config")
+    config_module.db = fake_db
+    config_module.transactional = fake_transactional
+    config_module.async_db = FakeAsyncFirestore(fake_db)
+    config_module.async_transactional = fake_async_transactional
+    monkeypatch.setitem(sys.modules, "firebase_config", config_module)
+    for name in ("firebase_db", "firebase_db_async"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    yield fake_db
@@ -0,0 +1,96 @@
+import base64
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+
+from conftest import HashEncoder  # noqa: E402
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"alice:pw").decode()}
+
+
+@pytest.fixture
+def api(fake_firestore, monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("INDEX_SOCKET", raising=False)
+    monkeypatch.delitem(sys.modules, "api", raising=False)
+    import api
+    import firebase_db
+
+    api.engine.retriever._model = HashEncoder()
+    firebase_db.register_user("alice", "pw")
+    api.bot_id = firebase_db.add_bot("alice", "Sam", "yo\nsup\nsee you")
+    return api
+
+
+@pytest.fixture
+def client(api):
+    from starlette.testclient import TestClient
+
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_chat_with_unknown_bot_is_404(api, client, fake_firestore):
+    response = client.post("/chat/nobody", json={"message": "hi"}, headers=AUTH)
+    assert response.status_code == 404
+    assert not [path for path in fake_firestore.docs if "chats" in path]
+
+
+def test_chat_releases_its_lock(api, client):
+    response = client.post(f"/chat/{api.bot_id}", json={"message": "hi"}, headers=AUTH)
+    assert response.status_code == 200 and "event: done" in response.text
+    assert api._chat_locks == {}
+
+
+def test_ws_unknown_bot_is_closed(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws/chat/nobody", headers=AUTH) as ws:
+            ws.receive_json()
+    assert closed.value.code == 4404
+
+
+def test_ws_rejects_messages_that_are_not_objects(api, client):
+    with client.websocket_connect(f"/ws/chat/{api.bot_id}", headers=AUTH) as ws:
+        ws.send_json(["hi"])
+        assert ws.receive_json() == {"error": "messages must be JSON objects"}
+        ws.send_text("{not json")
+        assert ws.receive_json() == {"error": "messages must be JSON objects"}
+        ws.send_json({"message": "hi"})
+        while True:
+            reply = ws.receive_json()
+            if reply.get("done"):
+                break
+        assert reply["reply"]
+
+
+def test_expired_logins_are_pruned(api, client):
+    api._auth_cache[("mallory", "x")] = 0.0
+    assert client.get("/bots", headers=AUTH).status_code == 200
+    assert list(api._auth_cache) == [("alice", api.hashlib.sha256(b"pw").hexdigest())]
+
+
+@pytest.mark.parametrize("body", [
+    b'{"message": "hi", "recent_days": Infinity}',
+    b'{"message": "hi", "since": NaN}',
+    b'{"message": "hi", "until": "soon"}',
+    b'{"message": "hi", "recent_days": -3}',
+])
+def test_chat_rejects_bad_filters(api, client, body):
+    headers = dict(AUTH, **{"Content-Type": "application/json"})
+    response = client.post(f"/chat/{api.bot_id}", content=body, headers=headers)
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_ws_rejects_bad_filters(api, client):
+    with client.websocket_connect(f"/ws/chat/{api.bot_id}", headers=AUTH) as ws:
+        ws.send_text('{"message": "hi", "recent_days": Infinity}')
+        assert ws.receive_json() == {"error": "recent_days must be an integer"}
+        ws.send_json({"message": "hi", "recent_days": -1})
+        assert ws.receive_json() == {"error": "recent_days must not be negative"}
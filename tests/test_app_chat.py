@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("streamlit")
+pytest.importorskip("google.genai")
+
+from fakes import FakeGenaiClient  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app_env(fake_firestore, index_sidecar, monkeypatch):
+    """
+    The app on the local stand-ins: fake Firestore and Gemini, and an
+    index sidecar (INDEX_SOCKET).
+    """
+    import google.genai as genai
+
+    monkeypatch.setattr(genai, "Client", lambda api_key=None, **kwargs: FakeGenaiClient(
+        api_key=api_key, first_token_latency=0, per_token_latency=0))
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("GEMINI_RPM", "100000")
+    monkeypatch.setenv("INDEX_SOCKET", index_sidecar.socket_path)
+
+    import firebase_db
+    import streamlit as st
+
+    st.cache_resource.clear()
+    firebase_db.register_user("alice", "pw")
+    bot_id = firebase_db.add_bot("alice", "Sam", "\n".join(f"yeah see you at {i} then" for i in range(50)),
+                                 persona="chill")
+    yield bot_id
+    st.cache_resource.clear()
+
+
+def test_send_on_first_run_after_login(app_env):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=30)
+    at.run()
+    at.text_input(key="sb_user").input("alice")
+    at.text_input(key="sb_pass").input("pw")
+    at.sidebar.button[0].click()
+    at.run()
+    assert not at.exception
+
+    # the chat panel was only ever rendered by full runs: the send must not
+    # ask for a fragment-scoped rerun
+    at.text_input(key="chat_input_box").input("hey what's up")
+    at.button(key="send_chat_btn").click()
+    at.run()
+    assert not at.exception, at.exception[0].message
+
+    history = at.session_state[f"chat_{app_env}_alice"]
+    assert history[-1]["user"] == "hey what's up"
+    assert history[-1]["bot"]
+    assert at.text_input(key="chat_input_box").value == ""
+
+
+def test_prepare_export_renders_download(app_env):
+    from streamlit.testing.v1 import AppTest
+
+    import firebase_db
+
+    firebase_db.save_chat_history_cloud("alice", app_env, [{"user": "hi", "bot": "yo"}])
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=30)
+    at.run()
+    at.text_input(key="sb_user").input("alice")
+    at.text_input(key="sb_pass").input("pw")
+    at.sidebar.button[0].click()
+    at.run()
+
+    at.button(key=f"export_btn_{app_env}").click()
+    at.run()
+    assert not at.exception
+    assert not [e.value for e in at.error if "Export" in e.value]
+    assert len(at.get("download_button")) == 1
+
+
+def test_cleared_history_is_not_handed_back_by_prewarm(app_env):
+    from streamlit.testing.v1 import AppTest
+
+    import firebase_db
+
+    other = firebase_db.add_bot("alice", "Jo", "\n".join(f"ok cool {i}" for i in range(50)))
+    firebase_db.save_chat_history_cloud("alice", other, [{"user": "old", "bot": "turn"}])
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=30)
+    at.run()
+    at.text_input(key="sb_user").input("alice")
+    at.text_input(key="sb_pass").input("pw")
+    at.sidebar.button[0].click()
+    at.run()
+
+    at.button(key=f"clr_{other}").click()
+    at.run()
+    assert not at.exception
+    at.selectbox(key="chat_selected_bot").set_value(other)
+    at.run()
+    assert not at.exception
+    assert at.session_state[f"chat_{other}_alice"] == []
+    assert firebase_db.load_chat_history_cloud("alice", other) == []
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from bot_bundle import _PREFIX, FORMAT_VERSION, MAGIC, read_bundle, write_bundle  # noqa: E402
+from chat_engine import EMBED_MODEL_NAME, Retriever  # noqa: E402
+
+ROWS = 300
+DIM = 32
+
+
+@pytest.fixture
+def corpus():
+    # non-ASCII and blank lines on purpose: the corpus must come back byte for byte
+    lines = [f"line {i} — ça va? 👍 {'x' * (i % 7)}" for i in range(ROWS)]
+    lines.insert(10, "")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    v = rng.standard_normal((ROWS, DIM)).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def flat_index(vectors):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def resign(path, mutate):
+    """
+    Rewrite a bundle's header (and its checksum, which anyone can do).
+    """
+    data = bytearray(path.read_bytes())
+    magic, version, length, _ = _PREFIX.unpack_from(data, 0)
+    header = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + length]))
+    mutate(header)
+    new = json.dumps(header).encode("utf-8")
+    assert len(new) <= length
+    new = new.ljust(length)
+    data[_PREFIX.size:_PREFIX.size + length] = new
+    _PREFIX.pack_into(data, 0, magic, version, length, hashlib.sha256(new).digest())
+    path.write_bytes(bytes(data))
+
+
+class _Model:
+    def __init__(self, dim):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+
+def retriever(dim=DIM):
+    r = Retriever(EMBED_MODEL_NAME)
+    r._model = _Model(dim)     # adopting a bundle encodes nothing; only the dimension is asked
+    return r
+
+
+def write(path, corpus, vectors, **kwargs):
+    kwargs.setdefault("index", flat_index(vectors))
+    return write_bundle(str(path), corpus, vectors, "John", persona="chill", style_profile={"emoji_rate": 0.1},
+                        message_store=b"\x00store\xff", **kwargs)
+
+
+def test_round_trip_float16(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors)
+    with read_bundle(str(path)) as bundle:
+        assert bytes(bundle._section("corpus")) == corpus.encode("utf-8")
+        assert bundle.bot_text == corpus
+        assert (bundle.name, bundle.persona, bundle.style_profile) == ("John", "chill", {"emoji_rate": 0.1})
+        assert bundle.message_store() == b"\x00store\xff"
+        assert bundle.embeddings().dtype == np.float16
+        np.testing.assert_allclose(bundle.vectors(), vectors, atol=1e-3)
+
+
+def test_round_trip_int8(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors, dtype="int8")
+    with read_bundle(str(path)) as bundle:
+        assert bundle.embeddings().dtype == np.int8
+        # symmetric per-dimension quantization: off by at most half a step
+        step = np.abs(vectors).max(axis=0) / 127.0
+        assert np.all(np.abs(bundle.vectors() - vectors) <= step / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("with_index", [True, False])
+def test_index_same_top_k(tmp_path, corpus, vectors, with_index):
+    path = tmp_path / "john.cbb"
+    source = flat_index(vectors)
+    write(path, corpus, vectors, index=source if with_index else None)
+    queries = np.random.default_rng(1).standard_normal((8, DIM)).astype("float32")
+    _, expected = source.search(queries, 10)
+    with read_bundle(str(path)) as bundle:
+        index = bundle.faiss_index(trust_index=True)
+        assert (index.ntotal, index.d) == (ROWS, DIM)
+        _, ids = index.search(queries, 10)
+    if with_index:
+        np.testing.assert_array_equal(ids, expected)
+    else:
+        # rebuilt from float16 rows: near ties may swap, the neighbours may not change
+        assert all(set(a[:5]) <= set(b) for a, b in zip(ids, expected))
+
+
+def test_corrupted_section_fails_checksum(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    header = write(path, corpus, vectors)
+    data = bytearray(path.read_bytes())
+    data[header["sections"]["embeddings"]["offset"] + 5] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="embeddings checksum"):
+        read_bundle(str(path))
+    # without verification it opens; the damage is only caught by verify()
+    with read_bundle(str(path), verify=False) as bundle:
+        with pytest.raises(ValueError, match="checksum"):
+            bundle.verify()
+
+
+def test_truncated_file_rejected(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    header = write(path, corpus, vectors)
+    data = path.read_bytes()
+    # the last byte of actual data (only alignment padding follows it)
+    end = max(entry["offset"] + entry["length"] for entry in header["sections"].values())
+    for size in (0, 20, 200, len(data) // 2, end - 1):
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            read_bundle(str(path))
+
+
+def test_unknown_version_rejected(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors)
+    data = bytearray(path.read_bytes())
+    for version in (0, FORMAT_VERSION + 1):
+        struct.pack_into("<I", data, len(MAGIC), version)
+        path.write_bytes(bytes(data))
+        with pytest.raises(ValueError, match="version"):
+            read_bundle(str(path))
+
+
+def test_not_a_bundle_rejected(tmp_path):
+    path = tmp_path / "notes.cbb"
+    path.write_bytes(b"just some text, not a bundle" * 10)
+    with pytest.raises(ValueError, match="not a bot bundle"):
+        read_bundle(str(path))
+
+
+def test_untrusted_index_is_rebuilt_from_embeddings(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    # an index section that has nothing to do with the embeddings
+    write(path, corpus, vectors, index=flat_index(vectors[::-1].copy()))
+    with read_bundle(str(path)) as bundle:
+        index = bundle.faiss_index()
+        np.testing.assert_allclose(index.reconstruct_n(0, ROWS), bundle.vectors())
+
+
+def test_trusted_index_must_match_header(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors, index=flat_index(vectors[:ROWS // 2].copy()))
+    with read_bundle(str(path)) as bundle:
+        with pytest.raises(ValueError, match="index holds"):
+            bundle.faiss_index(trust_index=True)
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda h: h.update(rows=h["rows"] + 1), "embeddings section"),
+    (lambda h: h.update(dim=h["dim"] * 2), "embeddings section"),
+    (lambda h: h.update(rows=-1), "bad shape"),
+    (lambda h: h.update(dtype="float64"), "dtype"),
+    (lambda h: h["sections"].pop("embeddings"), "no embeddings"),
+])
+def test_inconsistent_header_rejected(tmp_path, corpus, vectors, mutate, message):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors)
+    resign(path, mutate)
+    with pytest.raises(ValueError, match=message):
+        read_bundle(str(path))
+
+
+def test_adopt_bundle(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors)
+    r = retriever()
+    with read_bundle(str(path)) as bundle:
+        bot_index = r.adopt_bundle(bundle, "john")
+    assert bot_index.index.ntotal == ROWS == len(bot_index.lines)
+    _, expected = flat_index(vectors).search(vectors[:3], 1)
+    assert r.search_rows(corpus, vectors[:3], 1, bot_id="john") == [int(expected[0][0])]
+
+
+def test_adopt_bundle_rejects_mismatches(tmp_path, corpus, vectors):
+    path = tmp_path / "john.cbb"
+    write(path, corpus, vectors)
+    with read_bundle(str(path)) as bundle:
+        with pytest.raises(ValueError, match="dimensions"):
+            retriever(dim=DIM * 2).adopt_bundle(bundle, "john")
+    resign(path, lambda h: h.update(model="some-other-model"))
+    with read_bundle(str(path)) as bundle:
+        with pytest.raises(ValueError, match="some-other-model"):
+            retriever().adopt_bundle(bundle, "john")
+    # one corpus line more than there are embedding rows
+    extra = corpus + "one more line\n"
+    write(path, extra, np.vstack([vectors, vectors[:1]]))
+    resign(path, lambda h: h.update(rows=ROWS, sections={**h["sections"], "embeddings": {
+        **h["sections"]["embeddings"], "length": ROWS * DIM * 2}}))
+    with read_bundle(str(path), verify=False) as bundle:
+        with pytest.raises(ValueError, match="corpus lines"):
+            retriever().adopt_bundle(bundle, "john")
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from bulk_import import merge_records, process_member  # noqa: E402
+
+FIRST = """12/01/2023, 10:15 - John: ok
+12/01/2023, 10:15 - John: ok
+12/01/2023, 10:16 - Me: see you at the gym
+12/01/2023, 10:17 - John: yeah see you there
+"""
+# a later export of the same chat: overlaps the first one, then goes on
+SECOND = FIRST + """12/01/2023, 10:30 - John: ok
+12/01/2023, 10:31 - Me: running late
+"""
+
+
+def records(name: str, text: str) -> list:
+    return process_member(name, text.encode(), "John", [], embed=False)["records"]
+
+
+def test_repeats_within_one_export_are_kept():
+    assert [text for _, _, text in records("a.txt", FIRST)] == ["ok", "ok", "see you at the gym",
+                                                                "yeah see you there"]
+
+
+def test_overlapping_exports_merge_once():
+    merged = merge_records([records("a.txt", FIRST), records("b.txt", SECOND)])
+    # both "ok"s of 10:15 once, plus the new one of 10:30
+    assert [text for _, _, text in merged] == ["ok", "ok", "see you at the gym", "yeah see you there", "ok",
+                                               "running late"]
+
+
+def test_merge_keeps_file_order_within_a_minute():
+    merged = merge_records([records("b.txt", SECOND), records("a.txt", FIRST)])
+    assert merged == records("b.txt", SECOND)
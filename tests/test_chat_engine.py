@@ -0,0 +1,200 @@
+import pytest
+
+from chat_engine import ChatEngine, OFFLINE_MESSAGE
+from gemini_client import GeminiError
+
+
+class Store:
+    def __init__(self, fail_get=False):
+        self.fail_get = fail_get
+        self.saved = []
+
+    def get_bot(self, user, bot):
+        if self.fail_get:
+            raise RuntimeError("firestore down")
+        return {"name": "Sam", "file_text": "yo\nsup"}
+
+    def save_chat_history_cloud(self, user, bot, history):
+        self.saved.append([dict(entry) for entry in history])
+
+    def load_chat_memory(self, user, bot):
+        return []
+
+    def save_chat_memory(self, user, bot, pages, stale=()):
+        pass
+
+
+class Retriever:
+    def encode(self, texts):
+        import numpy as np
+
+        return np.zeros((len(texts), 4), dtype="float32")
+
+    def search(self, bot_text, qvec, k, bot_id=None):
+        return bot_text.splitlines()
+
+
+class LLM:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def stream(self, prompt, model=None, usage=None):
+        yield from self.chunks
+        if self.error:
+            raise self.error
+
+
+def engine(llm, store=None):
+    pytest.importorskip("numpy")
+    return ChatEngine(llm=llm, store=store or Store(), retriever=Retriever())
+
+
+def pending():
+    return [{"user": "hey", "bot": "", "ts": ""}]
+
+
+@pytest.mark.parametrize("error", [RuntimeError("socket reset"), ValueError("bad chunk")])
+def test_unexpected_error_finishes_turn(error, caplog):
+    e = engine(LLM([], error))
+    history = pending()
+    assert list(e.stream("bob", "sam", history)) == []
+    assert history[-1]["bot"] == OFFLINE_MESSAGE
+    assert e.store.saved[-1][-1]["bot"] == OFFLINE_MESSAGE
+    assert "generating a reply failed" in caplog.text
+
+
+def test_error_after_some_text_keeps_it():
+    e = engine(LLM(["hey ", "there"], RuntimeError("socket reset")))
+    history = pending()
+    assert "".join(e.stream("bob", "sam", history)) == "hey there"
+    assert e.store.saved[-1][-1]["bot"] == "hey there"
+
+
+def test_gemini_error_uses_its_message():
+    error = GeminiError("quota")
+    e = engine(LLM([], error))
+    history = pending()
+    list(e.stream("bob", "sam", history))
+    assert history[-1]["bot"] == error.user_message
+
+
+def test_closed_stream_saves_partial_reply():
+    e = engine(LLM(["hey ", "there ", "friend"]))
+    history = pending()
+    chunks = e.stream("bob", "sam", history)
+    assert next(chunks) == "hey "
+    chunks.close()
+    assert e.store.saved[-1][-1]["bot"] == "hey"
+
+
+def test_failed_prepare_finishes_turn():
+    e = engine(LLM(["unused"]), Store(fail_get=True))
+    history = pending()
+    assert list(e.stream("bob", "sam", history)) == []
+    assert e.store.saved[-1][-1]["bot"] == OFFLINE_MESSAGE
+
+
+class EndlessLLM:
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    def stream(self, prompt, model=None, usage=None):
+        import time
+
+        try:
+            while True:
+                self.sent += 1
+                yield f"word{self.sent} "
+                time.sleep(0.01)
+        finally:
+            self.closed = True
+
+
+def test_astream_disconnect_stops_generation():
+    import asyncio
+    import time
+
+    llm = EndlessLLM()
+    e = engine(llm)
+    history = pending()
+
+    async def read_one():
+        chunks = e.astream("bob", "sam", history)
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        return first
+
+    assert asyncio.run(read_one()) == "word1 "
+    deadline = time.monotonic() + 2
+    while not e.store.saved and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert llm.closed
+    sent = llm.sent
+    time.sleep(0.05)
+    assert llm.sent == sent
+    assert e.store.saved[-1][-1]["bot"].startswith("word1")
+
+
+class MemoryStore(Store):
+    """Persists chat memory pages, shared by engines standing in for separate processes."""
+
+    def __init__(self):
+        super().__init__()
+        self.memory = {}
+
+    def load_chat_memory(self, user, bot):
+        return [self.memory[page] for page in sorted(self.memory)]
+
+    def save_chat_memory(self, user, bot, pages, stale=()):
+        self.memory.update(pages)
+        for page in stale:
+            self.memory.pop(page, None)
+
+
+class HashRetriever(Retriever):
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts):
+        from conftest import HashEncoder
+
+        self.encoded += len(texts)
+        return HashEncoder().encode(texts)
+
+
+def turns(*texts):
+    return [{"user": t, "bot": f"re {t}", "ts": f"2024-01-0{i + 1} 10:00"} for i, t in enumerate(texts)]
+
+
+def test_memory_rewritten_elsewhere_is_reloaded():
+    pytest.importorskip("faiss")
+    store = MemoryStore()
+    here = ChatEngine(llm=None, store=store, retriever=HashRetriever())
+    elsewhere = ChatEngine(llm=None, store=store, retriever=HashRetriever())
+
+    here._remember("bob", "sam", turns("old a", "old b"))
+    # another process clears the history and the chat goes on there
+    fresh = turns("new a", "new b", "new c", "new d")
+    elsewhere._remember("bob", "sam", [])
+    elsewhere._remember("bob", "sam", fresh)
+
+    memory = here.memory("bob", "sam", fresh)
+    assert memory.n_turns == 4 and memory.matches(fresh)
+    assert here.retriever.encoded == 2  # reloaded, not re-embedded
+    expected = HashRetriever().encode(["User: new a\nBot: re new a"])
+    assert memory.index.reconstruct(0) == pytest.approx(expected[0], abs=1e-2)
+
+
+def test_stale_memory_pages_are_rebuilt():
+    pytest.importorskip("faiss")
+    store = MemoryStore()
+    e = ChatEngine(llm=None, store=store, retriever=HashRetriever())
+    e._remember("bob", "sam", turns("old a", "old b"))
+    # the history was cleared without the memory pages and rewritten, longer
+    fresh = turns("new a", "new b", "new c")
+    other = ChatEngine(llm=None, store=store, retriever=HashRetriever())
+    other._remember("bob", "sam", fresh)
+    assert other.retriever.encoded == 3
+    assert store.memory[0]["turns"] == 3 and store.memory[0]["tail"] == other.memory("bob", "sam", fresh).tail
@@ -0,0 +1,163 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("bcrypt")
+pytest.importorskip("google.api_core")
+
+import fakes  # noqa: E402
+
+
+def corpus(seed: int, lines: int = 3000) -> str:
+    # random enough not to compress to a single chunk
+    rng = random.Random(seed)
+    return "\n".join("".join(rng.choices("abcdefghijklmnopqrstuvwxyz ", k=40)) for _ in range(lines))
+
+
+@pytest.fixture
+def store(fake_firestore, monkeypatch):
+    import firebase_db
+
+    monkeypatch.setattr(firebase_db, "CHUNK_BYTES", 1000)
+    transaction_writes = []
+
+    def commit(self):
+        transaction_writes.append(len(self._writes))
+        return commit_writes(self)
+
+    commit_writes = fakes.FakeTransaction.commit
+    monkeypatch.setattr(fakes.FakeTransaction, "commit", commit)
+    apply_writes = fakes.FakeAsyncTransaction._apply
+
+    def apply(self):
+        transaction_writes.append(len(self._writes))
+        return apply_writes(self)
+
+    monkeypatch.setattr(fakes.FakeAsyncTransaction, "_apply", apply)
+    fake_firestore.transaction_writes = transaction_writes
+    return fake_firestore
+
+
+def chunk_ids(db, bot_id: str, collection: str = "chunks") -> set:
+    prefix = ("users", "bob", "bots", bot_id, collection)
+    return {path[-1] for path in db.docs if path[:-1] == prefix}
+
+
+def fresh_read(firebase_db, bot_id: str) -> str:
+    firebase_db._corpus_cache.clear()
+    return firebase_db.get_bot("bob", bot_id)["file_text"]
+
+
+def test_update_writes_chunks_outside_the_transaction(store):
+    import firebase_db
+
+    bot_id = firebase_db.add_bot("bob", "John", corpus(1), message_store=b"\x01" * 5000)
+    old_ids = chunk_ids(store, bot_id)
+    assert len(old_ids) > 1 and chunk_ids(store, bot_id, "store_chunks")
+
+    assert firebase_db.update_bot("bob", bot_id, "John", corpus(2))
+    # one write: the bot document
+    assert store.transaction_writes == [1]
+    new_ids = chunk_ids(store, bot_id)
+    assert new_ids and not new_ids & old_ids
+    assert not chunk_ids(store, bot_id, "store_chunks")
+    assert fresh_read(firebase_db, bot_id) == corpus(2)
+    assert firebase_db.get_bot_message_store("bob", bot_id) is None
+
+
+def test_update_replaces_chunks_without_generation(store):
+    import firebase_db
+
+    bot_id = firebase_db.add_bot("bob", "John", corpus(1))
+    # the layout before generations: {0000, 0001, ...} and no file_gen
+    ref = firebase_db._bots_ref("bob").document(bot_id)
+    data = ref.get().to_dict()
+    for i in range(data["file_chunks"]):
+        old = ref.collection("chunks").document(firebase_db._chunk_id(data["file_gen"], i))
+        ref.collection("chunks").document(f"{i:04d}").set(old.get().to_dict())
+        old.delete()
+    ref.update({"file_gen": None})
+    assert fresh_read(firebase_db, bot_id) == corpus(1)
+
+    assert firebase_db.update_bot("bob", bot_id, "John", corpus(2))
+    assert all("-" in doc_id for doc_id in chunk_ids(store, bot_id))
+    assert fresh_read(firebase_db, bot_id) == corpus(2)
+
+
+def test_update_of_missing_bot_leaves_no_chunks(store):
+    import firebase_db
+
+    assert not firebase_db.update_bot("bob", "nobody", "John", corpus(2))
+    assert not chunk_ids(store, "nobody")
+
+
+def test_read_with_replaced_document_rereads(store):
+    import firebase_db
+
+    bot_id = firebase_db.add_bot("bob", "John", corpus(1))
+    ref = firebase_db._bots_ref("bob").document(bot_id)
+    before = ref.get().to_dict()
+    firebase_db.update_bot("bob", bot_id, "John", corpus(2))
+    firebase_db._corpus_cache.clear()
+    # `before` points at chunks that were deleted after the update
+    assert firebase_db._read_corpus(ref, before) == corpus(2)
+
+
+def test_async_update(store):
+    import firebase_db
+    import firebase_db_async
+
+    bot_id = firebase_db.add_bot("bob", "John", corpus(1))
+    old_ids = chunk_ids(store, bot_id)
+
+    assert asyncio.run(firebase_db_async.update_bot("bob", bot_id, "Johnny", corpus(2)))
+    assert store.transaction_writes == [1]
+    assert not chunk_ids(store, bot_id) & old_ids
+    firebase_db._corpus_cache.clear()
+    bot = asyncio.run(firebase_db_async.get_bot("bob", bot_id))
+    assert (bot["name"], bot["file_text"]) == ("Johnny", corpus(2))
+
+
+def entries(n: int, label: str = "m") -> list:
+    return [{"user": f"{label}{i}", "bot": "ok", "ts": "10:00 AM"} for i in range(n)]
+
+
+def restart_elsewhere(db) -> None:
+    # another process clears the chat and starts over, behind this one's back
+    chat = ("users", "bob", "chats", "sam")
+    for path in [p for p in db.docs if p[:len(chat)] == chat]:
+        del db.docs[path]
+    db.docs[chat] = {"count": 1}
+    db.docs[chat + ("pages", "0000")] = {"entries": entries(1, "other")}
+
+
+def test_history_save_reads_the_stored_count(store):
+    import firebase_db
+
+    firebase_db.save_chat_history_cloud("bob", "sam", entries(450))
+    restart_elsewhere(store)
+    firebase_db.save_chat_history_cloud("bob", "sam", entries(451))
+    assert firebase_db.load_chat_history_cloud("bob", "sam") == entries(451)
+
+
+def test_async_history_save_reads_the_stored_count(store):
+    import firebase_db_async
+
+    asyncio.run(firebase_db_async.save_chat_history_cloud("bob", "sam", entries(450)))
+    restart_elsewhere(store)
+    asyncio.run(firebase_db_async.save_chat_history_cloud("bob", "sam", entries(451)))
+    assert asyncio.run(firebase_db_async.load_chat_history_cloud("bob", "sam")) == entries(451)
+
+
+def test_appends_go_through_one_transaction(store):
+    import firebase_db
+
+    history = entries(199)
+    firebase_db.save_chat_history_cloud("bob", "sam", history)
+    history.append(entries(1, "new")[0])
+    store.transaction_writes.clear()
+    firebase_db.save_chat_history_cloud("bob", "sam", history)
+    # the last page and the main document
+    assert store.transaction_writes == [2]
+    assert firebase_db.load_chat_history_page("bob", "sam", 199, 5) == (history[199:], 200)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from gemini_client import GeminiError, ResilientGemini, classify_error
+
+
+class HangingModels:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate_content(self, model, contents, **kwargs):
+        self.release.wait()
+        return "done"
+
+
+class HangingClient:
+    def __init__(self):
+        self.models = HangingModels()
+
+
+def gemini(client, workers=2):
+    return ResilientGemini(client, fallback_model=None, requests_per_minute=6000, max_retries=0,
+                           deadline=0.1, max_workers=workers)
+
+
+def test_abandoned_calls_bound_the_workers():
+    client = HangingClient()
+    llm = gemini(client)
+    for _ in range(2):
+        with pytest.raises(GeminiError) as e:
+            llm.generate("hi")
+        assert e.value.kind == "timeout"
+    assert llm.stats()["abandoned"] == 2 and llm.stats()["in_flight"] == 2
+
+    # both workers still hang: shed at the deadline instead of queuing behind them
+    with pytest.raises(GeminiError):
+        llm.generate("hi")
+    assert llm.stats()["shed_busy"] == 1
+
+    client.models.release.set()
+    deadline = time.monotonic() + 2
+    while llm.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert llm.stats()["in_flight"] == 0
+    assert llm.generate("hi") == "done"
+
+
+def test_httpx_timeouts_are_retryable():
+    httpx = pytest.importorskip("httpx")
+    assert classify_error(httpx.ReadTimeout("timed out")) == "timeout"
+    assert classify_error(httpx.ConnectTimeout("timed out")) == "timeout"
+
+
+class ScriptedModels:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def generate_content(self, model, contents, **kwargs):
+        outcome = self.outcomes.pop(0) if self.outcomes else "done"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class ScriptedClient:
+    def __init__(self, *outcomes):
+        self.models = ScriptedModels(*outcomes)
+
+
+def half_open(llm):
+    """Open the default model's breaker with its reset timeout already over."""
+    breaker = llm._breaker(llm.model)
+    breaker.state = "open"
+    breaker._opened_at = time.monotonic() - breaker.reset_timeout
+    return breaker
+
+
+def test_probe_shed_for_busy_workers_is_released():
+    llm = gemini(ScriptedClient(), workers=1)
+    breaker = half_open(llm)
+    llm._workers.acquire()
+    with pytest.raises(GeminiError) as e:
+        llm.generate("hi")
+    assert e.value.kind == "timeout" and llm.stats()["shed_busy"] == 1
+    assert breaker.state == "open"
+
+    llm._workers.release()
+    assert llm.generate("hi") == "done"
+    assert breaker.state == "closed"
+
+
+def test_probe_shed_by_the_rate_limit_is_released():
+    llm = gemini(ScriptedClient())
+    breaker = half_open(llm)
+    llm.bucket._tokens = 0
+    llm.bucket._updated = time.monotonic()
+    with pytest.raises(GeminiError) as e:
+        llm.generate("hi", deadline=0.001)
+    assert e.value.kind == "quota" and llm.stats()["shed"] == 1
+    assert breaker.state == "open"
+
+    assert llm.generate("hi", deadline=1.0) == "done"
+    assert breaker.state == "closed"
+
+
+def test_not_found_probe_completes():
+    llm = gemini(ScriptedClient(Exception("404 NOT_FOUND: no such model")))
+    breaker = half_open(llm)
+    with pytest.raises(GeminiError) as e:
+        llm.generate("hi")
+    assert e.value.kind == "not_found"
+    assert breaker.state == "closed"
+    assert llm.generate("hi") == "done"
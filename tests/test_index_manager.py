@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+import types
+
+import pytest
+
+from index_manager import BotIndexManager
+
+
+def fake_index(bot_text):
+    lines = bot_text.splitlines()
+    return types.SimpleNamespace(index=types.SimpleNamespace(ntotal=len(lines), d=4), lines=lines)
+
+
+def save(bot_index, path):
+    with open(path, "w") as f:
+        f.write("\n".join(bot_index.lines))
+
+
+def load(path, bot_text):
+    with open(path) as f:
+        return fake_index(f.read())
+
+
+def manager(tmp_path, build=fake_index, budget=1):
+    # a budget of one byte keeps only the most recent index resident
+    return BotIndexManager(build, budget, spill_dir=str(tmp_path), load=load, save=save)
+
+
+def test_evict_matches_exact_bot_id(tmp_path):
+    m = manager(tmp_path, budget=10 ** 9)
+    m.get("a\nb", bot_id="bob")
+    m.get("c\nd", bot_id="bob-2")
+    m.evict("bob")
+    assert [key[0] for key in m._entries] == ["bob-2"]
+
+
+def test_evict_unlinks_spill_files(tmp_path):
+    m = manager(tmp_path)
+    m.get("a\nb", bot_id="bob")
+    m.get("a\nb\nc", bot_id="bob")      # spills the first index of bob
+    m.get("c\nd", bot_id="bob-2")       # spills the second one
+    m.get("e", bot_id="carol")          # spills bob-2
+    assert len(os.listdir(tmp_path)) == 2
+
+    m.evict("bob")
+    remaining = os.listdir(tmp_path)
+    assert len(remaining) == 1 and remaining[0].startswith("bob-2-")
+    assert m.stats()["spill_deletes"] == 2
+
+    # the evicted index is rebuilt, not read back from disk
+    m.get("a\nb", bot_id="bob")
+    assert m.stats().get("spill_loads", 0) == 0
+
+
+def test_spilled_index_reloaded(tmp_path):
+    m = manager(tmp_path)
+    m.get("a\nb", bot_id="bob")
+    m.get("c", bot_id="carol")
+    assert m.get("a\nb", bot_id="bob").lines == ["a", "b"]
+    assert m.stats()["spill_loads"] == 1
+    assert m.stats()["builds"] == 2
+
+
+def test_failed_build_releases_key(tmp_path):
+    calls = []
+
+    def flaky(bot_text):
+        calls.append(bot_text)
+        if len(calls) == 1:
+            raise RuntimeError("encoder down")
+        return fake_index(bot_text)
+
+    m = manager(tmp_path, build=flaky)
+    with pytest.raises(RuntimeError):
+        m.get("a\nb", bot_id="bob")
+    assert not m._building
+    assert m.get("a\nb", bot_id="bob").lines == ["a", "b"]
+
+
+def test_spill_replaces_older_corpus_of_bot(tmp_path):
+    m = manager(tmp_path)
+    m.get("a\nb", bot_id="bob")
+    m.get("c", bot_id="bob-2")           # spills bob's first corpus
+    m.get("a\nb\nc", bot_id="bob")       # bob was updated; spills bob-2
+    m.get("d", bot_id="carol")           # spills bob's new corpus, dropping the old one
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 2 and names[0].startswith("bob-2-")
+    assert names[1] == os.path.basename(m._spill_path(m.key_for("a\nb\nc", "bob")))
+
+
+def test_build_lock_outlives_waiters(tmp_path):
+    gates = [threading.Event(), threading.Event()]
+    builds = []
+
+    def build(bot_text):
+        builds.append(bot_text)
+        n = len(builds)
+        gates[min(n, 2) - 1].wait(5)
+        if n == 1:
+            raise RuntimeError("encoder down")
+        return fake_index(bot_text)
+
+    def wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def get():
+        try:
+            m.get("a\nb", bot_id="bob")
+        except RuntimeError:
+            pass
+
+    m = manager(tmp_path, build=build, budget=10 ** 9)
+    first, waiter, late = (threading.Thread(target=get) for _ in range(3))
+    first.start()
+    wait_for(lambda: builds)
+    waiter.start()
+    wait_for(lambda: m.stats()["misses"] == 2)
+    gates[0].set()                       # the first build fails; the waiter builds next
+    wait_for(lambda: len(builds) == 2)
+    late.start()                         # must wait for the waiter's build, not start its own
+    wait_for(lambda: m.stats()["misses"] == 3)
+    time.sleep(0.05)
+    gates[1].set()
+    for t in (first, waiter, late):
+        t.join(5)
+    assert len(builds) == 2
+    assert not m._building
@@ -0,0 +1,92 @@
+import logging
+import socket
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from conftest import HashEncoder  # noqa: E402
+from index_manager import content_hash  # noqa: E402
+from index_server import RemoteRetriever, recv_message, send_message  # noqa: E402
+
+CORPUS = "\n".join(f"line number {i} of the chat" for i in range(40))
+OTHER = "\n".join(f"another bot says {i}" for i in range(40))
+
+
+def client(service):
+    return RemoteRetriever(service.socket_path)
+
+
+def test_service_keeps_no_texts(index_sidecar):
+    remote = client(index_sidecar)
+    remote.index_for(CORPUS, "sam")
+    assert not hasattr(index_sidecar, "texts")
+    assert index_sidecar.retriever.indexes.resident("sam", content_hash(CORPUS)) is not None
+
+
+def test_search_after_eviction_resends_text(index_sidecar):
+    # room for one index: loading the second bot evicts the first
+    index_sidecar.retriever.indexes.budget_bytes = 1
+    remote = client(index_sidecar)
+    qvec = HashEncoder().encode(["line number 7 of the chat"])
+    remote.index_for(CORPUS, "sam")
+    remote.index_for(OTHER, "max")
+    assert index_sidecar.retriever.indexes.resident("sam", content_hash(CORPUS)) is None
+
+    assert remote.search(CORPUS, qvec, k=1, bot_id="sam") == ["line number 7 of the chat"]
+    assert index_sidecar.retriever.indexes.resident("sam", content_hash(CORPUS)) is not None
+
+
+def test_unknown_hash_is_not_served(index_sidecar):
+    client(index_sidecar).index_for(CORPUS, "sam")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(index_sidecar.socket_path)
+    with sock:
+        send_message(sock, {"op": "search", "bot_id": "sam", "hash": content_hash(OTHER),
+                            "vector": [0.0] * 16, "k": 1})
+        assert recv_message(sock) == {"ok": False, "error": "unknown_bot"}
+
+
+def test_adopt_sends_vectors(index_sidecar):
+    # vectors the encoder would never produce: the sidecar must index these, not re-encode
+    vectors = np.random.default_rng(0).standard_normal((40, 16)).astype("float32")
+    remote = client(index_sidecar)
+    remote.adopt(CORPUS, "sam", vectors)
+    assert remote.search(CORPUS, vectors[7:8], k=1, bot_id="sam") == ["line number 7 of the chat"]
+    assert "builds" not in index_sidecar.retriever.stats()
+
+
+def test_adopt_rejects_mismatched_vectors(index_sidecar):
+    with pytest.raises(ValueError, match="39 vectors for 40 lines"):
+        client(index_sidecar).adopt(CORPUS, "sam", np.zeros((39, 16), dtype="float32"))
+
+
+def slow_builds(service, seconds):
+    build = service.retriever.indexes.build
+
+    def slow(bot_text):
+        time.sleep(seconds)
+        return build(bot_text)
+
+    service.retriever.indexes.build = slow
+
+
+def test_load_waits_longer_than_requests(index_sidecar):
+    slow_builds(index_sidecar, 0.3)
+    remote = RemoteRetriever(index_sidecar.socket_path, timeout=0.05, load_timeout=5)
+    remote.index_for(CORPUS, "sam")
+    assert remote.search(CORPUS, HashEncoder().encode(["x"]), k=1, bot_id="sam")
+
+
+def test_load_timeout_falls_back_and_logs(index_sidecar, caplog):
+    from chat_engine import Retriever
+
+    slow_builds(index_sidecar, 0.5)
+    local = Retriever()
+    local._model = HashEncoder()
+    remote = RemoteRetriever(index_sidecar.socket_path, fallback=lambda: local, timeout=5, load_timeout=0.05)
+    with caplog.at_level(logging.WARNING, logger="index_server"):
+        remote.index_for(CORPUS, "sam")
+    assert local.indexes.resident("sam", content_hash(CORPUS)) is not None
+    assert any("failed for bot sam" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,40 @@
+import threading
+
+import prewarm
+from prewarm import Prewarmer, forget_bot
+
+
+def settle(future):
+    future.result(timeout=5)
+
+
+def test_take_hands_over_a_fresh_result():
+    pw = Prewarmer(workers=1)
+    settle(pw.submit(("alice", "history", "b1"), 0, lambda: ["old"]))
+    assert pw.take(("alice", "history", "b1")) == ["old"]
+    assert pw.take(("alice", "history", "b1")) is None
+
+
+def test_take_drops_a_stale_result(monkeypatch):
+    pw = Prewarmer(workers=1)
+    settle(pw.submit(("alice", "history", "b1"), 0, lambda: ["old"]))
+    monkeypatch.setattr(prewarm, "TAKE_MAX_AGE_S", 0)
+    assert pw.take(("alice", "history", "b1")) is None
+    assert pw.stats()["stale"] == 1
+
+
+def test_forget_bot_drops_its_results_and_queued_jobs():
+    pw = Prewarmer(workers=1)
+    settle(pw.submit(("alice", "history", "b1"), 0, lambda: ["before clear"]))
+    settle(pw.submit(("alice", "bot", "b2"), 0, lambda: {"name": "b2"}))
+    gate = threading.Event()
+    blocker = pw.submit(("other",), 0, gate.wait)
+    queued = pw.submit(("alice", "bot", "b1"), 1, lambda: {"name": "old name"})
+
+    forget_bot(pw, "alice", "b1")
+    assert queued.cancelled()
+    assert pw.take(("alice", "history", "b1")) is None
+    assert pw.take(("alice", "bot", "b1")) is None
+    assert pw.take(("alice", "bot", "b2")) == {"name": "b2"}
+    gate.set()
+    settle(blocker)
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from gemini_client import GeminiError
+from scheduler import GenerationScheduler, TokenMeter, utc_day
+
+
+class Store:
+    def __init__(self, fail=False, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+        self.writes = []
+
+    def get_token_usage(self, user):
+        return {}
+
+    def add_token_usage(self, user, day, prompt_tokens, output_tokens):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("firestore down")
+        self.writes.append((user, day, prompt_tokens, output_tokens))
+        total = sum(p + o for u, _, p, o in self.writes if u == user)
+        return {"day": day, "prompt": 0, "output": 0, "total": total}
+
+
+def test_record_does_not_write_inline():
+    store = Store(delay=1.0)
+    meter = TokenMeter(store, flush_interval=60)
+    started = time.perf_counter()
+    meter.record("bob", 10, 5)
+    meter.record("bob", 1, 1)
+    assert time.perf_counter() - started < 0.5
+    assert meter.used("bob") == 17 and store.writes == []
+
+
+def test_flush_writes_once_per_user():
+    store = Store()
+    meter = TokenMeter(store, flush_interval=60)
+    for _ in range(3):
+        meter.record("bob", 10, 5)
+    meter.record("ann", 1, 1)
+    meter.flush()
+    assert sorted(store.writes) == [("ann", utc_day(), 1, 1), ("bob", utc_day(), 30, 15)]
+    assert meter.used("bob") == 45
+
+
+def test_failed_flush_keeps_tokens():
+    store = Store(fail=True)
+    meter = TokenMeter(store, flush_interval=60)
+    meter.record("bob", 10, 5)
+    meter.flush()
+    assert meter.counters["save_errors"] == 1 and meter.used("bob") == 15
+    store.fail = False
+    meter.flush()
+    assert store.writes == [("bob", utc_day(), 10, 5)]
+
+
+def test_background_flush():
+    store = Store()
+    meter = TokenMeter(store, flush_interval=0.05)
+    meter.record("bob", 10, 5)
+    deadline = time.monotonic() + 2
+    while not store.writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.writes == [("bob", utc_day(), 10, 5)]
+
+
+def hold(scheduler, user):
+    # occupies the only slot until the returned event is set
+    release, entered = threading.Event(), threading.Event()
+
+    def run():
+        with scheduler.slot(user, 100):
+            entered.set()
+            release.wait()
+
+    threading.Thread(target=run, daemon=True).start()
+    entered.wait()
+    return release
+
+
+def test_timed_out_ticket_gives_its_cost_back():
+    scheduler = GenerationScheduler(concurrency=1, max_wait=0.05)
+    release = hold(scheduler, "ann")
+    before = scheduler._finish["ann"]
+    with pytest.raises(GeminiError):
+        with scheduler.slot("bob", 1000):
+            pass
+    assert scheduler._finish.get("bob", scheduler._vtime) <= scheduler._vtime
+    assert scheduler.counters["timed_out"] == 1
+    release.set()
+    assert scheduler._finish.get("ann", before) == before
+
+
+def test_withdrawn_ticket_moves_later_ones_back():
+    scheduler = GenerationScheduler(concurrency=1, max_wait=30)
+    release = hold(scheduler, "ann")
+    with scheduler._cond:
+        first = scheduler._finish.get("bob", scheduler._vtime)
+
+    def queue(cost):
+        try:
+            with scheduler.slot("bob", cost):
+                pass
+        except GeminiError:
+            pass
+
+    # bob queues two requests; the first one gives up
+    scheduler.max_wait = 0.2
+    threading.Thread(target=queue, args=(1000,), daemon=True).start()
+    time.sleep(0.05)
+    scheduler.max_wait = 30
+    second = threading.Thread(target=queue, args=(10,), daemon=True)
+    second.start()
+    time.sleep(0.3)
+    with scheduler._cond:
+        tickets = list(scheduler._queues["bob"])
+        assert len(tickets) == 1
+        assert tickets[0].start == pytest.approx(max(first, scheduler._vtime))
+        assert scheduler._finish["bob"] == pytest.approx(tickets[0].start + 10)
+    release.set()
+    second.join(2)
+    assert not second.is_alive()